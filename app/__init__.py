@@ -33,4 +33,10 @@ def create_app():
     message_scheduler.start()
     print('✅ Scheduler de mensagens iniciado', file=sys.stderr)
 
+    # Recuperar tarefas da fila interrompidas pelo último restart
+    from .queue_manager import queue_manager
+    recovered = queue_manager.recover_from_journal()
+    if recovered:
+        print(f'✅ {recovered} tarefas da fila recuperadas', file=sys.stderr)
+
     return app
\ No newline at end of file
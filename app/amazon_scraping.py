@@ -3,7 +3,7 @@
 import os
 from dotenv import load_dotenv
 import requests
-from bs4 import BeautifulSoup
+from .html_parser import parse_html, parse_search_results
 import time
 import re
 import random
@@ -333,7 +333,7 @@ def scrape_produto_amazon_especifico(url, afiliado_link=None):
         print(f"Fazendo scraping do produto Amazon: {url}")
         response = requests.get(url, headers=headers, proxies=proxies, timeout=20)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = parse_html(response.content, 'amazon')
         produto = {'link': url}
         produto['nome'] = soup.select_one('#productTitle').get_text().strip()
         img_tag = soup.select_one('#landingImage')
@@ -446,7 +446,7 @@ def scrape_amazon(produto, max_pages=2, categoria=""):
             if response.status_code != 200:
                 print(f"Status code: {response.status_code}, parando a busca na Amazon.")
                 break
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = parse_search_results(response.content, 'amazon')
             produtos_encontrados = soup.select('[data-component-type="s-search-result"]')
             if not produtos_encontrados:
                 print("Nenhum produto encontrado nesta página da Amazon.")
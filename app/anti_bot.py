@@ -2,7 +2,8 @@ import time
 import random
 import requests
 import os
-from typing import Dict, Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
+from urllib.parse import urlparse
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import logging
@@ -12,35 +13,83 @@ from .config import ScrapingConfig
 
 logger = logging.getLogger(__name__)
 
+class TokenBucket:
+    """Balde de tokens de um domínio: capacidade `burst`, reposição contínua de `rate` tokens/s"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """Consome um token e retorna quanto tempo esperar até ele estar disponível"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        # O saldo pode ficar negativo: cada chamador reserva o próximo token futuro
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
 class RateLimiter:
-    """Limitador de taxa para evitar sobrecarga em requisições em massa"""
-    def __init__(self, max_requests_per_minute: int = 30):
+    """Limitador de taxa por domínio (token bucket) para evitar sobrecarga em requisições em massa
+
+    O lock protege apenas a contabilidade dos baldes; a espera acontece
+    fora dele, então um domínio limitado não atrasa requisições para os
+    outros domínios.
+    """
+    def __init__(self, max_requests_per_minute: int = 30, burst: int = 5,
+                 domain_limits: Optional[Dict[str, Dict[str, int]]] = None):
         self.max_requests = max_requests_per_minute
-        self.requests_by_domain = defaultdict(list)
+        self.burst = burst
+        self.domain_limits = domain_limits or {}
+        self.buckets: Dict[str, TokenBucket] = {}
         self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: {'requests': 0, 'throttled': 0, 'wait_time': 0.0})
+
+    def _limits_for(self, domain: str) -> Tuple[int, int]:
+        """Retorna (requisições/minuto, burst) do domínio, casando pelo sufixo (www.amazon.com.br -> amazon.com.br)"""
+        for suffix, limits in self.domain_limits.items():
+            if domain == suffix or domain.endswith('.' + suffix):
+                return (limits.get('requests_per_minute', self.max_requests),
+                        limits.get('burst', self.burst))
+        return self.max_requests, self.burst
+
+    def reserve(self, domain: str) -> float:
+        """Reserva uma requisição para o domínio e retorna o tempo de espera necessário"""
+        with self.lock:
+            bucket = self.buckets.get(domain)
+            if bucket is None:
+                per_minute, burst = self._limits_for(domain)
+                bucket = TokenBucket(per_minute / 60.0, burst)
+                self.buckets[domain] = bucket
+            wait_time = bucket.reserve(time.monotonic())
+
+            domain_stats = self.stats[domain]
+            domain_stats['requests'] += 1
+            if wait_time > 0:
+                domain_stats['throttled'] += 1
+                domain_stats['wait_time'] += wait_time
+        return wait_time
 
     def wait_if_needed(self, domain: str):
         """Aguarda se necessário para respeitar o rate limit"""
+        wait_time = self.reserve(domain)
+        if wait_time > 0:
+            logger.warning(f"Rate limit atingido para {domain}. Aguardando {wait_time:.1f}s")
+            time.sleep(wait_time)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de limitação por domínio"""
         with self.lock:
-            now = time.time()
-            # Remover requisições antigas (mais de 60 segundos)
-            self.requests_by_domain[domain] = [
-                req_time for req_time in self.requests_by_domain[domain]
-                if now - req_time < 60
-            ]
-
-            # Verificar se atingiu o limite
-            if len(self.requests_by_domain[domain]) >= self.max_requests:
-                oldest_request = self.requests_by_domain[domain][0]
-                wait_time = 60 - (now - oldest_request)
-                if wait_time > 0:
-                    logger.warning(f"Rate limit atingido para {domain}. Aguardando {wait_time:.1f}s")
-                    time.sleep(wait_time)
-                    # Limpar lista após esperar
-                    self.requests_by_domain[domain] = []
-
-            # Registrar esta requisição
-            self.requests_by_domain[domain].append(time.time())
+            return {
+                domain: {
+                    **stats,
+                    'wait_time': round(stats['wait_time'], 2),
+                    'tokens': round(self.buckets[domain].tokens, 2) if domain in self.buckets else None
+                }
+                for domain, stats in self.stats.items()
+            }
 
 class ProxyManager:
     def __init__(self):
@@ -87,26 +136,165 @@ class ProxyManager:
         except ValueError:
             pass
 
-class AntiBotManager:
-    def __init__(self):
-        self.proxy_manager = ProxyManager()
-        self.scraperapi_key = os.getenv("SCRAPERAPI_KEY")
-        self.rate_limiter = RateLimiter(max_requests_per_minute=30)
+class PooledTransport:
+    """Transporte HTTP de longa duração com pools keep-alive por (proxy, host)
 
-    def _create_fresh_session(self):
-        """Cria uma nova sessão HTTP para evitar problemas de estado entre requisições"""
-        session = requests.Session()
-        retry_strategy = Retry(
+    Cada combinação de proxy e host ganha um HTTPAdapter próprio, cujo pool de
+    conexões é reaproveitado entre requisições. As sessões continuam sendo
+    criadas por requisição (sem cookies compartilhados), mas as conexões
+    TCP/TLS abertas sobrevivem entre elas.
+
+    O adapter é escolhido pelo host da URL inicial, mas os redirects (ex:
+    mercadolivre.com.br -> produto.mercadolivre.com.br) passam pelo mesmo
+    adapter; pool_connections guarda alguns hosts por adapter para que um
+    redirect não derrube o pool do host de origem.
+    """
+
+    def __init__(self, pool_maxsize: int = 5, pool_block: bool = False, pool_connections: int = 4):
+        self.pool_maxsize = pool_maxsize
+        self.pool_connections = pool_connections
+        self.pool_block = pool_block
+        self.adapters: Dict[Tuple[Optional[str], str], HTTPAdapter] = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'pool_hits': 0,
+            'pool_misses': 0
+        }
+
+    def _build_retry(self) -> Retry:
+        """Cria a estratégia de retry a partir de ScrapingConfig.RETRY_CONFIG"""
+        return Retry(
             total=ScrapingConfig.RETRY_CONFIG['max_retries'],
             backoff_factor=ScrapingConfig.RETRY_CONFIG['backoff_factor'],
             status_forcelist=ScrapingConfig.RETRY_CONFIG['status_forcelist'],
             allowed_methods=["HEAD", "GET", "OPTIONS"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+
+    @staticmethod
+    def _pool_key(url: str, proxy: Optional[Dict[str, str]]) -> Tuple[Optional[str], str]:
+        """Chave do pool: URL do proxy (se houver) e host de destino"""
+        parsed = urlparse(url)
+        proxy_url = None
+        if proxy:
+            proxy_url = proxy.get(parsed.scheme) or proxy.get('https') or proxy.get('http')
+        return proxy_url, parsed.netloc.lower()
+
+    def get_adapter(self, url: str, proxy: Optional[Dict[str, str]] = None) -> HTTPAdapter:
+        """Retorna o adapter (pool) da combinação proxy/host, criando se necessário"""
+        key = self._pool_key(url, proxy)
+        with self.lock:
+            adapter = self.adapters.get(key)
+            if adapter is not None:
+                self.stats['pool_hits'] += 1
+                return adapter
+
+            adapter = HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                pool_block=self.pool_block,
+                max_retries=self._build_retry()
+            )
+            self.adapters[key] = adapter
+            self.stats['pool_misses'] += 1
+            logger.debug(f"Novo pool de conexões criado para {key[1]} (proxy: {bool(key[0])})")
+            return adapter
+
+    def create_session(self, url: str, proxy: Optional[Dict[str, str]] = None) -> requests.Session:
+        """Cria uma sessão leve montada sobre o pool persistente do host
+
+        A sessão não deve ser fechada com session.close(), pois isso encerraria
+        o pool compartilhado.
+        """
+        session = requests.Session()
+        adapter = self.get_adapter(url, proxy)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
 
+    @staticmethod
+    def _iter_pools(adapter: HTTPAdapter):
+        """Itera sobre os pools urllib3 de um adapter (diretos e via proxy)"""
+        managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+        for manager in managers:
+            if manager is None:
+                continue
+            for pool_key in manager.pools.keys():
+                pool = manager.pools.get(pool_key)
+                if pool is not None:
+                    yield pool
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de uso dos pools e de reaproveitamento de conexões"""
+        with self.lock:
+            adapters = list(self.adapters.items())
+            stats = self.stats.copy()
+
+        connections_opened = 0
+        requests_sent = 0
+        hosts = []
+        for (proxy_url, host), adapter in adapters:
+            host_connections = 0
+            host_requests = 0
+            for pool in self._iter_pools(adapter):
+                host_connections += pool.num_connections
+                host_requests += pool.num_requests
+            connections_opened += host_connections
+            requests_sent += host_requests
+            hosts.append({
+                'host': host,
+                'via_proxy': bool(proxy_url),
+                'connections_opened': host_connections,
+                'requests': host_requests
+            })
+
+        connections_reused = max(0, requests_sent - connections_opened)
+        total_lookups = stats['pool_hits'] + stats['pool_misses']
+        return {
+            'pool_maxsize': self.pool_maxsize,
+            'pools': len(adapters),
+            'pool_hits': stats['pool_hits'],
+            'pool_misses': stats['pool_misses'],
+            'pool_hit_rate': round(stats['pool_hits'] / total_lookups * 100, 2) if total_lookups else 0,
+            'connections_opened': connections_opened,
+            'requests_sent': requests_sent,
+            'connections_reused': connections_reused,
+            'connection_reuse_rate': round(connections_reused / requests_sent * 100, 2) if requests_sent else 0,
+            'hosts': hosts
+        }
+
+    def close(self):
+        """Fecha todos os pools (usado no encerramento da aplicação)"""
+        with self.lock:
+            adapters = list(self.adapters.values())
+            self.adapters.clear()
+        for adapter in adapters:
+            adapter.close()
+
+# Instância global: os pools precisam sobreviver aos AntiBotManager criados por scraper
+http_transport = PooledTransport(
+    pool_maxsize=ScrapingConfig.POOL_CONFIG['pool_maxsize'],
+    pool_block=ScrapingConfig.POOL_CONFIG['pool_block'],
+    pool_connections=ScrapingConfig.POOL_CONFIG['pool_connections']
+)
+
+# Instância global: o limite por domínio vale para todos os scrapers do processo
+rate_limiter = RateLimiter(
+    max_requests_per_minute=ScrapingConfig.RATE_LIMIT_CONFIG['requests_per_minute'],
+    burst=ScrapingConfig.RATE_LIMIT_CONFIG['burst'],
+    domain_limits=ScrapingConfig.RATE_LIMIT_CONFIG['domains']
+)
+
+class AntiBotManager:
+    def __init__(self):
+        self.proxy_manager = ProxyManager()
+        self.scraperapi_key = os.getenv("SCRAPERAPI_KEY")
+        self.rate_limiter = rate_limiter
+        self.transport = http_transport
+
+    def _create_fresh_session(self, url: str, proxy: Optional[Dict[str, str]] = None):
+        """Cria uma sessão HTTP sem estado, reaproveitando o pool de conexões do host"""
+        return self.transport.create_session(url, proxy)
+
     def get_request_config(self) -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
         headers = ScrapingConfig.get_random_headers()
         proxy = self.proxy_manager.get_next_proxy()
@@ -121,8 +309,8 @@ class AntiBotManager:
         payload = {'api_key': self.scraperapi_key, 'url': url, 'render': 'true'}
         logger.info(f"Fazendo requisição para {url} via ScraperAPI...")
 
-        # Criar uma sessão fresca para cada requisição via API
-        session = self._create_fresh_session()
+        # Sessão sem estado sobre o pool keep-alive da ScraperAPI
+        session = self._create_fresh_session(api_url)
         try:
             response = session.get(api_url, params=payload, timeout=90)
             response.raise_for_status()
@@ -131,27 +319,22 @@ class AntiBotManager:
             logger.error(f"Erro ao fazer requisição via ScraperAPI: {e}")
             logger.warning("Tentando requisição direta como fallback...")
             return self.make_request(url, **kwargs)
-        finally:
-            # Fechar a sessão após o uso
-            session.close()
 
     def make_request(self, url: str, **kwargs) -> requests.Response:
         max_attempts = 3
-        session = None
 
         # Extrair domínio para rate limiting
-        from urllib.parse import urlparse
         domain = urlparse(url).netloc
 
         # Aplicar rate limiting por domínio
         self.rate_limiter.wait_if_needed(domain)
 
         for attempt in range(max_attempts):
-            # Criar uma sessão fresca para cada tentativa
-            session = self._create_fresh_session()
-
+            proxy = None
             try:
                 headers, proxy = self.get_request_config()
+                # Sessão sem estado por tentativa, mas com conexões reaproveitadas
+                session = self._create_fresh_session(url, proxy)
                 delay = random.uniform(
                     ScrapingConfig.DELAY_CONFIG['min_delay'],
                     ScrapingConfig.DELAY_CONFIG['max_delay']
@@ -169,19 +352,15 @@ class AntiBotManager:
                     if proxy:
                         self.proxy_manager.mark_proxy_failed(proxy)
                     if attempt < max_attempts - 1:
-                        session.close()
                         time.sleep(ScrapingConfig.DELAY_CONFIG['retry_delay'])
                         continue
-                # Não fechar a sessão aqui, pois o response ainda precisa dela
                 return response
             except requests.exceptions.ProxyError:
                 if proxy:
                     self.proxy_manager.mark_proxy_failed(proxy)
                 logger.warning(f"Erro de proxy na tentativa {attempt + 1}")
-                session.close()
             except requests.exceptions.RequestException as e:
                 logger.error(f"Erro na requisição: {e}")
-                session.close()
 
             if attempt < max_attempts - 1:
                 time.sleep(ScrapingConfig.DELAY_CONFIG['retry_delay'])
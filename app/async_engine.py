@@ -0,0 +1,337 @@
+# /app/async_engine.py
+"""
+Engine de scraping assíncrono (asyncio + httpx) em paralelo ao caminho com threads
+
+Um único event loop, rodando em uma thread dedicada, mantém centenas de
+requisições em andamento com poucas threads. A concorrência é limitada por
+domínio (semáforos) e por um rate limiter próprio; o parsing, que usa
+CPU, roda em um executor separado para não travar o loop.
+"""
+
+import os
+import asyncio
+import random
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from .config import ScrapingConfig
+from .anti_bot import RateLimiter
+from .cache_manager import cached_product_scraper
+from .product_identity import is_short_link
+from .scraper_factory import BaseScraper, MercadoLivreScraper, AmazonScraper
+
+logger = logging.getLogger(__name__)
+
+SCRAPERAPI_URL = 'http://api.scraperapi.com'
+
+class AsyncScrapingEngine:
+    """Event loop em background com cliente HTTP assíncrono e limites por domínio"""
+
+    def __init__(self, max_connections: int = 200, domain_max_in_flight: int = 20,
+                 domain_limits: Optional[Dict[str, int]] = None, parse_workers: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.max_connections = max_connections
+        self.domain_max_in_flight = domain_max_in_flight
+        self.domain_limits = domain_limits or {}
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.parse_executor = ThreadPoolExecutor(
+            max_workers=parse_workers or os.cpu_count() or 2,
+            thread_name_prefix='async-parse'
+        )
+        self.scraperapi_key = os.getenv("SCRAPERAPI_KEY")
+        self.lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            'requests': 0,
+            'errors': 0,
+            'blocked': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0,
+            'coalesced': 0
+        }
+
+    def start(self):
+        """Inicia o event loop em background (idempotente)"""
+        with self.lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name='async-engine')
+            self._thread.start()
+            logger.info("Engine assíncrono iniciado")
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Agenda uma corrotina no loop do engine a partir de qualquer thread"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Executa uma corrotina no engine e aguarda o resultado (bloqueia a thread chamadora)"""
+        return self.submit(coro).result(timeout)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            proxy = ScrapingConfig.get_proxy_config()
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                proxy=proxy['https'] if proxy else None,
+                follow_redirects=True,
+                timeout=ScrapingConfig.RETRY_CONFIG['timeout']
+            )
+        return self._client
+
+    def _semaphore(self, domain: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(domain)
+        if semaphore is None:
+            limit = self.domain_max_in_flight
+            for suffix, domain_limit in self.domain_limits.items():
+                if domain == suffix or domain.endswith('.' + suffix):
+                    limit = domain_limit
+                    break
+            semaphore = asyncio.Semaphore(limit)
+            self._semaphores[domain] = semaphore
+        return semaphore
+
+    async def fetch(self, url: str, params: Optional[Dict[str, str]] = None,
+                    timeout: Optional[float] = None) -> httpx.Response:
+        """GET respeitando o limite de concorrência e o rate limit do domínio"""
+        domain = urlparse(url).netloc
+        async with self._semaphore(domain):
+            wait_time = self.rate_limiter.reserve(domain)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            # Mesmo intervalo aleatório entre requisições do caminho síncrono
+            await asyncio.sleep(random.uniform(
+                ScrapingConfig.DELAY_CONFIG['min_delay'],
+                ScrapingConfig.DELAY_CONFIG['max_delay']
+            ))
+
+            with self.lock:
+                self.stats['requests'] += 1
+                self.stats['in_flight'] += 1
+                self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+            try:
+                return await self._get_client().get(
+                    url,
+                    params=params,
+                    headers=ScrapingConfig.get_random_headers(),
+                    timeout=timeout or ScrapingConfig.RETRY_CONFIG['timeout']
+                )
+            except httpx.HTTPError:
+                with self.lock:
+                    self.stats['errors'] += 1
+                raise
+            finally:
+                with self.lock:
+                    self.stats['in_flight'] -= 1
+
+    async def fetch_via_api(self, url: str) -> httpx.Response:
+        """GET pela ScraperAPI (renderização + anti-bot); sem chave, faz requisição direta"""
+        if not self.scraperapi_key:
+            return await self.fetch(url)
+        params = {'api_key': self.scraperapi_key, 'url': url, 'render': 'true'}
+        try:
+            response = await self.fetch(SCRAPERAPI_URL, params=params, timeout=90)
+            response.raise_for_status()
+            return response
+        except httpx.HTTPError as e:
+            logger.warning(f"ScraperAPI falhou para {url[:80]} ({e}); tentando requisição direta")
+            return await self.fetch(url)
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        """Executa trabalho de CPU (parsing/validação) fora do event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.parse_executor, partial(func, *args, **kwargs))
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """Executa chamada bloqueante (ex: requests legado) no executor padrão do loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def coalesce(self, key: str, factory: Callable[[], Awaitable]) -> Any:
+        """Corrotinas concorrentes com a mesma chave compartilham uma única execução"""
+        existing = self._inflight.get(key)
+        if existing is not None:
+            with self.lock:
+                self.stats['coalesced'] += 1
+            return await asyncio.shield(existing)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await factory()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita o aviso de exceção não recuperada quando ninguém mais aguardava
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def is_blocked(self, response: httpx.Response) -> bool:
+        if response.status_code in (403, 429, 503):
+            return True
+        content_lower = response.text.lower()
+        return any(indicator in content_lower for indicator in (
+            'captcha', 'access denied', 'too many requests', 'unusual traffic', 'robot check'
+        ))
+
+    def get_stats(self) -> Dict[str, Any]:
+        rate_limit = self.rate_limiter.get_stats()
+        with self.lock:
+            return {
+                'running': self._loop is not None,
+                'max_connections': self.max_connections,
+                'domains': len(self._semaphores),
+                'rate_limit': rate_limit,
+                **self.stats
+            }
+
+class AsyncScraper(BaseScraper):
+    """Scraper da plataforma sobre o engine assíncrono
+
+    A busca de páginas é assíncrona; a extração reaproveita o scraper
+    síncrono da plataforma (mesmos seletores, fast path de dados
+    estruturados e validação), executada no pool de parsing. scrape_product
+    e scrape_search mantêm a interface síncrona do BaseScraper, e as
+    versões async_* podem ser agendadas direto no loop (QueueManager).
+    """
+
+    PLATFORM_SCRAPERS = {
+        'mercadolivre': MercadoLivreScraper,
+        'amazon': AmazonScraper,
+    }
+
+    def __init__(self, platform: str, engine: Optional[AsyncScrapingEngine] = None):
+        super().__init__(platform)
+        self.engine = engine or async_engine
+        self.delegate = self.PLATFORM_SCRAPERS[platform]()
+
+    def resolve_product_url(self, url: str) -> str:
+        return self.delegate.resolve_product_url(url)
+
+    def _structured_item_id(self, url: str) -> Optional[str]:
+        return self.delegate._structured_item_id(url)
+
+    def _extract_product_data(self, soup, url: str, affiliate_link: str) -> Dict[str, Any]:
+        return self.delegate._extract_product_data(soup, url, affiliate_link)
+
+    def scrape_product(self, url: str, affiliate_link: str = "") -> Optional[Dict[str, Any]]:
+        return self.engine.run(self.async_scrape_product(url, affiliate_link))
+
+    def scrape_search(self, query: str, max_pages: int = 2) -> List[Dict[str, Any]]:
+        return self.engine.run(self.async_scrape_search(query, max_pages))
+
+    async def async_scrape_product(self, url: str, affiliate_link: str = "") -> Optional[Dict[str, Any]]:
+        """Scrape de produto com o mesmo cache (chave canônica) do caminho síncrono"""
+        # Resolver link curto pode exigir redirect via requests: fora do loop
+        key = await self.engine.run_blocking(
+            cached_product_scraper.cache_key, self, 'scrape_product', url, affiliate_link
+        )
+        # Mesmo caminho do get_or_load: entrada obsoleta é servida na hora e
+        # atualizada em background (a thread de atualização aguarda o loop)
+        cached = cached_product_scraper.cache_manager.get_or_refresh(
+            key,
+            lambda: {'url': url, 'result': self.engine.run(self._fetch_product(url, affiliate_link))},
+            cached_product_scraper.ttl,
+            should_cache=cached_product_scraper._is_cacheable
+        )
+        if cached is not None:
+            return cached_product_scraper.from_cache(cached, url, affiliate_link)
+
+        own_entries = []
+
+        async def load():
+            entry = {'url': url, 'result': await self._fetch_product(url, affiliate_link)}
+            cached_product_scraper.store(key, url, entry['result'])
+            own_entries.append(entry)
+            return entry
+
+        entry = await self.engine.coalesce(key, load)
+        result = entry['result']
+        if any(own is entry for own in own_entries):
+            return dict(result) if isinstance(result, dict) else result
+        # Chamada agregada à carga de outra: resultado com o link de afiliado desta
+        return cached_product_scraper.personalize(result, url, affiliate_link)
+
+    async def _extract(self, html: str, url: str, affiliate_link: str) -> Dict[str, Any]:
+        """Extração + validação fora do loop: no pool de processos (modo pipeline) ou no executor de parsing"""
+        if self.parse_pool is not None:
+            return await self.parse_pool.extract_product_async(self.platform, html, url, affiliate_link)
+        return await self.engine.run_cpu(self.delegate._extract_validated, html, url, affiliate_link)
+
+    async def _fetch_product(self, url: str, affiliate_link: str) -> Optional[Dict[str, Any]]:
+        try:
+            if self.platform == 'amazon':
+                response = await self.engine.fetch_via_api(url)
+                product_data = await self._extract(response.text, url, affiliate_link)
+                if self.delegate._is_incomplete(product_data):
+                    return self.delegate._create_fallback_product(url, affiliate_link)
+                return product_data
+
+            final_url, affiliate_to_use = url, affiliate_link or url
+            if is_short_link(url):
+                final_url, affiliate_to_use = await self.engine.run_blocking(
+                    self.delegate._extract_real_affiliate_link, url
+                )
+
+            response = await self.engine.fetch(final_url)
+            if self.engine.is_blocked(response):
+                with self.engine.lock:
+                    self.engine.stats['blocked'] += 1
+                response = await self.engine.fetch_via_api(final_url)
+            product_data = await self._extract(response.text, final_url, affiliate_to_use)
+            if self.delegate._is_incomplete(product_data):
+                logger.warning("Dados incompletos. Tentando via ScraperAPI...")
+                response = await self.engine.fetch_via_api(final_url)
+                product_data = await self._extract(response.text, final_url, affiliate_to_use)
+            return product_data
+        except Exception as e:
+            logger.error(f"Erro no scraping assíncrono de {url[:80]}: {e}")
+            if self.platform == 'amazon':
+                return self.delegate._create_fallback_product(url, affiliate_link)
+            return None
+
+    async def async_scrape_search(self, query: str, max_pages: int = 2) -> List[Dict[str, Any]]:
+        """Busca todas as páginas em paralelo (o limite por domínio controla a pressão)"""
+        if not isinstance(self.delegate, MercadoLivreScraper):
+            # A busca da Amazon ainda é feita pelo módulo síncrono
+            return await self.engine.run_blocking(self.delegate.scrape_search, query, max_pages)
+
+        async def fetch_page(page: int) -> List[Dict[str, Any]]:
+            try:
+                response = await self.engine.fetch(self.delegate._search_page_url(query, page))
+                return await self.engine.run_cpu(self.delegate._parse_search_page, response.text)
+            except Exception as e:
+                logger.error(f"Erro na página {page} da busca ML (async): {e}")
+                return []
+
+        pages = await asyncio.gather(*(fetch_page(page) for page in range(1, max_pages + 1)))
+        return [product for page_products in pages for product in page_products]
+
+# Instância global: um único loop/cliente HTTP por processo
+async_engine = AsyncScrapingEngine(
+    max_connections=ScrapingConfig.ASYNC_ENGINE_CONFIG['max_connections'],
+    domain_max_in_flight=ScrapingConfig.ASYNC_ENGINE_CONFIG['domain_max_in_flight'],
+    domain_limits=ScrapingConfig.ASYNC_ENGINE_CONFIG['domains'],
+    rate_limiter=RateLimiter(
+        max_requests_per_minute=ScrapingConfig.ASYNC_ENGINE_CONFIG['rate_limit']['requests_per_minute'],
+        burst=ScrapingConfig.ASYNC_ENGINE_CONFIG['rate_limit']['burst'],
+        domain_limits=ScrapingConfig.ASYNC_ENGINE_CONFIG['rate_limit']['domains']
+    )
+)
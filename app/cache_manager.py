@@ -4,12 +4,19 @@ Sistema de cache para otimizar performance do web scraping
 """
 
 import time
+import sys
 import hashlib
 import json
 import threading
-from typing import Dict, Any, Optional, Union
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Union, Callable
 from dataclasses import dataclass
 import logging
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from .config import ScrapingConfig
+from .disk_cache import DiskCache
+from .product_identity import extract_product_identity, is_short_link
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +28,7 @@ class CacheEntry:
     ttl: float
     access_count: int = 0
     last_accessed: float = 0.0
+    size: int = 0  # Tamanho real em bytes (calculado na inserção)
     
     def is_expired(self) -> bool:
         """Verifica se a entrada expirou"""
@@ -30,20 +38,77 @@ class CacheEntry:
         """Verifica se a entrada está obsoleta"""
         return time.time() - self.timestamp > max_age
 
+class InFlightLoad:
+    """Carga em andamento para uma chave, compartilhada entre chamadas concorrentes"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+def calculate_size(obj: Any) -> int:
+    """Calcula o tamanho real em memória de um objeto, incluindo objetos aninhados"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        obj_id = id(current)
+        if obj_id in seen:
+            continue
+        seen.add(obj_id)
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, '__dict__'):
+            stack.append(vars(current))
+    return total
+
 class CacheManager:
-    """Gerenciador de cache com TTL e LRU"""
+    """Gerenciador de cache com TTL e LRU
+
+    O LRU usa um OrderedDict: get/set/evict são O(1). Opcionalmente a
+    capacidade também é limitada em bytes (max_bytes), além do número de
+    entradas (max_size). Se um DiskCache for informado, ele funciona como
+    segundo nível (L2) persistente: escritas vão para os dois níveis e
+    faltas na memória são buscadas no disco.
+    
+    get_or_load combina duas proteções contra rajadas no mesmo item:
+    chamadas concorrentes para a mesma chave compartilham uma única carga
+    (single-flight), e entradas expiradas há menos de stale_ttl segundos são
+    servidas imediatamente enquanto uma atualização roda em background
+    (stale-while-revalidate).
+    """
     
-    def __init__(self, max_size: int = 1000, default_ttl: float = 3600):
+    def __init__(self, max_size: int = 1000, default_ttl: float = 3600,
+                 max_bytes: Optional[int] = None, disk_cache: Optional[DiskCache] = None,
+                 stale_ttl: float = 0, inflight_timeout: float = 120, refresh_workers: int = 2):
         self.max_size = max_size
+        self.disk_cache = disk_cache
+        self.max_bytes = max_bytes
         self.default_ttl = default_ttl
-        self.cache: Dict[str, CacheEntry] = {}
-        self.access_order: list = []  # Para implementar LRU
+        self.stale_ttl = stale_ttl
+        self.inflight_timeout = inflight_timeout
+        self.refresh_workers = refresh_workers
+        self.cache: "OrderedDict[str, CacheEntry]" = OrderedDict()  # Ordem = LRU -> MRU
+        self.total_bytes = 0
         self.lock = threading.RLock()
+        self._inflight: Dict[str, InFlightLoad] = {}
+        self._refresh_executor: Optional[ThreadPoolExecutor] = None
         self.stats = {
             'hits': 0,
             'misses': 0,
             'evictions': 0,
-            'expired_cleanups': 0
+            'expired_cleanups': 0,
+            'l2_hits': 0,
+            'loads': 0,
+            'coalesced': 0,
+            'stale_hits': 0,
+            'background_refreshes': 0,
+            'refresh_errors': 0
         }
     
     def _generate_key(self, *args, **kwargs) -> str:
@@ -55,100 +120,256 @@ class CacheManager:
         key_str = json.dumps(key_data, sort_keys=True, default=str)
         return hashlib.md5(key_str.encode()).hexdigest()
     
+    def _remove_entry(self, key: str) -> Optional[CacheEntry]:
+        """Remove entrada mantendo a contagem de bytes (deve ser chamada com lock)"""
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+        return entry
+    
+    def _is_dead(self, entry: CacheEntry) -> bool:
+        """Entrada expirada e fora da janela em que ainda pode ser servida obsoleta"""
+        return entry.is_stale(entry.ttl + self.stale_ttl)
+    
     def get(self, key: str) -> Optional[Any]:
-        """Recupera valor do cache"""
+        """Recupera valor do cache (memória e, em seguida, disco)"""
         with self.lock:
-            if key not in self.cache:
-                self.stats['misses'] += 1
-                return None
-            
-            entry = self.cache[key]
+            entry = self.cache.get(key)
+            if entry is not None:
+                if entry.is_expired():
+                    # Dentro da janela stale a entrada é mantida para get_or_load
+                    if self._is_dead(entry):
+                        self._remove_entry(key)
+                        self.stats['expired_cleanups'] += 1
+                else:
+                    # Atualizar estatísticas de acesso
+                    entry.access_count += 1
+                    entry.last_accessed = time.time()
+                    
+                    # Mover para o final (mais recente) - O(1)
+                    self.cache.move_to_end(key)
+                    
+                    self.stats['hits'] += 1
+                    return entry.data
             
-            # Verificar se expirou
-            if entry.is_expired():
-                del self.cache[key]
-                self.access_order.remove(key)
+            if self.disk_cache is None:
                 self.stats['misses'] += 1
-                self.stats['expired_cleanups'] += 1
                 return None
-            
-            # Atualizar estatísticas de acesso
-            entry.access_count += 1
-            entry.last_accessed = time.time()
-            
-            # Mover para o final da lista (mais recente)
-            self.access_order.remove(key)
-            self.access_order.append(key)
-            
+        
+        # Consulta ao disco fora do lock da memória
+        disk_entry = self.disk_cache.get(key)
+        if disk_entry is None:
+            with self.lock:
+                self.stats['misses'] += 1
+            return None
+        
+        data, timestamp, ttl = disk_entry
+        # Promover para a memória preservando a idade original da entrada
+        self._set_memory(key, data, ttl, timestamp)
+        with self.lock:
             self.stats['hits'] += 1
-            return entry.data
+            self.stats['l2_hits'] += 1
+        return data
     
     def set(self, key: str, data: Any, ttl: Optional[float] = None) -> None:
-        """Armazena valor no cache"""
+        """Armazena valor no cache (memória e disco, se habilitado)"""
+        if ttl is None:
+            ttl = self.default_ttl
+        
+        timestamp = time.time()
+        self._set_memory(key, data, ttl, timestamp)
+        
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, data, ttl, timestamp)
+    
+    def spill(self, key: str, data: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Guarda dados retirados da memória do chamador (ex: resultados de tarefas antigas).
+        Vão só para o SQLite, sem ocupar o LRU. Sem disco nada é guardado (retorna
+        False): no LRU eles tirariam o lugar das entradas quentes.
+        """
+        if self.disk_cache is None:
+            return False
+        if ttl is None:
+            ttl = self.default_ttl
+        self.disk_cache.set(key, data, ttl, time.time())
+        return True
+    
+    def _set_memory(self, key: str, data: Any, ttl: float, timestamp: float) -> None:
+        """Armazena valor apenas no nível em memória"""
+        # Calcular tamanho fora do lock (pode percorrer objetos grandes)
+        size = calculate_size(data)
+        
         with self.lock:
-            if ttl is None:
-                ttl = self.default_ttl
+            if self.max_bytes and size > self.max_bytes:
+                logger.warning(f"Item de {size} bytes excede o limite do cache ({self.max_bytes} bytes); ignorado")
+                self._remove_entry(key)
+                return
+            
+            # Substituição: remover a versão antiga antes de contabilizar a nova
+            self._remove_entry(key)
             
-            # Verificar se precisa remover itens para fazer espaço
-            if len(self.cache) >= self.max_size and key not in self.cache:
+            # Remover itens menos usados até caber (por quantidade e por bytes)
+            while self.cache and (
+                len(self.cache) >= self.max_size or
+                (self.max_bytes and self.total_bytes + size > self.max_bytes)
+            ):
                 self._evict_lru()
             
             # Criar entrada
             entry = CacheEntry(
                 data=data,
-                timestamp=time.time(),
-                ttl=ttl
+                timestamp=timestamp,
+                ttl=ttl,
+                size=size
             )
             
             self.cache[key] = entry
-            
-            # Atualizar ordem de acesso
-            if key in self.access_order:
-                self.access_order.remove(key)
-            self.access_order.append(key)
+            self.total_bytes += size
     
     def _evict_lru(self):
         """Remove o item menos recentemente usado"""
-        if not self.access_order:
+        if not self.cache:
             return
         
-        # Remove o primeiro item da lista (menos recente)
-        lru_key = self.access_order.pop(0)
-        if lru_key in self.cache:
-            del self.cache[lru_key]
-            self.stats['evictions'] += 1
+        # O primeiro item do OrderedDict é o menos recente
+        _, entry = self.cache.popitem(last=False)
+        self.total_bytes -= entry.size
+        self.stats['evictions'] += 1
     
     def delete(self, key: str) -> bool:
         """Remove item do cache"""
         with self.lock:
-            if key in self.cache:
-                del self.cache[key]
-                if key in self.access_order:
-                    self.access_order.remove(key)
-                return True
-            return False
+            removed = self._remove_entry(key) is not None
+        if self.disk_cache is not None:
+            removed = self.disk_cache.delete(key) or removed
+        return removed
     
     def clear(self):
         """Limpa todo o cache"""
         with self.lock:
             self.cache.clear()
-            self.access_order.clear()
+            self.total_bytes = 0
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
     
     def cleanup_expired(self) -> int:
         """Remove itens expirados do cache"""
         with self.lock:
-            expired_keys = []
-            for key, entry in self.cache.items():
-                if entry.is_expired():
-                    expired_keys.append(key)
+            expired_keys = [key for key, entry in self.cache.items() if self._is_dead(entry)]
             
             for key in expired_keys:
-                del self.cache[key]
-                if key in self.access_order:
-                    self.access_order.remove(key)
+                self._remove_entry(key)
             
             self.stats['expired_cleanups'] += len(expired_keys)
-            return len(expired_keys)
+        
+        if self.disk_cache is not None:
+            self.disk_cache.cleanup_expired()
+        return len(expired_keys)
+    
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None,
+                    should_cache: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Retorna o valor em cache ou o carrega com loader(), uma única vez por chave
+        
+        Se a entrada expirou há menos de stale_ttl segundos, o valor antigo é
+        retornado na hora e loader() roda em background para atualizá-lo.
+        should_cache decide se o resultado carregado vai para o cache
+        (padrão: qualquer valor diferente de None).
+        """
+        data = self.get_or_refresh(key, loader, ttl, should_cache)
+        if data is not None:
+            return data
+        
+        return self._load_single_flight(key, loader, ttl, should_cache)
+    
+    def get_or_refresh(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None,
+                       should_cache: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """Parte de get_or_load que não carrega na hora: valor válido, ou obsoleto
+        com loader() agendado em background, ou None (falta a carga, que fica
+        com o chamador — ex: engine assíncrono, que carrega no event loop)"""
+        data = self.get(key)
+        if data is not None:
+            return data
+        
+        if self.stale_ttl:
+            stale = self._get_stale(key)
+            if stale is not None:
+                self._schedule_refresh(key, loader, ttl, should_cache)
+                return stale
+        return None
+    
+    def _get_stale(self, key: str) -> Optional[Any]:
+        """Retorna o valor de uma entrada expirada ainda dentro da janela stale"""
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None or not entry.is_expired() or self._is_dead(entry):
+                return None
+            entry.access_count += 1
+            entry.last_accessed = time.time()
+            self.cache.move_to_end(key)
+            self.stats['stale_hits'] += 1
+            return entry.data
+    
+    def _load_single_flight(self, key: str, loader: Callable[[], Any], ttl: Optional[float],
+                            should_cache: Optional[Callable[[Any], bool]]) -> Any:
+        """Executa loader() garantindo uma única carga simultânea por chave"""
+        with self.lock:
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = InFlightLoad()
+                self._inflight[key] = flight
+                self.stats['loads'] += 1
+            else:
+                self.stats['coalesced'] += 1
+        
+        if not is_leader:
+            if flight.event.wait(self.inflight_timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            # Carga original travada: seguir sem esperar por ela
+            logger.warning(f"Carga em andamento para {key[:80]} excedeu {self.inflight_timeout}s; carregando novamente")
+            return loader()
+        
+        try:
+            result = loader()
+            flight.result = result
+            cacheable = should_cache(result) if should_cache else result is not None
+            if cacheable:
+                self.set(key, result, ttl)
+            return result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.event.set()
+    
+    def _schedule_refresh(self, key: str, loader: Callable[[], Any], ttl: Optional[float],
+                          should_cache: Optional[Callable[[Any], bool]]) -> None:
+        """Agenda atualização em background (ignorada se já houver carga em andamento)"""
+        with self.lock:
+            if key in self._inflight:
+                return
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(
+                    max_workers=self.refresh_workers,
+                    thread_name_prefix='cache-refresh'
+                )
+            self.stats['background_refreshes'] += 1
+        
+        def refresh():
+            try:
+                self._load_single_flight(key, loader, ttl, should_cache)
+            except Exception as e:
+                with self.lock:
+                    self.stats['refresh_errors'] += 1
+                logger.warning(f"Falha na atualização em background de {key[:80]}: {e}")
+        
+        self._refresh_executor.submit(refresh)
     
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas do cache"""
@@ -159,27 +380,38 @@ class CacheManager:
             return {
                 'size': len(self.cache),
                 'max_size': self.max_size,
+                'max_bytes': self.max_bytes,
                 'hit_rate': round(hit_rate, 2),
                 'hits': self.stats['hits'],
                 'misses': self.stats['misses'],
                 'evictions': self.stats['evictions'],
-                'expired_cleanups': self.stats['expired_cleanups']
+                'expired_cleanups': self.stats['expired_cleanups'],
+                'l2_hits': self.stats['l2_hits'],
+                'stale_ttl': self.stale_ttl,
+                'loads': self.stats['loads'],
+                'coalesced': self.stats['coalesced'],
+                'stale_hits': self.stats['stale_hits'],
+                'background_refreshes': self.stats['background_refreshes'],
+                'refresh_errors': self.stats['refresh_errors'],
+                'inflight': len(self._inflight),
+                'disk': self.disk_cache.get_stats() if self.disk_cache is not None else None
             }
     
     def get_memory_usage(self) -> Dict[str, Any]:
         """Retorna informações sobre uso de memória"""
         with self.lock:
-            total_size = 0
-            for entry in self.cache.values():
-                try:
-                    size = len(json.dumps(entry.data, default=str))
-                    total_size += size
-                except:
-                    total_size += 1000  # Estimativa para dados não serializáveis
+            # Tamanhos já contabilizados na inserção - O(1)
+            total_size = self.total_bytes
             
+            size_mb = round(total_size / 1024 / 1024, 2)
             return {
+                'size_bytes': total_size,
+                'size_mb': size_mb,
+                # Nomes antigos, mantidos para os consumidores de /cache/stats
                 'estimated_size_bytes': total_size,
-                'estimated_size_mb': round(total_size / 1024 / 1024, 2),
+                'estimated_size_mb': size_mb,
+                'max_bytes': self.max_bytes,
+                'usage_pct': round(total_size / self.max_bytes * 100, 2) if self.max_bytes else None,
                 'entry_count': len(self.cache)
             }
 
@@ -212,9 +444,157 @@ class CachedScraper:
         
         return wrapper
 
+class ProductCachedScraper(CachedScraper):
+    """Decorator de cache para scrape_product indexado pela identidade canônica do produto
+
+    Links diferentes para o mesmo produto (afiliado /sec/, redirect /social/,
+    parâmetros de rastreamento, /p/MLB...) compartilham a mesma entrada. Links
+    curtos são resolvidos pelo método resolve_product_url do scraper, e o
+    resultado dessa resolução também fica em cache.
+    """
+    
+    def __init__(self, cache_manager: CacheManager, ttl: float = 3600, alias_ttl: float = 7 * 24 * 3600):
+        super().__init__(cache_manager, ttl)
+        self.alias_ttl = alias_ttl
+        self.lock = threading.Lock()
+        self.stats = {
+            'resolved': 0,
+            'unresolved': 0,
+            'hits': 0,
+            'cross_link_hits': 0
+        }
+    
+    def _increment(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+    
+    def resolve_identity(self, scraper, url: str) -> Optional[str]:
+        """Resolve a URL para 'plataforma:id', seguindo links curtos se necessário"""
+        identity = extract_product_identity(url)
+        if identity or not is_short_link(url):
+            return identity
+        
+        resolver = getattr(scraper, 'resolve_product_url', None)
+        if resolver is None:
+            return None
+        
+        try:
+            # Vários links curtos iguais chegando juntos disparam um único redirect
+            return self.cache_manager.get_or_load(
+                f"identity_alias:{url}",
+                lambda: extract_product_identity(resolver(url)),
+                self.alias_ttl
+            )
+        except Exception as e:
+            logger.warning(f"Não foi possível resolver identidade de {url[:80]}: {e}")
+            return None
+    
+    @staticmethod
+    def _is_cacheable(loaded: Dict[str, Any]) -> bool:
+        """Resultados vazios ou de fallback (página bloqueada) não ficam em cache"""
+        result = loaded['result']
+        if result is None:
+            return False
+        return not (isinstance(result, dict) and result.get('_fallback'))
+    
+    @staticmethod
+    def personalize(result: Any, url: str, affiliate_link: str) -> Any:
+        """Devolve uma cópia do resultado com o link de afiliado desta chamada"""
+        if not isinstance(result, dict):
+            return result
+        
+        from .validators import product_validator
+        result = dict(result)
+        afiliado = url if is_short_link(url) else (affiliate_link or url)
+        if product_validator.validator.validate_url(afiliado):
+            result['afiliado_link'] = product_validator.sanitizer.sanitize_url(afiliado)
+        return result
+    
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(scraper, url: str, affiliate_link: str = "", *args, **kwargs):
+            key = self.cache_key(scraper, func.__name__, url, affiliate_link, *args, **kwargs)
+            
+            # Entradas carregadas por esta chamada. A comparação é por identidade:
+            # load também pode rodar na atualização em background (stale) e, nesse
+            # caso, o valor devolvido aqui é outro e precisa ser personalizado
+            own_entries = []
+            
+            def load():
+                logger.debug(f"Cache miss para {func.__name__} ({key})")
+                entry = {'url': url, 'result': func(scraper, url, affiliate_link, *args, **kwargs)}
+                own_entries.append(entry)
+                return entry
+            
+            # Chamadas simultâneas para o mesmo produto compartilham um único scrape
+            cached = self.cache_manager.get_or_load(key, load, self.ttl, should_cache=self._is_cacheable)
+            if any(entry is cached for entry in own_entries):
+                # Cópia para que o chamador não altere a entrada em cache
+                result = cached['result']
+                return dict(result) if isinstance(result, dict) else result
+            
+            logger.debug(f"Cache hit para {func.__name__} ({key})")
+            return self.from_cache(cached, url, affiliate_link)
+        
+        return wrapper
+    
+    def cache_key(self, scraper, name: str, url: str, affiliate_link: str = "", *args, **kwargs) -> str:
+        """Chave do produto: identidade canônica quando resolvida, senão hash dos argumentos"""
+        identity = self.resolve_identity(scraper, url)
+        if identity:
+            self._increment('resolved')
+            return f"{name}:{identity}"
+        self._increment('unresolved')
+        return self.cache_manager._generate_key(name, url, affiliate_link, *args, **kwargs)
+    
+    def from_cache(self, cached: Dict[str, Any], url: str, affiliate_link: str) -> Any:
+        """Converte uma entrada do cache no resultado desta chamada (com o link de afiliado dela)"""
+        self._increment('hits')
+        if cached.get('url') != url:
+            # Mesmo produto alcançado por um link diferente
+            self._increment('cross_link_hits')
+        result = cached['result']
+        if result is None:
+            return None
+        return self.personalize(result, url, affiliate_link)
+    
+    def store(self, key: str, url: str, result: Any) -> None:
+        """Grava um resultado obtido fora do decorator (ex: engine assíncrono)"""
+        loaded = {'url': url, 'result': result}
+        if self._is_cacheable(loaded):
+            self.cache_manager.set(key, loaded, self.ttl)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de resolução de identidade e de acertos entre links"""
+        with self.lock:
+            stats = self.stats.copy()
+        lookups = stats['resolved'] + stats['unresolved']
+        return {
+            **stats,
+            'resolution_rate': round(stats['resolved'] / lookups * 100, 2) if lookups else 0,
+            'cross_link_hit_rate': round(stats['cross_link_hits'] / lookups * 100, 2) if lookups else 0
+        }
+
 # Instâncias globais
-cache_manager = CacheManager(max_size=1000, default_ttl=3600)
+def _create_disk_cache() -> Optional[DiskCache]:
+    """Cria o cache em disco (L2) se habilitado na configuração"""
+    if not ScrapingConfig.CACHE_CONFIG['disk_enabled']:
+        return None
+    try:
+        return DiskCache(ScrapingConfig.CACHE_CONFIG['disk_path'])
+    except Exception as e:
+        logger.error(f"Não foi possível iniciar o cache em disco, usando apenas memória: {e}")
+        return None
+
+cache_manager = CacheManager(
+    max_size=ScrapingConfig.CACHE_CONFIG['max_size'],
+    default_ttl=ScrapingConfig.CACHE_CONFIG['ttl'],
+    max_bytes=ScrapingConfig.CACHE_CONFIG['max_bytes'],
+    disk_cache=_create_disk_cache(),
+    stale_ttl=ScrapingConfig.CACHE_CONFIG['stale_ttl']
+)
 cached_scraper = CachedScraper(cache_manager)
+cached_product_scraper = ProductCachedScraper(cache_manager)
 
 # Função para limpeza automática de cache
 def start_cache_cleanup(interval: int = 300):
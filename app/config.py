@@ -61,11 +61,160 @@ class ScrapingConfig:
         'timeout': 30
     }
     
+    # Configurações da fila de processamento
+    QUEUE_CONFIG = {
+        'max_workers': int(os.getenv("QUEUE_MAX_WORKERS", "5")),
+        # Journal em SQLite: tarefas pendentes sobrevivem a restarts/redeploys
+        'journal_enabled': os.getenv("QUEUE_JOURNAL_ENABLED", "false").lower() == "true",
+        'journal_path': os.getenv("QUEUE_JOURNAL_PATH", "data/queue.sqlite3"),
+        'journal_flush_interval': float(os.getenv("QUEUE_JOURNAL_FLUSH_INTERVAL", "0.5")),
+        # Teto (s) do backoff exponencial das retentativas e do backoff por domínio
+        'retry_max_delay': 300,
+        'domain_backoff_max_delay': 600,
+        # Máximo de tarefas simultâneas por plataforma (ausente = limitado só por max_workers)
+        'domain_max_in_flight': {
+            'amazon': int(os.getenv("QUEUE_AMAZON_MAX_IN_FLIGHT", "2")),
+            'shopee': int(os.getenv("QUEUE_SHOPEE_MAX_IN_FLIGHT", "2"))
+        },
+        # 'threaded' (um worker por tarefa) ou 'async' (tarefas como corrotinas no engine asyncio)
+        'engine': os.getenv("QUEUE_ENGINE", "threaded").lower(),
+        # Tarefas simultâneas no modo async (substitui max_workers)
+        'async_max_in_flight': int(os.getenv("QUEUE_ASYNC_MAX_IN_FLIGHT", "200")),
+        # Máximo de URLs aceitas por chamada de /queue/batch
+        'batch_max_size': int(os.getenv("QUEUE_BATCH_MAX_SIZE", "5000")),
+        # Eventos recentes mantidos para os streams SSE (retomada via Last-Event-ID)
+        'event_history_size': int(os.getenv("QUEUE_EVENT_HISTORY_SIZE", "1000")),
+        # Retenção das tarefas finalizadas em memória (aplicada por um reaper em background)
+        'retention_max_finished': int(os.getenv("QUEUE_RETENTION_MAX_FINISHED", "5000")),
+        'retention_max_age': int(os.getenv("QUEUE_RETENTION_MAX_AGE", "86400")),
+        'reaper_interval': 60,
+        # Tarefas removidas da memória continuam consultáveis pelo cache em disco (exige CACHE_DISK_ENABLED)
+        'spill_results': os.getenv("QUEUE_SPILL_RESULTS", "false").lower() == "true",
+        'spill_ttl': int(os.getenv("QUEUE_SPILL_TTL", str(7 * 24 * 3600)))
+    }
+
+    # Engine assíncrono (httpx + asyncio): conexões totais e requisições simultâneas por domínio
+    ASYNC_ENGINE_CONFIG = {
+        'max_connections': int(os.getenv("ASYNC_MAX_CONNECTIONS", "200")),
+        'domain_max_in_flight': int(os.getenv("ASYNC_DOMAIN_MAX_IN_FLIGHT", "20")),
+        # Limite específico por domínio (sufixo), ex: {'amazon.com.br': 5}
+        'domains': {},
+        # Rate limit próprio do engine (o RATE_LIMIT_CONFIG do caminho com threads
+        # seguraria o engine em 30 req/min por domínio)
+        'rate_limit': {
+            'requests_per_minute': int(os.getenv("ASYNC_RATE_LIMIT_PER_MINUTE", "600")),
+            'burst': int(os.getenv("ASYNC_RATE_LIMIT_BURST", "20")),
+            # Mesmo formato de RATE_LIMIT_CONFIG['domains']
+            'domains': {}
+        }
+    }
+
+    # Limite de requisições por domínio (token bucket): taxa contínua + rajada
+    RATE_LIMIT_CONFIG = {
+        'requests_per_minute': int(os.getenv("RATE_LIMIT_PER_MINUTE", "30")),
+        'burst': int(os.getenv("RATE_LIMIT_BURST", "5")),
+        # Limites específicos por sufixo de domínio, ex: {'amazon.com.br': {'requests_per_minute': 15, 'burst': 3}}
+        'domains': {}
+    }
+
+    # Configurações dos pools de conexão HTTP (keep-alive)
+    # O tamanho do pool acompanha o número de workers da fila para que
+    # cada worker tenha sempre uma conexão reaproveitável por host
+    POOL_CONFIG = {
+        'pool_maxsize': QUEUE_CONFIG['max_workers'],
+        'pool_block': False,
+        # Hosts mantidos por adapter (o host de origem e os destinos de redirect)
+        'pool_connections': int(os.getenv("POOL_CONNECTIONS_PER_ADAPTER", "4"))
+    }
+
+    # Configurações da busca multi-plataforma (platform="todas")
+    SEARCH_CONFIG = {
+        'platform_timeout': float(os.getenv("SEARCH_PLATFORM_TIMEOUT", "60"))
+    }
+
+    # Backend de parsing HTML (lxml é bem mais rápido; sem ele usa html.parser)
+    PARSER_CONFIG = {
+        'default': os.getenv("HTML_PARSER", "lxml"),
+        # Backend específico por plataforma, ex: {'shopee': 'html.parser'}
+        'platforms': {},
+        # Páginas de busca: montar DOM só da lista de resultados
+        'partial_search_parse': os.getenv("PARTIAL_SEARCH_PARSE", "true").lower() == "true"
+    }
+
+    # Modo pipeline da fila: workers só buscam o HTML; extração e validação rodam
+    # em um pool de processos (fora do GIL), um processo por CPU se workers=0
+    PARSE_POOL_CONFIG = {
+        'enabled': os.getenv("QUEUE_PIPELINE_MODE", "false").lower() == "true",
+        'workers': int(os.getenv("PARSE_POOL_WORKERS", "0")),
+        # Vazio = forkserver (spawn onde não existe, ex: Windows); fork herdaria threads/locks do processo principal
+        'start_method': os.getenv("PARSE_POOL_START_METHOD", ""),
+        'timeout': 60
+    }
+
+    # Seletores adaptativos: estatísticas de acerto persistidas entre restarts
+    SELECTOR_CONFIG = {
+        'stats_path': os.getenv("SELECTOR_STATS_PATH", "data/selector_stats.json"),
+        # Seletor com menos de 10% de acerto após 20 tentativas vai para o fim da lista
+        'min_attempts': 20,
+        'min_hit_rate': 0.1
+    }
+
+    # Gravação write-behind das promoções no Supabase (insert em massa em background)
+    WRITE_BUFFER_CONFIG = {
+        'enabled': os.getenv("PROMOCOES_WRITE_BUFFER", "true").lower() == "true",
+        'batch_size': int(os.getenv("PROMOCOES_BATCH_SIZE", "50")),
+        'flush_interval': float(os.getenv("PROMOCOES_FLUSH_INTERVAL", "1.0")),
+        # Limite de linhas em memória; cheio, salvar_promocao grava direto
+        'max_pending': int(os.getenv("PROMOCOES_MAX_PENDING", "5000")),
+        # Arquivo local com as linhas ainda não gravadas (reenviadas após uma queda)
+        'spill_path': os.getenv("PROMOCOES_SPILL_PATH", "data/promocoes_buffer.jsonl"),
+        # Coluna (única) com o uuid de cada linha do buffer: retentativas viram upsert sem duplicar
+        'idempotency_column': os.getenv("PROMOCOES_IDEMPOTENCY_COLUMN", "client_id")
+    }
+
+    # Imagens inline (data:...;base64) enviadas ao Storage na gravação das promoções
+    INLINE_IMAGE_CONFIG = {
+        'enabled': os.getenv("INLINE_IMAGE_OFFLOAD", "true").lower() == "true",
+        'bucket': os.getenv("SUPABASE_BUCKET_NAME", "imagens_melhoradas_tech"),
+        # Hashes de imagens já enviadas lembrados em memória (evita reenvio)
+        'dedup_cache_size': int(os.getenv("INLINE_IMAGE_DEDUP_CACHE_SIZE", "1000"))
+    }
+
+    # Espelho em memória da tabela promocoes (agendadas + consultadas recentemente)
+    PROMOCOES_MIRROR_CONFIG = {
+        'enabled': os.getenv("PROMOCOES_MIRROR_ENABLED", "true").lower() == "true",
+        # Limite de linhas não agendadas mantidas (LRU); as agendadas ficam todas
+        'max_rows': int(os.getenv("PROMOCOES_MIRROR_MAX_ROWS", "2000")),
+        # Intervalo (s) do delta por sync_column e da recarga completa das agendadas
+        'sync_interval': float(os.getenv("PROMOCOES_MIRROR_SYNC_INTERVAL", "15")),
+        'full_sync_interval': float(os.getenv("PROMOCOES_MIRROR_FULL_SYNC_INTERVAL", "300")),
+        # Sem a coluna updated_at na tabela, o delta passa a usar created_at
+        'sync_column': os.getenv("PROMOCOES_MIRROR_SYNC_COLUMN", "updated_at"),
+        # Validade (s) das linhas não agendadas (exclusões externas não aparecem no delta)
+        'row_ttl': float(os.getenv("PROMOCOES_MIRROR_ROW_TTL", "60"))
+    }
+
+    # Cache das respostas de /produtos (ETag/If-None-Match); invalidado a cada escrita local
+    PRODUTOS_CACHE_CONFIG = {
+        'enabled': os.getenv("PRODUTOS_CACHE_ENABLED", "true").lower() == "true",
+        # Limite (s) para refletir alterações feitas fora do processo
+        'ttl': float(os.getenv("PRODUTOS_CACHE_TTL", "30")),
+        'max_size': int(os.getenv("PRODUTOS_CACHE_MAX_SIZE", "200"))
+    }
+
     # Configurações de cache
     CACHE_CONFIG = {
         'enabled': True,
         'ttl': 3600,  # 1 hora
-        'max_size': 1000
+        'max_size': 1000,
+        # Limite de memória em bytes (0 = limitado apenas por quantidade de entradas)
+        'max_bytes': int(os.getenv("CACHE_MAX_BYTES", "0")) or None,
+        # Segundo nível persistente em SQLite (sobrevive a restarts e é compartilhado entre workers)
+        'disk_enabled': os.getenv("CACHE_DISK_ENABLED", "false").lower() == "true",
+        'disk_path': os.getenv("CACHE_DISK_PATH", "data/cache.sqlite3"),
+        # Janela (s) após o TTL em que a entrada ainda é servida enquanto é atualizada em background
+        # (0 = desativado: uma entrada expirada é sempre buscada de novo)
+        'stale_ttl': int(os.getenv("CACHE_STALE_TTL", "0"))
     }
     
     # Configurações de plataformas (mantém o que você já tem)
@@ -1,9 +1,20 @@
 # /mercado_livre_scraper/app/database.py
 
 import os
+import re
+import json
+import base64
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
 import datetime
+from .config import ScrapingConfig
+from .write_buffer import WriteBehindBuffer
+from .promocoes_mirror import PromocoesMirror
 
 load_dotenv()
 
@@ -12,18 +23,26 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Versão local da tabela promocoes: incrementada a cada escrita feita por
+# este processo (usada para invalidar caches de listagem)
+_promocoes_version = itertools.count(1)
+promocoes_version = 0
+
+def _marcar_promocoes_alteradas():
+    global promocoes_version
+    promocoes_version = next(_promocoes_version)
+
 def salvar_promocao(produto_dados, final_message=None, agendamento_data=None):
     """Salva os dados de uma promoção no Supabase."""
     try:
         if agendamento_data and isinstance(agendamento_data, datetime.datetime):
             agendamento_data = agendamento_data.isoformat()
 
-        # Debug: verificar se tem imagem
-        imagem = produto_dados.get("imagem")
+        # Imagens inline (data:...;base64) vão para o Storage: só a URL é gravada
+        titulo = produto_dados.get("titulo") or "imagem"
+        imagem = hospedar_imagem_inline(produto_dados.get("imagem"), titulo)
+        processed_image_url = hospedar_imagem_inline(produto_dados.get("processed_image_url"), titulo)
         print(f"DEBUG: Salvando promoção - Tem imagem? {bool(imagem)}")
-        if imagem:
-            print(f"DEBUG: Tipo de imagem: {'base64' if imagem.startswith('data:') else 'URL'}")
-            print(f"DEBUG: Tamanho da imagem: {len(imagem)} caracteres")
 
         data_to_insert = {
             "titulo": produto_dados.get("titulo"),
@@ -40,11 +59,20 @@ def salvar_promocao(produto_dados, final_message=None, agendamento_data=None):
             "final_message": final_message,
             "agendamento": agendamento_data,
             "cupons": produto_dados.get("cupons", []),
-            "processed_image_url": produto_dados.get("processed_image_url"),
+            "processed_image_url": processed_image_url,
             "fonte": produto_dados.get("fonte") # Adicionado para a visão unificada
         }
 
-        supabase.table("promocoes").insert(data_to_insert).execute()
+        # Write-behind: confirma na hora e grava em lote em background
+        # (sem buffer, ou com ele cheio, grava direto)
+        if promocoes_buffer is not None and promocoes_buffer.enqueue(data_to_insert):
+            print("DEBUG: Promoção enfileirada para gravação em lote no Supabase")
+            return True
+
+        response = supabase.table("promocoes").insert(data_to_insert).execute()
+        _marcar_promocoes_alteradas()
+        if promocoes_mirror is not None:
+            promocoes_mirror.put(response.data or [])
         print("DEBUG: Dados salvos no Supabase com sucesso!")
         return True
 
@@ -54,33 +82,122 @@ def salvar_promocao(produto_dados, final_message=None, agendamento_data=None):
         print(traceback.format_exc())
         return False
 
-def listar_produtos_db(status_filter, ordem_order, limit=200):
+# Colunas usadas pelas listagens (cards do painel e do WhatsApp Monitor).
+# Ficam de fora descricao, final_message, cupons etc.: o detalhe completo
+# vem de obter_produto_db quando o produto é aberto.
+LISTA_COLUMNS = (
+    "id,titulo,preco_atual,preco_original,desconto,condicao,vendedor,"
+    "imagem_url,processed_image_url,link_produto,fonte,"
+    "agendamento,created_at"
+)
+
+# A tabela não tem coluna plataforma: o filtro usa fonte, gravada com o nome
+# de exibição pelos scrapers ("Mercado Livre", "Amazon") e "whatsapp" pelos clones
+FONTES_POR_PLATAFORMA = {
+    'mercadolivre': ('Mercado Livre', 'mercadolivre'),
+    'amazon': ('Amazon', 'amazon'),
+    'whatsapp': ('whatsapp',),
+}
+
+def _encode_cursor(produto, sort_column):
+    """Cursor opaco com a posição do último produto da página (coluna de ordenação + id)"""
+    payload = json.dumps({'v': produto.get(sort_column), 'id': produto.get('id')}, default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+# Id aceito no cursor: vai para um filtro do PostgREST, então nada de aspas, vírgulas ou parênteses
+_CURSOR_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def _decode_cursor(cursor):
+    """Valida e decodifica o cursor (vem do cliente e é usado no filtro or_ da consulta)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        value, last_id = payload['v'], payload['id']
+        # Ordenação é sempre por timestamp (agendamento ou created_at)
+        datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except Exception:
+        raise ValueError("Cursor de paginação inválido")
+    if not isinstance(last_id, (int, str)) or isinstance(last_id, bool) or not _CURSOR_ID_PATTERN.match(str(last_id)):
+        raise ValueError("Cursor de paginação inválido")
+    return value, last_id
+
+def listar_produtos_pagina_db(status_filter, ordem_order, limit=50, cursor=None, columns=LISTA_COLUMNS, plataforma=None):
+    """
+    Lista uma página de produtos com paginação por cursor (keyset).
+
+    A ordenação é pela coluna do filtro (agendamento ou created_at) com id
+    como desempate; o cursor guarda esses dois valores do último item, e a
+    próxima página continua estritamente depois dele (sem OFFSET, o custo
+    não cresce com a página). Retorna (produtos, next_cursor), com
+    next_cursor None na última página. O filtro de plataforma (sobre a
+    coluna fonte) também é aplicado na consulta, para as páginas virem
+    completas.
+    """
+    fontes = FONTES_POR_PLATAFORMA.get(plataforma, (plataforma,)) if plataforma else None
+
+    if status_filter == 'agendado':
+        sort_column = "agendamento"
+        desc = ordem_order == 'desc'
+    elif status_filter == 'nao-agendado':
+        # Ordenar por created_at descendente (mais recentes primeiro)
+        sort_column = "created_at"
+        desc = True
+    else:  # 'todos'
+        sort_column = "created_at"
+        desc = ordem_order == 'desc'
+
+    # Agendadas: o espelho tem o conjunto completo, sem ir ao Supabase
+    if status_filter == 'agendado' and promocoes_mirror is not None and promocoes_mirror.ready:
+        after = _decode_cursor(cursor) if cursor else None
+        produtos = promocoes_mirror.list_scheduled(desc=desc, after=after, limit=limit + 1, fontes=fontes)
+        if columns != "*":
+            campos = columns.split(",")
+            produtos = [{campo: produto.get(campo) for campo in campos} for produto in produtos]
+        return _pagina(produtos, limit, sort_column)
+
+    query = supabase.table("promocoes").select(columns)
+
+    if status_filter == 'agendado':
+        query = query.not_.is_("agendamento", "null")
+    elif status_filter == 'nao-agendado':
+        query = query.is_("agendamento", "null")
+
+    if fontes:
+        query = query.in_("fonte", list(fontes))
+
+    if cursor:
+        value, last_id = _decode_cursor(cursor)
+        op = "lt" if desc else "gt"
+        # Valores entre aspas: timestamps têm ':' e '.', reservados na sintaxe do PostgREST
+        query = query.or_(
+            f'{sort_column}.{op}."{value}",'
+            f'and({sort_column}.eq."{value}",id.{op}."{last_id}")'
+        )
+
+    query = query.order(sort_column, desc=desc).order("id", desc=desc)
+    # Um item a mais indica se existe próxima página
+    response = query.limit(limit + 1).execute()
+    return _pagina(response.data or [], limit, sort_column)
+
+def _pagina(produtos, limit, sort_column):
+    """Corta o item extra buscado e gera o cursor da próxima página"""
+    next_cursor = None
+    if len(produtos) > limit:
+        produtos = produtos[:limit]
+        next_cursor = _encode_cursor(produtos[-1], sort_column)
+    return produtos, next_cursor
+
+def listar_produtos_db(status_filter, ordem_order, limit=200, columns=LISTA_COLUMNS):
     """
-    Lista produtos do Supabase com base nos filtros.
+    Lista produtos do Supabase com base nos filtros (primeira página).
 
     OTIMIZAÇÕES:
-    - Limit padrão de 200 produtos para performance
+    - Só as colunas da listagem (columns="*" para linhas completas)
     - Ordenação otimizada por índice
-    - Query mais eficiente
+    - Para paginar, usar listar_produtos_pagina_db
     """
     try:
-        query = supabase.table("promocoes").select("*")
-
-        if status_filter == 'agendado':
-            query = query.not_.is_("agendamento", "null")
-            query = query.order("agendamento", desc=(ordem_order == 'desc'))
-        elif status_filter == 'nao-agendado':
-            query = query.is_("agendamento", "null")
-            # Ordenar por created_at descendente (mais recentes primeiro)
-            query = query.order("created_at", desc=True)
-        else:  # 'todos'
-            query = query.order("created_at", desc=(ordem_order == 'desc'))
-
-        # Limitar quantidade de resultados para performance
-        query = query.limit(limit)
-
-        response = query.execute()
-        return response.data
+        produtos, _ = listar_produtos_pagina_db(status_filter, ordem_order, limit=limit, columns=columns)
+        return produtos
     except Exception as e:
         print(f"Erro ao listar produtos: {e}")
         import traceback
@@ -89,18 +206,40 @@ def listar_produtos_db(status_filter, ordem_order, limit=200):
 
 def deletar_produto_db(produto_id):
     """Deleta um produto do Supabase pelo ID."""
-    return supabase.table("promocoes").delete().eq("id", produto_id).execute()
+    response = supabase.table("promocoes").delete().eq("id", produto_id).execute()
+    _marcar_promocoes_alteradas()
+    if promocoes_mirror is not None:
+        promocoes_mirror.remove(produto_id)
+    return response
 
 def agendar_produto_db(produto_id, agendamento_iso):
     """Atualiza o agendamento de um produto no Supabase."""
-    return supabase.table("promocoes").update({'agendamento': agendamento_iso}).eq("id", produto_id).execute()
+    response = supabase.table("promocoes").update({'agendamento': agendamento_iso}).eq("id", produto_id).execute()
+    _marcar_promocoes_alteradas()
+    if promocoes_mirror is not None:
+        promocoes_mirror.apply_update(produto_id, {'agendamento': agendamento_iso}, response.data)
+    return response
 
-def obter_produto_db(produto_id):
-    """Busca um produto específico no Supabase pelo ID."""
+def obter_produto_db(produto_id, usar_espelho=True):
+    """
+    Busca um produto específico no Supabase pelo ID (linha completa, para o detalhe).
+
+    usar_espelho=False força a leitura no Supabase (antes de enviar uma
+    mensagem) e atualiza o espelho com o resultado.
+    """
+    if usar_espelho and promocoes_mirror is not None:
+        produto = promocoes_mirror.get(produto_id)
+        if produto is not None:
+            return produto
     try:
         response = supabase.table("promocoes").select("*").eq("id", produto_id).execute()
         if response.data and len(response.data) > 0:
+            if promocoes_mirror is not None:
+                promocoes_mirror.put(response.data)
             return response.data[0]
+        if promocoes_mirror is not None:
+            # Excluído fora deste processo
+            promocoes_mirror.remove(produto_id)
         return None
     except Exception as e:
         print(f"Erro ao buscar produto no Supabase: {e}")
@@ -108,12 +247,22 @@ def obter_produto_db(produto_id):
 
 def atualizar_produto_db(produto_id, dados_atualizacao):
     """Atualiza dados específicos de um produto no Supabase."""
-    return supabase.table("promocoes").update(dados_atualizacao).eq("id", produto_id).execute()
-
-def upload_imagem_whatsapp(base64_string, titulo_produto, bucket_name='imagens_melhoradas_tech'):
+    for campo in ('imagem_url', 'processed_image_url'):
+        if campo in dados_atualizacao:
+            dados_atualizacao = {**dados_atualizacao, campo: hospedar_imagem_inline(dados_atualizacao[campo], str(produto_id))}
+    response = supabase.table("promocoes").update(dados_atualizacao).eq("id", produto_id).execute()
+    _marcar_promocoes_alteradas()
+    if promocoes_mirror is not None:
+        promocoes_mirror.apply_update(produto_id, dados_atualizacao, response.data)
+    return response
+
+def upload_imagem_whatsapp(base64_string, titulo_produto, bucket_name='imagens_melhoradas_tech', nome_arquivo=None):
     """
     Converte imagem base64 do WhatsApp e faz upload para Supabase Storage.
     Retorna a URL pública da imagem.
+
+    Com nome_arquivo (sem extensão), o arquivo recebe esse nome e o upload
+    sobrescreve um existente (usado para nomes derivados do conteúdo).
     """
     try:
         import base64
@@ -140,15 +289,20 @@ def upload_imagem_whatsapp(base64_string, titulo_produto, bucket_name='imagens_m
         # Decodificar base64 para bytes
         image_bytes = base64.b64decode(base64_data)
 
-        # Gerar nome simplificado do arquivo baseado no título
-        # Remover caracteres especiais, deixar apenas letras, números e hífens
-        nome_simplificado = re.sub(r'[^a-zA-Z0-9\s-]', '', titulo_produto)
-        nome_simplificado = re.sub(r'\s+', '-', nome_simplificado.strip())
-        nome_simplificado = nome_simplificado.lower()[:50]  # Limitar a 50 caracteres
+        file_options = {"content-type": f"image/{extensao}"}
+        if nome_arquivo:
+            file_name = f"whatsapp/{nome_arquivo}.{extensao}"
+            file_options["upsert"] = "true"
+        else:
+            # Gerar nome simplificado do arquivo baseado no título
+            # Remover caracteres especiais, deixar apenas letras, números e hífens
+            nome_simplificado = re.sub(r'[^a-zA-Z0-9\s-]', '', titulo_produto)
+            nome_simplificado = re.sub(r'\s+', '-', nome_simplificado.strip())
+            nome_simplificado = nome_simplificado.lower()[:50]  # Limitar a 50 caracteres
 
-        # Adicionar timestamp para evitar conflitos
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        file_name = f"whatsapp/{nome_simplificado}_{timestamp}.{extensao}"
+            # Adicionar timestamp para evitar conflitos
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            file_name = f"whatsapp/{nome_simplificado}_{timestamp}.{extensao}"
 
         print(f"📤 Fazendo upload de imagem do WhatsApp: {file_name}")
         print(f"   Tamanho: {len(image_bytes)} bytes")
@@ -157,7 +311,7 @@ def upload_imagem_whatsapp(base64_string, titulo_produto, bucket_name='imagens_m
         upload_response = supabase.storage.from_(bucket_name).upload(
             file=image_bytes,
             path=file_name,
-            file_options={"content-type": f"image/{extensao}"}
+            file_options=file_options
         )
 
         print(f"✅ Upload realizado: {file_name}")
@@ -182,6 +336,94 @@ def upload_imagem_whatsapp(base64_string, titulo_produto, bucket_name='imagens_m
         print(traceback.format_exc())
         return None
 
+# Hash do conteúdo -> URL pública das imagens inline já enviadas ao Storage
+_imagens_hospedadas = OrderedDict()
+_imagens_hospedadas_lock = threading.Lock()
+
+def hospedar_imagem_inline(imagem, titulo_produto, bucket_name=None):
+    """
+    Envia ao Storage uma imagem inline (data:...;base64) e retorna a URL pública.
+
+    O arquivo é nomeado pelo hash do conteúdo, com upsert: a mesma imagem
+    vira sempre o mesmo objeto, mesmo enviada por outro processo, e aqui
+    só é enviada uma vez. URLs comuns (e valores vazios) voltam
+    inalterados; se o upload falhar, volta a string original para não
+    perder a imagem (migrar_imagens_inline_db tenta de novo depois).
+    """
+    if not imagem or not isinstance(imagem, str) or not imagem.startswith('data:'):
+        return imagem
+    config = ScrapingConfig.INLINE_IMAGE_CONFIG
+    if not config['enabled']:
+        return imagem
+
+    conteudo_hash = hashlib.sha256(imagem.split(',', 1)[-1].encode('ascii', 'ignore')).hexdigest()
+    with _imagens_hospedadas_lock:
+        url = _imagens_hospedadas.get(conteudo_hash)
+        if url is not None:
+            _imagens_hospedadas.move_to_end(conteudo_hash)
+            return url
+
+    url = upload_imagem_whatsapp(imagem, titulo_produto, bucket_name=bucket_name or config['bucket'],
+                                 nome_arquivo=conteudo_hash)
+    if not url:
+        print(f"⚠️ Falha ao enviar imagem inline ({len(imagem)} caracteres) ao Storage; mantendo base64")
+        return imagem
+
+    with _imagens_hospedadas_lock:
+        _imagens_hospedadas[conteudo_hash] = url
+        if len(_imagens_hospedadas) > config['dedup_cache_size']:
+            _imagens_hospedadas.popitem(last=False)
+    return url
+
+def migrar_imagens_inline_db(batch_size=20, max_rows=200, after_id=None):
+    """
+    Backfill: move para o Storage as imagens base64 já gravadas em promocoes.
+
+    Percorre as linhas com imagem_url/processed_image_url começando por
+    'data:' em ordem de id (after_id retoma de onde a execução anterior
+    parou). A busca só traz os ids; cada linha é lida inteira apenas no
+    momento de migrar, para não carregar lotes de imagens de uma vez.
+    Linhas cujo upload falhar são contadas em 'falhas' e puladas.
+    """
+    resultado = {'verificados': 0, 'migrados': 0, 'falhas': 0, 'proximo_id': after_id, 'concluido': False}
+    while resultado['verificados'] < max_rows:
+        query = supabase.table("promocoes").select("id").or_(
+            'imagem_url.like."data:*",processed_image_url.like."data:*"'
+        )
+        if resultado['proximo_id'] is not None:
+            query = query.gt("id", resultado['proximo_id'])
+        ids = [row['id'] for row in query.order("id").limit(min(batch_size, max_rows - resultado['verificados'])).execute().data or []]
+        if not ids:
+            resultado['concluido'] = True
+            break
+
+        for produto_id in ids:
+            resultado['verificados'] += 1
+            resultado['proximo_id'] = produto_id
+            response = supabase.table("promocoes").select("id,titulo,imagem_url,processed_image_url").eq("id", produto_id).execute()
+            if not response.data:
+                continue
+            produto = response.data[0]
+            titulo = produto.get('titulo') or "imagem"
+
+            atualizacao = {}
+            falhou = False
+            for campo in ('imagem_url', 'processed_image_url'):
+                valor = produto.get(campo)
+                novo = hospedar_imagem_inline(valor, titulo)
+                if novo != valor:
+                    atualizacao[campo] = novo
+                elif isinstance(valor, str) and valor.startswith('data:'):
+                    falhou = True
+            if falhou:
+                resultado['falhas'] += 1
+            if atualizacao:
+                atualizar_produto_db(produto_id, atualizacao)
+                resultado['migrados'] += 1
+
+    print(f"Migração de imagens inline: {resultado}")
+    return resultado
+
 # As demais funções do database.py (listar_imagens_bucket, etc.) permanecem as mesmas.
 def listar_imagens_bucket(bucket_name="imagens", pasta="", limit=50, offset=0, search_term=""):
     try:
@@ -230,4 +472,89 @@ def listar_pastas_bucket(bucket_name="imagens", pasta_pai=""):
         print(f"Erro ao listar pastas do bucket: {e}")
         return []
 
+# Erros do PostgREST/Postgres para coluna inexistente ou sem índice único no ON CONFLICT
+_ERROS_DE_ESQUEMA = ('PGRST204', '42703', '42P10')
+
+# Classes de erro do Postgres para dado recusado: 22 (dado inválido) e 23 (restrição violada)
+_CLASSES_DE_RECUSA = ('22', '23')
+
+def _linha_recusada(erro):
+    """O servidor recusou os dados (retentar não adianta), ao contrário de falhas de rede/indisponibilidade"""
+    return isinstance(erro, APIError) and str(erro.code or '').startswith(_CLASSES_DE_RECUSA)
 
+# Coluna de idempotência em uso (None depois de descobrir que a tabela não a tem)
+_coluna_idempotencia = ScrapingConfig.WRITE_BUFFER_CONFIG['idempotency_column'] or None
+
+def _inserir_promocoes_em_lote(rows):
+    """
+    Insert em massa na tabela promocoes (usado pelo buffer write-behind).
+
+    Cada linha leva o uuid do buffer na coluna de idempotência e o insert é
+    um upsert que ignora conflitos: se um lote já gravado for retentado
+    (timeout depois do commit), as linhas não são duplicadas. Sem a coluna
+    na tabela (ver ADICIONAR_COLUNA_CLIENT_ID.md), volta ao insert simples.
+    """
+    global _coluna_idempotencia
+    response = None
+    if _coluna_idempotencia:
+        try:
+            response = supabase.table("promocoes").upsert(
+                rows, on_conflict=_coluna_idempotencia, ignore_duplicates=True
+            ).execute()
+        except APIError as e:
+            if e.code not in _ERROS_DE_ESQUEMA:
+                raise
+            print(f"⚠️ Coluna de idempotência '{_coluna_idempotencia}' indisponível em promocoes ({e.message}); "
+                  f"lotes retentados podem duplicar linhas. Ver ADICIONAR_COLUNA_CLIENT_ID.md")
+            _coluna_idempotencia = None
+    if response is None:
+        campo = ScrapingConfig.WRITE_BUFFER_CONFIG['idempotency_column']
+        rows = [{k: v for k, v in row.items() if k != campo} for row in rows]
+        response = supabase.table("promocoes").insert(rows).execute()
+    _marcar_promocoes_alteradas()
+    if promocoes_mirror is not None:
+        promocoes_mirror.put(response.data or [])
+
+def _create_promocoes_buffer():
+    """Cria o buffer write-behind das promoções se habilitado na configuração"""
+    config = ScrapingConfig.WRITE_BUFFER_CONFIG
+    if not config['enabled']:
+        return None
+    try:
+        return WriteBehindBuffer(
+            'promocoes',
+            _inserir_promocoes_em_lote,
+            batch_size=config['batch_size'],
+            flush_interval=config['flush_interval'],
+            max_pending=config['max_pending'],
+            spill_path=config['spill_path'],
+            id_field=config['idempotency_column'] or None,
+            is_rejection=_linha_recusada
+        )
+    except Exception as e:
+        print(f"Erro ao iniciar buffer de gravação das promoções, gravando direto: {e}")
+        return None
+
+def _create_promocoes_mirror():
+    """Cria e inicia o espelho local das promoções se habilitado na configuração"""
+    config = ScrapingConfig.PROMOCOES_MIRROR_CONFIG
+    if not config['enabled']:
+        return None
+    mirror = PromocoesMirror(
+        lambda: supabase.table("promocoes"),
+        max_rows=config['max_rows'],
+        sync_interval=config['sync_interval'],
+        full_sync_interval=config['full_sync_interval'],
+        sync_column=config['sync_column'],
+        row_ttl=config['row_ttl'],
+        # Alterações externas vistas na sincronização também invalidam as listagens
+        on_change=_marcar_promocoes_alteradas
+    )
+    mirror.start()
+    return mirror
+
+# Instância global do espelho da tabela promocoes
+promocoes_mirror = _create_promocoes_mirror()
+
+# Instância global do buffer de gravação das promoções
+promocoes_buffer = _create_promocoes_buffer()
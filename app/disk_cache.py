@@ -0,0 +1,179 @@
+# /app/disk_cache.py
+"""
+Cache persistente em disco (SQLite WAL) usado como segundo nível do CacheManager
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class DiskCache:
+    """Cache L2 em SQLite com TTL e serialização compacta (JSON + zlib)
+
+    O arquivo usa journal WAL, então vários workers do gunicorn no mesmo host
+    podem ler e escrever no mesmo cache sem bloquear uns aos outros.
+    """
+
+    def __init__(self, path: str, compress_min_bytes: int = 512):
+        self.path = path
+        self.compress_min_bytes = compress_min_bytes
+        self._local = threading.local()
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'errors': 0
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Retorna a conexão da thread atual (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._get_connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value BLOB NOT NULL,'
+            ' compressed INTEGER NOT NULL DEFAULT 0,'
+            ' created_at REAL NOT NULL,'
+            ' expires_at REAL NOT NULL'
+            ')'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache (expires_at)')
+
+    def _increment(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _serialize(self, data: Any) -> Tuple[bytes, int]:
+        raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        if len(raw) >= self.compress_min_bytes:
+            return zlib.compress(raw), 1
+        return raw, 0
+
+    @staticmethod
+    def _deserialize(value: bytes, compressed: int) -> Any:
+        if compressed:
+            value = zlib.decompress(value)
+        return json.loads(value.decode('utf-8'))
+
+    def get(self, key: str) -> Optional[Tuple[Any, float, float]]:
+        """Retorna (data, timestamp, ttl) ou None se ausente/expirado"""
+        try:
+            row = self._get_connection().execute(
+                'SELECT value, compressed, created_at, expires_at FROM cache WHERE key = ?',
+                (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao ler cache em disco: {e}")
+            self._increment('errors')
+            return None
+
+        now = time.time()
+        if row is None or row[3] <= now:
+            self._increment('misses')
+            return None
+
+        try:
+            data = self._deserialize(row[0], row[1])
+        except (ValueError, zlib.error) as e:
+            logger.warning(f"Entrada corrompida no cache em disco ({key}): {e}")
+            self.delete(key)
+            self._increment('errors')
+            return None
+
+        self._increment('hits')
+        return data, row[2], row[3] - row[2]
+
+    def set(self, key: str, data: Any, ttl: float, timestamp: Optional[float] = None) -> bool:
+        """Armazena valor no disco. Retorna False se o valor não for serializável"""
+        try:
+            value, compressed = self._serialize(data)
+        except (TypeError, ValueError):
+            logger.debug(f"Valor não serializável em JSON, mantido apenas em memória: {key}")
+            return False
+
+        created_at = timestamp or time.time()
+        try:
+            self._get_connection().execute(
+                'INSERT OR REPLACE INTO cache (key, value, compressed, created_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, sqlite3.Binary(value), compressed, created_at, created_at + ttl)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao gravar cache em disco: {e}")
+            self._increment('errors')
+            return False
+
+        self._increment('writes')
+        return True
+
+    def delete(self, key: str) -> bool:
+        try:
+            cursor = self._get_connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao remover do cache em disco: {e}")
+            return False
+
+    def clear(self):
+        try:
+            self._get_connection().execute('DELETE FROM cache')
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao limpar cache em disco: {e}")
+
+    def cleanup_expired(self) -> int:
+        """Remove entradas expiradas do disco"""
+        try:
+            cursor = self._get_connection().execute(
+                'DELETE FROM cache WHERE expires_at <= ?', (time.time(),)
+            )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Erro na limpeza do cache em disco: {e}")
+            return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do cache em disco"""
+        try:
+            entries = self._get_connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+
+        try:
+            file_size = os.path.getsize(self.path)
+        except OSError:
+            file_size = 0
+
+        with self.lock:
+            stats = self.stats.copy()
+
+        total = stats['hits'] + stats['misses']
+        return {
+            'path': self.path,
+            'entries': entries,
+            'file_size_mb': round(file_size / 1024 / 1024, 2),
+            'hit_rate': round(stats['hits'] / total * 100, 2) if total else 0,
+            **stats
+        }
@@ -0,0 +1,113 @@
+# /app/event_bus.py
+"""
+Barramento de eventos em memória para a fila (alimenta os streams SSE)
+"""
+
+import time
+import uuid
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from .config import ScrapingConfig
+
+logger = logging.getLogger(__name__)
+
+class EventBus:
+    """Publica eventos com número de sequência em um histórico circular
+
+    publish() é O(1): o evento entra em um deque de tamanho fixo e os
+    assinantes bloqueados em wait_for_events() são acordados. Cada assinante
+    (ex: uma conexão SSE) guarda só o número do último evento recebido, o
+    que também permite retomar com o cabeçalho Last-Event-ID. Quem ficar
+    para trás além do histórico recebe lagged=True e deve recarregar o
+    estado completo.
+
+    A sequência recomeça a cada execução do processo: os ids expostos aos
+    clientes (event_id) levam um epoch da execução, e parse_event_id()
+    recusa ids de outra execução, que não podem ser comparados com os daqui.
+    """
+
+    def __init__(self, history_size: int = 1000):
+        self.history: deque = deque(maxlen=history_size)
+        self.condition = threading.Condition()
+        self.last_seq = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self.active_subscribers = 0
+        self.stats = {
+            'published': 0,
+            'subscriptions': 0
+        }
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> int:
+        """Publica um evento e retorna seu número de sequência"""
+        with self.condition:
+            self.last_seq += 1
+            self.history.append({'seq': self.last_seq, 'type': event_type, 'time': time.time(), 'data': data})
+            self.stats['published'] += 1
+            self.condition.notify_all()
+            return self.last_seq
+
+    def event_id(self, seq: int) -> str:
+        """Id exposto ao cliente (ex: campo id: do SSE) para o número de sequência"""
+        return f"{self.epoch}-{seq}"
+
+    def parse_event_id(self, event_id: str) -> Optional[int]:
+        """Número de sequência de um id desta execução; None se for de outra execução ou inválido"""
+        epoch, _, seq = (event_id or '').rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def wait_for_events(self, after_seq: int, timeout: float = 15.0) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Retorna (eventos com seq > after_seq, lagged), aguardando até `timeout`
+        segundos se ainda não houver nenhum. lagged indica que eventos se
+        perderam por terem saído do histórico ou que after_seq é de outra
+        execução (à frente de last_seq, ex: Last-Event-ID após um reinício);
+        nesse caso vem o histórico inteiro.
+        """
+        with self.condition:
+            if after_seq > self.last_seq:
+                return list(self.history), True
+            if self.last_seq <= after_seq:
+                self.condition.wait(timeout)
+            if self.last_seq <= after_seq:
+                return [], False
+
+            oldest = self.history[0]['seq']
+            lagged = after_seq + 1 < oldest
+            # Eventos novos ficam no fim do histórico: percorrer só a parte nova
+            events = []
+            for event in reversed(self.history):
+                if event['seq'] <= after_seq:
+                    break
+                events.append(event)
+            events.reverse()
+            return events, lagged
+
+    @contextmanager
+    def subscription(self):
+        """Contabiliza um assinante ativo enquanto o stream estiver aberto"""
+        with self.condition:
+            self.active_subscribers += 1
+            self.stats['subscriptions'] += 1
+        try:
+            yield self
+        finally:
+            with self.condition:
+                self.active_subscribers -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                'epoch': self.epoch,
+                'last_seq': self.last_seq,
+                'history_size': len(self.history),
+                'active_subscribers': self.active_subscribers,
+                **self.stats
+            }
+
+# Instância global do barramento de eventos da fila
+event_bus = EventBus(history_size=ScrapingConfig.QUEUE_CONFIG['event_history_size'])
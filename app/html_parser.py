@@ -0,0 +1,119 @@
+# /app/html_parser.py
+"""
+Backends de parsing HTML para os scrapers
+
+O backend rápido (lxml, em C) é usado sempre que estiver instalado; sem ele,
+ou se falhar em um documento, cai para o html.parser puro-Python. Todos os
+backends produzem a mesma árvore BeautifulSoup, então os seletores e a
+extração dos scrapers não mudam.
+"""
+
+import time
+import logging
+from typing import Optional, Tuple, Union
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+from bs4.dammit import EncodingDetector
+from .config import ScrapingConfig
+from .monitoring import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_BACKEND = 'html.parser'
+
+# Parse parcial das páginas de busca: (tag, atributos) dos itens de resultado,
+# marcador do primeiro item e, opcionalmente, de um elemento que vem depois da lista
+SEARCH_RESULT_FILTERS = {
+    'mercadolivre': {
+        'strainer': ('li', {'class': 'ui-search-layout__item'}),
+        'start_marker': 'ui-search-layout__item',
+        'end_marker': 'ui-search-pagination'
+    },
+    'amazon': {
+        'strainer': ('div', {'data-component-type': 's-search-result'}),
+        'start_marker': 'data-component-type="s-search-result"',
+        'end_marker': None
+    }
+}
+
+def backend_available(backend: str) -> bool:
+    """Verifica se o tree builder está instalado (ex: lxml é dependência opcional)"""
+    return builder_registry.lookup(backend) is not None
+
+def get_backend(platform: str) -> str:
+    """Retorna o backend configurado para a plataforma, ou o fallback se não estiver disponível"""
+    backend = ScrapingConfig.PARSER_CONFIG['platforms'].get(platform, ScrapingConfig.PARSER_CONFIG['default'])
+    if backend_available(backend):
+        return backend
+    return FALLBACK_BACKEND
+
+def parse_html(markup: Union[str, bytes], platform: str, **kwargs) -> BeautifulSoup:
+    """Faz o parse do HTML com o backend da plataforma e registra o tempo gasto"""
+    backend = get_backend(platform)
+    start = time.perf_counter()
+    try:
+        soup = BeautifulSoup(markup, backend, **kwargs)
+    except Exception as e:
+        if backend == FALLBACK_BACKEND:
+            raise
+        logger.warning(f"Parser {backend} falhou para {platform}, usando {FALLBACK_BACKEND}: {e}")
+        backend = FALLBACK_BACKEND
+        soup = BeautifulSoup(markup, backend, **kwargs)
+
+    label = f"{backend} (parcial)" if 'parse_only' in kwargs else backend
+    metrics_collector.record_parse_metric(platform, label, time.perf_counter() - start, len(markup or ''))
+    return soup
+
+def _slice_markup(markup: Union[str, bytes], start_marker: str,
+                  end_marker: Optional[str]) -> Tuple[Union[str, bytes], Optional[str]]:
+    """
+    Recorta o HTML do início do primeiro resultado até o fim da lista de resultados.
+    Retorna (trecho, encoding declarado no documento original), ou o HTML inteiro se
+    algum marcador não for encontrado.
+    """
+    is_bytes = isinstance(markup, bytes)
+    start_marker = start_marker.encode() if is_bytes else start_marker
+    open_tag = b'<' if is_bytes else '<'
+
+    first = markup.find(start_marker)
+    if first == -1:
+        return markup, None
+    start = markup.rfind(open_tag, 0, first)
+    if start == -1:
+        return markup, None
+
+    end = len(markup)
+    if end_marker:
+        end_marker = end_marker.encode() if is_bytes else end_marker
+        after = markup.find(end_marker, markup.rfind(start_marker))
+        if after != -1:
+            end = markup.rfind(open_tag, 0, after)
+
+    # O <meta charset> fica no <head>, que é descartado: guardar o encoding antes de recortar
+    declared = EncodingDetector.find_declared_encoding(markup[:start], is_html=True) if is_bytes else None
+    return markup[start:end], declared
+
+def parse_search_results(markup: Union[str, bytes], platform: str) -> BeautifulSoup:
+    """
+    Faz o parse apenas dos itens de resultado de uma página de busca.
+
+    O HTML é recortado entre os marcadores da lista de resultados e um
+    SoupStrainer materializa só os itens, descartando cabeçalho, rodapé,
+    scripts e anúncios. Se nada for encontrado (layout mudou), faz o parse
+    completo.
+    """
+    filters = SEARCH_RESULT_FILTERS.get(platform)
+    if not filters or not ScrapingConfig.PARSER_CONFIG['partial_search_parse']:
+        return parse_html(markup, platform)
+
+    fragment, declared_encoding = _slice_markup(markup, filters['start_marker'], filters['end_marker'])
+    kwargs = {'parse_only': SoupStrainer(*filters['strainer'])}
+    if declared_encoding:
+        kwargs['from_encoding'] = declared_encoding
+
+    soup = parse_html(fragment, platform, **kwargs)
+    if soup.find(True) is not None:
+        return soup
+
+    logger.debug(f"Parse parcial sem resultados para {platform}, fazendo parse completo")
+    return parse_html(markup, platform)
@@ -8,9 +8,13 @@ import logging
 import requests
 from typing import Optional, Dict
 import json
+from .cache_manager import cache_manager
 
 logger = logging.getLogger(__name__)
 
+# Links de afiliado gerados não mudam: mantê-los por 7 dias (memória + disco)
+AFFILIATE_LINK_TTL = 7 * 24 * 3600
+
 
 class MercadoLivreAffiliate:
     """Classe para gerenciar geração de links de afiliados do Mercado Livre"""
@@ -281,4 +285,12 @@ def gerar_link_afiliado_ml(product_url: str) -> Optional[str]:
     Returns:
         Link de afiliado ou None se falhar
     """
-    return ml_affiliate.generate_affiliate_link(product_url)
+    cache_key = f"ml_affiliate:{product_url}"
+    cached_link = cache_manager.get(cache_key)
+    if cached_link:
+        return cached_link
+
+    affiliate_link = ml_affiliate.generate_affiliate_link(product_url)
+    if affiliate_link:
+        cache_manager.set(cache_key, affiliate_link, AFFILIATE_LINK_TTL)
+    return affiliate_link
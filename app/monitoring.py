@@ -57,7 +57,11 @@ class MetricsCollector:
             'platform_stats': defaultdict(lambda: {'requests': 0, 'success': 0, 'errors': 0}),
             'hourly_stats': defaultdict(lambda: {'requests': 0, 'success': 0, 'errors': 0}),
             'response_times': deque(maxlen=100),
-            'error_types': defaultdict(int)
+            'error_types': defaultdict(int),
+            # Parsing HTML por plataforma e backend
+            'parser_stats': defaultdict(lambda: defaultdict(lambda: {'pages': 0, 'parse_time': 0.0, 'bytes': 0})),
+            # Páginas de produto servidas por dados estruturados (sem DOM) vs parse completo
+            'extraction_stats': defaultdict(lambda: {'fast_path': 0, 'full_parse': 0})
         }
     
     def record_scraping_metric(self, platform: str, operation: str, success: bool, 
@@ -97,6 +101,70 @@ class MetricsCollector:
             
             self.system_metrics.append(metric)
     
+    def record_parse_metric(self, platform: str, backend: str, parse_time: float, html_bytes: int):
+        """Registra o tempo de parsing de uma página"""
+        with self.lock:
+            parser_stats = self.stats['parser_stats'][platform][backend]
+            parser_stats['pages'] += 1
+            parser_stats['parse_time'] += parse_time
+            parser_stats['bytes'] += html_bytes
+    
+    def record_extraction_path(self, platform: str, fast_path: bool):
+        """Registra se a página foi extraída pelos dados estruturados ou pelo DOM"""
+        with self.lock:
+            self.stats['extraction_stats'][platform]['fast_path' if fast_path else 'full_parse'] += 1
+    
+    def drain_parse_stats(self) -> Dict[str, Any]:
+        """Retorna e zera as métricas de parsing/extração (processos do pool de parsing)"""
+        with self.lock:
+            drained = {
+                'parser_stats': {platform: dict(backends) for platform, backends in self.stats['parser_stats'].items()},
+                'extraction_stats': dict(self.stats['extraction_stats'])
+            }
+            self.stats['parser_stats'].clear()
+            self.stats['extraction_stats'].clear()
+            return drained
+
+    def merge_parse_stats(self, drained: Dict[str, Any]):
+        """Soma métricas de parsing/extração coletadas em outro processo"""
+        with self.lock:
+            for platform, backends in drained.get('parser_stats', {}).items():
+                for backend, stats in backends.items():
+                    parser_stats = self.stats['parser_stats'][platform][backend]
+                    for key, value in stats.items():
+                        parser_stats[key] += value
+            for platform, stats in drained.get('extraction_stats', {}).items():
+                for key, value in stats.items():
+                    self.stats['extraction_stats'][platform][key] += value
+
+    def get_extraction_stats(self) -> Dict[str, Any]:
+        """Retorna a fração de páginas servidas pelos dados estruturados, por plataforma"""
+        with self.lock:
+            result = {}
+            for platform, stats in self.stats['extraction_stats'].items():
+                total = stats['fast_path'] + stats['full_parse']
+                result[platform] = {
+                    **stats,
+                    'fast_path_rate': round(stats['fast_path'] / total * 100, 2) if total else 0
+                }
+            return result
+    
+    def get_parser_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de parsing por plataforma e backend"""
+        with self.lock:
+            return {
+                platform: {
+                    backend: {
+                        'pages': stats['pages'],
+                        'avg_parse_ms': round(stats['parse_time'] / stats['pages'] * 1000, 2) if stats['pages'] else 0,
+                        'pages_per_second': round(stats['pages'] / stats['parse_time'], 2) if stats['parse_time'] else 0,
+                        'mb_per_second': round(stats['bytes'] / 1024 / 1024 / stats['parse_time'], 2) if stats['parse_time'] else 0
+                    }
+                    for backend, stats in backends.items()
+                }
+                for platform, backends in self.stats['parser_stats'].items()
+            }
+    
     def _update_stats(self, metric: ScrapingMetrics):
         """Atualiza estatísticas agregadas"""
         self.stats['total_requests'] += 1
@@ -153,7 +221,16 @@ class MetricsCollector:
                 'top_errors': top_errors,
                 'memory_usage_mb': round(psutil.Process().memory_info().rss / 1024 / 1024, 2),
                 'cpu_usage': psutil.cpu_percent(),
-                'active_threads': threading.active_count()
+                'active_threads': threading.active_count(),
+                'parsers': {
+                    platform: {backend: stats['pages'] for backend, stats in backends.items()}
+                    for platform, backends in self.stats['parser_stats'].items()
+                },
+                'structured_data_fast_path_rate': {
+                    platform: round(stats['fast_path'] / (stats['fast_path'] + stats['full_parse']) * 100, 2)
+                    for platform, stats in self.stats['extraction_stats'].items()
+                    if stats['fast_path'] + stats['full_parse']
+                }
             }
     
     def get_platform_stats(self, platform: str) -> Dict[str, Any]:
@@ -0,0 +1,224 @@
+# /app/parse_pool.py
+"""
+Pool de processos para a etapa de extração/validação (modo pipeline da fila)
+
+O parse do BeautifulSoup e a sanitização do ProductDataValidator são CPU
+puro em Python: com vários workers em threads, disputam o GIL. No modo
+pipeline, as threads (ou corrotinas) só buscam o HTML e entregam o texto
+a um ProcessPoolExecutor, que devolve o produto já validado.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import ScrapingConfig
+from .monitoring import metrics_collector
+from .selectors import selector_ranking
+
+logger = logging.getLogger(__name__)
+
+# Scrapers criados uma única vez em cada processo do pool (ver _init_worker)
+_worker_scrapers: Dict[str, Any] = {}
+
+# Tempo gasto no pool pela tarefa da fila em andamento (thread ou corrotina atual)
+_task_pool_time: ContextVar[Optional[List[float]]] = ContextVar('parse_pool_task_time', default=None)
+
+def _init_worker():
+    """Inicializa o processo do pool: importa parser, seletores e validador uma única vez"""
+    from .scraper_factory import ScraperFactory
+    from .html_parser import parse_html
+
+    # O ranking em disco é mantido pelo processo principal: aqui as tentativas
+    # são acumuladas e devolvidas a ele com cada resultado
+    selector_ranking.path = None
+    selector_ranking.enable_deltas()
+    for platform in ScraperFactory.get_available_platforms():
+        _worker_scrapers[platform] = ScraperFactory.create_scraper(platform)
+        # Aquecer o tree builder da plataforma
+        parse_html('<html><body></body></html>', platform)
+    metrics_collector.drain_parse_stats()
+    selector_ranking.drain_deltas()
+
+def _extract_in_worker(platform: str, html: str, url: str, affiliate_link: str) -> Dict[str, Any]:
+    """Executado no processo do pool: extrai e valida o produto"""
+    started_at = time.time()
+    start = time.perf_counter()
+    scraper = _worker_scrapers[platform]
+    product = scraper._validate_and_sanitize(scraper._extract_product(html, url, affiliate_link))
+    return {
+        'product': product,
+        'started_at': started_at,
+        'extract_time': time.perf_counter() - start,
+        # Métricas de parsing registradas neste processo voltam para o principal
+        'metrics': metrics_collector.drain_parse_stats(),
+        'selectors': selector_ranking.drain_deltas()
+    }
+
+class ParsePool:
+    """ProcessPoolExecutor dedicado à extração, com tempo por etapa
+
+    Etapas registradas:
+    - queue_wait: do envio até um processo começar (fila do pool + envio do HTML)
+    - extract: parse do DOM/dados estruturados + validação no processo do pool
+    - transfer: retorno do resultado ao processo principal
+    - fetch: tempo da tarefa fora do pool (rede, redirects, cache)
+    - task: tempo total da tarefa da fila
+    """
+
+    STAGES = ('fetch', 'queue_wait', 'extract', 'transfer', 'task')
+
+    def __init__(self, max_workers: Optional[int] = None, start_method: Optional[str] = None, timeout: float = 60):
+        self.max_workers = max_workers or os.cpu_count() or 2
+        if not start_method:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+        self.stage_stats = {stage: {'count': 0, 'total_time': 0.0, 'max_time': 0.0} for stage in self.STAGES}
+        self.stats = {
+            'submitted': 0,
+            'errors': 0,
+            'pool_restarts': 0,
+            'bytes': 0
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    # O servidor carrega só os scrapers (nunca o app Flask) e os
+                    # processos do pool nascem dele já com os módulos importados
+                    context.set_forkserver_preload([f'{__package__}.scraper_factory'])
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_worker
+                )
+                logger.info(f"Pool de parsing iniciado com {self.max_workers} processos")
+            return self._executor
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Descarta um pool quebrado (processo morto); o próximo envio cria outro"""
+        with self.lock:
+            if self._executor is broken:
+                self._executor = None
+                self.stats['pool_restarts'] += 1
+        broken.shutdown(wait=False)
+
+    def record_stage(self, stage: str, elapsed: float):
+        with self.lock:
+            stats = self.stage_stats[stage]
+            stats['count'] += 1
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+
+    def _submit(self, platform: str, html: str, url: str, affiliate_link: str) -> Tuple[ProcessPoolExecutor, Future]:
+        """Envia o HTML para extração; o Future resolve para o dicionário de _extract_in_worker"""
+        executor = self._get_executor()
+        with self.lock:
+            self.stats['submitted'] += 1
+            self.stats['bytes'] += len(html or '')
+        try:
+            return executor, executor.submit(_extract_in_worker, platform, html, url, affiliate_link)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(_extract_in_worker, platform, html, url, affiliate_link)
+
+    def _failed(self, executor: ProcessPoolExecutor):
+        with self.lock:
+            self.stats['errors'] += 1
+        self._restart(executor)
+
+    def _finish(self, outcome: Dict[str, Any], submitted_at: float, elapsed: float) -> Dict[str, Any]:
+        """Registra o tempo das etapas de uma extração concluída e devolve o produto"""
+        queue_wait = max(0.0, outcome['started_at'] - submitted_at)
+        self.record_stage('queue_wait', queue_wait)
+        self.record_stage('extract', outcome['extract_time'])
+        self.record_stage('transfer', max(0.0, elapsed - queue_wait - outcome['extract_time']))
+        metrics_collector.merge_parse_stats(outcome['metrics'])
+        selector_ranking.merge_deltas(outcome.get('selectors'))
+
+        task_time = _task_pool_time.get()
+        if task_time is not None:
+            task_time[0] += elapsed
+        return outcome['product']
+
+    def extract_product(self, platform: str, html: str, url: str, affiliate_link: str) -> Dict[str, Any]:
+        """Extrai e valida o produto em um processo do pool (bloqueia a thread chamadora)"""
+        submitted_at = time.time()
+        start = time.perf_counter()
+        executor, future = self._submit(platform, html, url, affiliate_link)
+        try:
+            outcome = future.result(self.timeout)
+        except BrokenProcessPool:
+            self._failed(executor)
+            raise
+        return self._finish(outcome, submitted_at, time.perf_counter() - start)
+
+    async def extract_product_async(self, platform: str, html: str, url: str, affiliate_link: str) -> Dict[str, Any]:
+        """Versão para o engine assíncrono: aguarda o pool sem ocupar o event loop"""
+        submitted_at = time.time()
+        start = time.perf_counter()
+        executor, future = self._submit(platform, html, url, affiliate_link)
+        try:
+            outcome = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except BrokenProcessPool:
+            self._failed(executor)
+            raise
+        return self._finish(outcome, submitted_at, time.perf_counter() - start)
+
+    @contextmanager
+    def track_task(self):
+        """Mede uma tarefa da fila, separando o tempo fora do pool (fetch) do tempo no pool"""
+        pool_time = [0.0]
+        token = _task_pool_time.set(pool_time)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _task_pool_time.reset(token)
+            elapsed = time.perf_counter() - start
+            self.record_stage('task', elapsed)
+            self.record_stage('fetch', max(0.0, elapsed - pool_time[0]))
+
+    def shutdown(self):
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'running': self._executor is not None,
+                'workers': self.max_workers,
+                'start_method': self.start_method,
+                **self.stats,
+                'stages': {
+                    stage: {
+                        'count': stats['count'],
+                        'avg_ms': round(stats['total_time'] / stats['count'] * 1000, 2) if stats['count'] else 0,
+                        'max_ms': round(stats['max_time'] * 1000, 2)
+                    }
+                    for stage, stats in self.stage_stats.items()
+                }
+            }
+
+# Instância global (os processos só são criados no primeiro envio)
+parse_pool = ParsePool(
+    max_workers=ScrapingConfig.PARSE_POOL_CONFIG['workers'] or None,
+    start_method=ScrapingConfig.PARSE_POOL_CONFIG['start_method'] or None,
+    timeout=ScrapingConfig.PARSE_POOL_CONFIG['timeout']
+)
@@ -0,0 +1,126 @@
+# /app/product_identity.py
+"""
+Identidade canônica de produtos a partir de URLs (MLB id, ASIN, shop/item da Shopee)
+
+Links diferentes para o mesmo produto (afiliado, redirect social, parâmetros de
+rastreamento) resolvem para a mesma chave, usada pelo cache. No Mercado Livre a
+página de catálogo (/p/MLB...) e o anúncio (MLB-...) são produtos diferentes,
+mesmo com o mesmo número: a chave do catálogo leva o prefixo 'p:'.
+"""
+
+import re
+from typing import Optional, Tuple
+from urllib.parse import urlparse, parse_qs, unquote
+
+# Mercado Livre: item (MLB-123..., /MLB123) ou catálogo (/p/MLB123)
+ML_ID_PATTERN = re.compile(r'(MLB)-?(\d+)', re.IGNORECASE)
+ML_CATALOG_ID_PATTERN = re.compile(r'/p/(MLB)-?(\d+)', re.IGNORECASE)
+ML_PRODUCT_URL_PATTERN = re.compile(r'/p/MLB|/MLB-?\d+', re.IGNORECASE)
+
+# Amazon: ASIN em /dp/ ou /gp/product/
+AMAZON_ASIN_PATTERNS = [
+    re.compile(r'/dp/([A-Z0-9]{10})'),
+    re.compile(r'/gp/product/([A-Z0-9]{10})'),
+]
+
+# Shopee: /Nome-do-produto-i.<shop>.<item> ou /product/<shop>/<item>
+SHOPEE_ID_PATTERNS = [
+    re.compile(r'-i\.(\d+)\.(\d+)'),
+    re.compile(r'/product/(\d+)/(\d+)'),
+]
+
+# Links curtos/redirecionadores que não carregam o id do produto na URL
+SHORT_LINK_MARKERS = [
+    'mercadolivre.com/sec/',
+    'mercadolivre.com.br/sec/',
+    '/s/c/',
+    'amzn.to/',
+    's.shopee.com.br/',
+]
+
+def _search_ml_id(text: str) -> Optional[Tuple[str, bool]]:
+    match = ML_CATALOG_ID_PATTERN.search(text)
+    if match:
+        return f"{match.group(1).upper()}{match.group(2)}", True
+    match = ML_ID_PATTERN.search(text)
+    if match:
+        return f"{match.group(1).upper()}{match.group(2)}", False
+    return None
+
+def _match_ml_id(url: str) -> Optional[Tuple[str, bool]]:
+    """
+    Retorna (id MLB normalizado, é página de catálogo) de uma URL do Mercado Livre.
+    O caminho tem precedência sobre a query (que pode citar outros anúncios).
+    """
+    path = urlparse(url).path
+    found = _search_ml_id(path)
+    if found:
+        return found
+
+    # Página social: o produto vem no parâmetro ref
+    if '/social/' in path:
+        params = parse_qs(urlparse(url).query)
+        for ref in params.get('ref', []):
+            found = _match_ml_id(unquote(ref))
+            if found:
+                return found
+    return _search_ml_id(url)
+
+def extract_ml_id(url: str) -> Optional[str]:
+    """Extrai o id MLB normalizado (sem hífen, maiúsculo) de uma URL do Mercado Livre (anúncio ou catálogo)"""
+    found = _match_ml_id(url)
+    return found[0] if found else None
+
+def ml_canonical_url(url: str) -> Optional[str]:
+    """URL limpa do produto do Mercado Livre, preservando a forma de catálogo (/p/MLB...) ou de anúncio"""
+    found = _match_ml_id(url)
+    if not found:
+        return None
+    product_id, is_catalog = found
+    if is_catalog:
+        return f"https://www.mercadolivre.com.br/p/{product_id}"
+    return f"https://produto.mercadolivre.com.br/{product_id}"
+
+def extract_asin(url: str) -> Optional[str]:
+    """Extrai o ASIN de uma URL da Amazon"""
+    for pattern in AMAZON_ASIN_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    return None
+
+def extract_shopee_id(url: str) -> Optional[str]:
+    """Extrai 'shop_id.item_id' de uma URL da Shopee"""
+    for pattern in SHOPEE_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return f"{match.group(1)}.{match.group(2)}"
+    return None
+
+def extract_product_identity(url: str) -> Optional[str]:
+    """
+    Retorna a identidade canônica do produto ('plataforma:id') sem acessar a rede.
+    Retorna None se a URL não contém o id (ex: links curtos de afiliado).
+    """
+    if not url:
+        return None
+
+    url_lower = url.lower()
+    if 'mercadolivre.com' in url_lower or 'mercadolibre.com' in url_lower:
+        found = _match_ml_id(url)
+        if not found:
+            return None
+        product_id, is_catalog = found
+        return f"mercadolivre:p:{product_id}" if is_catalog else f"mercadolivre:{product_id}"
+    if 'amazon.com' in url_lower:
+        asin = extract_asin(url)
+        return f"amazon:{asin}" if asin else None
+    if 'shopee.com' in url_lower:
+        shopee_id = extract_shopee_id(url)
+        return f"shopee:{shopee_id}" if shopee_id else None
+    return None
+
+def is_short_link(url: str) -> bool:
+    """Indica se a URL é um link curto/afiliado que precisa de redirect para revelar o produto"""
+    url_lower = (url or '').lower()
+    return any(marker in url_lower for marker in SHORT_LINK_MARKERS)
@@ -0,0 +1,348 @@
+# /app/promocoes_mirror.py
+"""
+Espelho em memória da tabela promocoes
+
+Guarda as linhas agendadas (todas) e as consultadas recentemente, indexadas
+por id e por agendamento. O scheduler, a listagem de agendados e o detalhe
+de um produto passam a ler daqui; o Supabase só é consultado em faltas e
+pela sincronização periódica.
+"""
+
+import time
+import bisect
+import logging
+import threading
+import datetime
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Código do Postgres (repassado pelo PostgREST) para coluna inexistente
+UNDEFINED_COLUMN = '42703'
+
+def _parse_timestamp(value: Any) -> Optional[datetime.datetime]:
+    """Converte o timestamp ISO do Supabase para datetime com fuso (None se inválido)"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+class PromocoesMirror:
+    """Cópia local das promoções, atualizada pelas escritas e por sincronização
+
+    - rows: id -> linha completa, em ordem LRU; as agendadas não são
+      descartadas pelo limite max_rows (o scheduler precisa de todas). As
+      não agendadas valem por row_ttl segundos: exclusões feitas fora do
+      processo não aparecem no delta, então elas são relidas do Supabase.
+    - scheduled: lista ordenada de (agendamento, id), mantida com bisect.
+
+    Escritas feitas por este processo atualizam o espelho na hora (put,
+    apply_update, remove). Alterações feitas fora dele chegam pela
+    sincronização: a cada sync_interval, um delta das linhas com
+    sync_column maior que a última vista; a cada full_sync_interval, a
+    recarga completa do conjunto agendado (cobre exclusões e
+    desagendamentos externos). Enquanto a primeira recarga não termina,
+    ready é False e os chamadores devem ir ao Supabase.
+    """
+
+    def __init__(self, table: Callable[[], Any], max_rows: int = 2000, sync_interval: float = 15,
+                 full_sync_interval: float = 300, sync_column: str = 'updated_at',
+                 on_change: Optional[Callable[[], None]] = None, row_ttl: float = 60):
+        self.table = table
+        self.max_rows = max_rows
+        self.row_ttl = row_ttl
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.sync_column = sync_column
+        self.on_change = on_change
+
+        self.rows: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # Chave: id como texto (igual ao da URL)
+        self.scheduled: List[Tuple[datetime.datetime, str]] = []
+        self._scheduled_at: Dict[str, datetime.datetime] = {}
+        self._stored_at: Dict[str, float] = {}
+        self._removed_at: Dict[str, float] = {}  # Exclusões locais, até a próxima recarga completa
+        self.lock = threading.RLock()
+        self.ready = False
+        self.watermark: Optional[str] = None
+        self.last_full_sync = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expired': 0,
+            'local_writes': 0,
+            'full_syncs': 0,
+            'delta_syncs': 0,
+            'delta_rows': 0,
+            'sync_errors': 0
+        }
+
+    # ------------------------------------------------------------------
+    # Índices (devem ser chamados com lock)
+    # ------------------------------------------------------------------
+
+    def _unindex(self, row_id: str):
+        agendamento = self._scheduled_at.pop(row_id, None)
+        if agendamento is not None:
+            entry = (agendamento, row_id)
+            pos = bisect.bisect_left(self.scheduled, entry)
+            if pos < len(self.scheduled) and self.scheduled[pos] == entry:
+                del self.scheduled[pos]
+
+    def _store(self, row: Dict[str, Any]) -> bool:
+        """Insere/substitui a linha e reindexa; retorna True se algo mudou"""
+        if row.get('id') is None:
+            return False
+        row_id = str(row['id'])
+        previous = self.rows.get(row_id)
+        changed = previous != row
+        self._unindex(row_id)
+        self.rows[row_id] = row
+        self.rows.move_to_end(row_id)
+        self._stored_at[row_id] = time.time()
+        agendamento = _parse_timestamp(row.get('agendamento'))
+        if agendamento is not None:
+            self._scheduled_at[row_id] = agendamento
+            bisect.insort(self.scheduled, (agendamento, row_id))
+        return changed
+
+    def _drop(self, row_id: str) -> bool:
+        self._unindex(row_id)
+        self._stored_at.pop(row_id, None)
+        return self.rows.pop(row_id, None) is not None
+
+    def _is_expired(self, row_id: str, now: float) -> bool:
+        """Linha não agendada guardada há mais de row_ttl segundos"""
+        return row_id not in self._scheduled_at and now - self._stored_at.get(row_id, 0) > self.row_ttl
+
+    def _drop_expired(self):
+        now = time.time()
+        for row_id in [row_id for row_id in self.rows if self._is_expired(row_id, now)]:
+            self._drop(row_id)
+            self.stats['expired'] += 1
+
+    def _evict(self):
+        """Descarta as linhas não agendadas menos usadas acima de max_rows"""
+        excess = len(self.rows) - self.max_rows
+        if excess <= 0:
+            return
+        for row_id in list(self.rows):
+            if excess <= 0:
+                break
+            if row_id not in self._scheduled_at:
+                self._drop(row_id)
+                self.stats['evictions'] += 1
+                excess -= 1
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def get(self, row_id: Any) -> Optional[Dict[str, Any]]:
+        """Cópia da linha completa, ou None se não estiver no espelho"""
+        row_id = str(row_id)
+        with self.lock:
+            row = self.rows.get(row_id)
+            if row is not None and self._is_expired(row_id, time.time()):
+                self._drop(row_id)
+                self.stats['expired'] += 1
+                row = None
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.rows.move_to_end(row_id)
+            self.stats['hits'] += 1
+            return dict(row)
+
+    def list_scheduled(self, desc: bool = False, after: Optional[Tuple[str, Any]] = None,
+                       limit: Optional[int] = None, fontes: Optional[Iterable[str]] = None,
+                       until: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Cópias das linhas agendadas ordenadas por (agendamento, id).
+
+        after continua depois da posição (agendamento ISO, id) informada, no
+        sentido da ordenação (paginação por cursor); until limita a
+        agendamentos até esse instante (ex: mensagens vencidas); fontes
+        filtra pela coluna fonte.
+        """
+        if after is not None:
+            after = (_parse_timestamp(after[0]), str(after[1]))
+            if after[0] is None:
+                raise ValueError("Cursor de paginação inválido")
+        with self.lock:
+            if desc:
+                end = len(self.scheduled) if after is None else bisect.bisect_left(self.scheduled, after)
+                entries = reversed(self.scheduled[:end])
+            else:
+                start = 0 if after is None else bisect.bisect_right(self.scheduled, after)
+                entries = iter(self.scheduled[start:])
+
+            result = []
+            for agendamento, row_id in entries:
+                if until is not None and agendamento > until:
+                    if desc:
+                        continue
+                    break
+                row = self.rows.get(row_id)
+                if row is None:
+                    continue
+                if fontes and row.get('fonte') not in fontes:
+                    continue
+                result.append(dict(row))
+                if limit is not None and len(result) >= limit:
+                    break
+            self.stats['hits'] += 1
+            return result
+
+    # ------------------------------------------------------------------
+    # Escritas locais
+    # ------------------------------------------------------------------
+
+    def put(self, rows: Iterable[Dict[str, Any]]):
+        """Guarda linhas completas (resultado de select/insert/update)"""
+        with self.lock:
+            for row in rows:
+                self._store(dict(row))
+            self._evict()
+
+    def apply_update(self, row_id: Any, fields: Dict[str, Any], rows: Optional[List[Dict[str, Any]]] = None):
+        """Reflete um update: usa as linhas devolvidas pelo Supabase ou aplica os campos na cópia local"""
+        row_id = str(row_id)
+        with self.lock:
+            self.stats['local_writes'] += 1
+            if rows:
+                for row in rows:
+                    self._store(dict(row))
+            elif row_id in self.rows:
+                self._store({**self.rows[row_id], **fields})
+            self._evict()
+
+    def remove(self, row_id: Any):
+        with self.lock:
+            self.stats['local_writes'] += 1
+            self._drop(str(row_id))
+            self._removed_at[str(row_id)] = time.time()
+
+    # ------------------------------------------------------------------
+    # Sincronização
+    # ------------------------------------------------------------------
+
+    def _advance_watermark(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            value = row.get(self.sync_column)
+            if value and (self.watermark is None or value > self.watermark):
+                self.watermark = value
+
+    def full_sync(self):
+        """Recarrega todas as linhas agendadas (fonte de verdade para o índice de agendamento)"""
+        started_at = time.time()
+        started = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        response = self.table().select("*").not_.is_("agendamento", "null").execute()
+        rows = response.data or []
+        changed = False
+        with self.lock:
+            # Linhas gravadas por este processo depois do início da consulta são mais
+            # novas que o resultado dela: não são removidas nem sobrescritas
+            def written_during_sync(row_id: str) -> bool:
+                return max(self._stored_at.get(row_id, 0), self._removed_at.get(row_id, 0)) >= started_at
+
+            fresh_ids = {str(row.get('id')) for row in rows}
+            # Agendadas que sumiram do conjunto: excluídas ou desagendadas fora deste processo
+            for row_id in [row_id for row_id in self._scheduled_at if row_id not in fresh_ids]:
+                if not written_during_sync(row_id):
+                    changed = self._drop(row_id) or changed
+            for row in rows:
+                if not written_during_sync(str(row.get('id'))):
+                    changed = self._store(dict(row)) or changed
+            self._removed_at = {row_id: at for row_id, at in self._removed_at.items() if at >= started_at}
+            self._drop_expired()
+            self._evict()
+            if self.watermark is None:
+                self._advance_watermark(rows)
+                # Sem linhas agendadas, o delta parte do início desta recarga
+                if self.watermark is None:
+                    self.watermark = started
+            self.ready = True
+            self.last_full_sync = time.time()
+            self.stats['full_syncs'] += 1
+        if changed and self.on_change is not None:
+            self.on_change()
+
+    def delta_sync(self, batch_size: int = 500):
+        """Busca as linhas alteradas/criadas desde a última sincronização"""
+        query = self.table().select("*")
+        if self.watermark is not None:
+            # gte: linhas com o mesmo timestamp da marca não se perdem (reaplicar é inofensivo)
+            query = query.gte(self.sync_column, self.watermark)
+        try:
+            response = query.order(self.sync_column).limit(batch_size).execute()
+        except Exception as e:
+            # Só "coluna não existe" (42703) muda a coluna; falhas de rede etc. sobem
+            # para o contador de erros de _sync_loop e a próxima rodada tenta de novo
+            if getattr(e, 'code', None) != UNDEFINED_COLUMN or self.sync_column == 'created_at':
+                raise
+            # Tabela sem a coluna updated_at: o delta passa a cobrir só inserções. A
+            # marca (um timestamp) continua valendo, sem reler a tabela inteira
+            logger.warning(f"Espelho de promoções: coluna {self.sync_column} não existe ({e}); usando created_at")
+            self.sync_column = 'created_at'
+            return
+
+        rows = response.data or []
+        changed = False
+        with self.lock:
+            for row in rows:
+                row_id = str(row.get('id'))
+                # Só interessam linhas agendadas ou que já estão no espelho
+                if row_id in self.rows or row.get('agendamento'):
+                    changed = self._store(dict(row)) or changed
+            self._evict()
+            self._advance_watermark(rows)
+            self.stats['delta_syncs'] += 1
+            self.stats['delta_rows'] += len(rows)
+        if changed and self.on_change is not None:
+            self.on_change()
+
+    def _sync_loop(self):
+        while not self._stop.is_set():
+            try:
+                if not self.ready or time.time() - self.last_full_sync >= self.full_sync_interval:
+                    self.full_sync()
+                else:
+                    self.delta_sync()
+            except Exception as e:
+                with self.lock:
+                    self.stats['sync_errors'] += 1
+                logger.error(f"Erro na sincronização do espelho de promoções: {e}")
+            self._stop.wait(self.sync_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sync_loop, daemon=True, name='promocoes-mirror')
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'ready': self.ready,
+                'rows': len(self.rows),
+                'scheduled': len(self.scheduled),
+                'max_rows': self.max_rows,
+                'row_ttl': self.row_ttl,
+                'sync_column': self.sync_column,
+                'watermark': self.watermark,
+                'last_full_sync': self.last_full_sync,
+                'hit_rate': round(self.stats['hits'] / lookups * 100, 2) if lookups else 0,
+                **self.stats
+            }
@@ -4,15 +4,25 @@ Sistema de fila para processamento assíncrono de produtos
 """
 
 import asyncio
+import heapq
+import itertools
 import json
+import random
 import time
 import uuid
-from typing import Dict, List, Optional, Callable, Any
-from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Optional, Callable, Any, Tuple
+from dataclasses import dataclass, asdict, field, fields, replace
+from collections import defaultdict, deque
 from enum import Enum
 import logging
 from concurrent.futures import ThreadPoolExecutor
 import threading
+from .config import ScrapingConfig
+from .task_journal import TaskJournal
+from .parse_pool import ParsePool
+from .product_identity import extract_product_identity
+from .event_bus import EventBus, event_bus as default_event_bus
+from .cache_manager import CacheManager, ProductCachedScraper, cache_manager
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +33,11 @@ class TaskStatus(Enum):
     FAILED = "failed"
     RETRYING = "retrying"
 
+FINAL_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+# Pedido anexado a uma tarefa em andamento: "<id da tarefa>:<índice em waiters>"
+WAITER_SEPARATOR = ':'
+
 @dataclass
 class ScrapingTask:
     """Representa uma tarefa de scraping"""
@@ -39,25 +54,133 @@ class ScrapingTask:
     error_message: Optional[str] = None
     result: Optional[Dict] = None
     priority: int = 0  # 0 = normal, 1 = high, -1 = low
+    attempts: int = 0  # Execuções iniciadas (inclui a primeira)
+    next_attempt_at: Optional[float] = None  # Quando a tarefa volta a ser elegível
+    last_retry_delay: Optional[float] = None  # Último atraso de backoff aplicado (s)
+    batch_id: Optional[str] = None  # Lote de origem (/queue/batch)
+    dedup_key: Optional[str] = None  # Identidade canônica usada para deduplicar tarefas em andamento
+    waiters: List[Dict] = field(default_factory=list)  # Pedidos repetidos anexados a esta tarefa
+    leader_task_id: Optional[str] = None  # Na visão de um pedido anexado: tarefa que o atende
+    owner_cancelled_at: Optional[float] = None  # Pedido original cancelado; a tarefa segue para os anexados
     
     def to_dict(self) -> Dict:
-        return asdict(self)
+        data = asdict(self)
+        data['status'] = self.status.value
+        data['retry_wait_seconds'] = (
+            round(max(0.0, self.next_attempt_at - time.time()), 2) if self.next_attempt_at else 0
+        )
+        return data
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'ScrapingTask':
+        known = {f.name for f in fields(cls)}
+        data = {key: value for key, value in data.items() if key in known}
+        data['status'] = TaskStatus(data['status'])
         return cls(**data)
 
 class QueueManager:
-    """Gerenciador de fila para processamento de produtos"""
+    """Gerenciador de fila para processamento de produtos
+
+    A fila é um heap de (-prioridade, sequência, task_id): maior prioridade
+    primeiro e, em empate, ordem de chegada (FIFO), com inserção e remoção
+    em O(log n). Cancelamentos apenas retiram o ID de `queued`; a entrada
+    no heap é descartada quando chega ao topo. O despachante dorme em uma
+    Condition e é acordado quando chega tarefa ou um worker fica livre.
+    
+    Com um TaskJournal, cada transição de status é persistida e
+    recover_from_journal() recoloca na fila as tarefas interrompidas.
+    
+    Retentativas não voltam direto para a fila: entram em um heap de
+    espera ordenado pelo instante em que ficam elegíveis, com backoff
+    exponencial e jitter por tarefa. Falhas seguidas de um mesmo domínio
+    (plataforma) também abrem uma janela de backoff do domínio, durante a
+    qual as tarefas dele são adiadas em vez de executadas.
+    
+    domain_max_in_flight limita quantas tarefas de um domínio rodam ao mesmo
+    tempo (um semáforo por domínio). Tarefas de um domínio saturado ficam
+    estacionadas sem ocupar worker e voltam ao heap, com a mesma posição,
+    quando uma tarefa daquele domínio termina.
+    
+    Com engine='async', cada tarefa vira uma corrotina no engine asyncio
+    (app/async_engine.py) em vez de ocupar uma thread do pool: max_workers
+    passa a ser o limite de tarefas simultâneas e pode chegar a centenas.
+    
+    Com um ParsePool (modo pipeline), os workers só buscam o HTML; extração
+    e validação rodam no pool de processos, fora do GIL.
+    
+    add_batch() enfileira um lote inteiro sob um único lock. Cada lote guarda
+    a lista de tarefas concluídas na ordem em que terminaram, e
+    iter_batch_events() acompanha essa lista com um cursor, sem varrer as
+    tarefas a cada atualização.
+    
+    Toda transição de status passa por _set_status(), que mantém contadores
+    por status (leitura O(1) em get_queue_status), e todo evento disparado
+    por _trigger_callback() também é publicado no EventBus, que alimenta o
+    stream SSE /queue/events.
     
-    def __init__(self, max_workers: int = 5):
+    Tarefas finalizadas entram em `finished_order` na ordem em que terminam;
+    um reaper em background remove da memória as mais antigas quando passam
+    de retention_max_finished ou de retention_max_age segundos. Com
+    result_cache, a tarefa removida (com o resultado) é guardada no disco do cache e
+    get_task() continua a encontrá-la.
+    
+    Pedidos repetidos (mesma identidade canônica do produto) enquanto uma
+    tarefa está pendente ou em processamento não criam outra tarefa: entram
+    em `waiters` da existente. O pedido recebe um ID próprio
+    ("<tarefa>:<índice>"): get_task() devolve a visão dele (status da
+    tarefa, resultado com o seu link de afiliado) e cancel_task() desanexa
+    só ele. Cancelar a tarefa com pedidos anexados ativos também desanexa
+    só o pedido original: o scraping continua para os demais.
+    """
+    
+    def __init__(self, max_workers: int = 5, journal: Optional[TaskJournal] = None,
+                 retry_base_delay: float = 5.0, retry_max_delay: float = 300.0,
+                 domain_max_delay: float = 600.0,
+                 domain_max_in_flight: Optional[Dict[str, int]] = None,
+                 engine: str = 'threaded', parse_pool: Optional[ParsePool] = None,
+                 event_bus: Optional[EventBus] = None,
+                 retention_max_finished: int = 5000, retention_max_age: float = 86400,
+                 reaper_interval: float = 60, result_cache: Optional[CacheManager] = None,
+                 spill_ttl: float = 7 * 24 * 3600):
         self.max_workers = max_workers
+        self.engine = engine
+        self.parse_pool = parse_pool
+        self.domain_semaphores: Dict[str, threading.BoundedSemaphore] = {
+            domain: threading.BoundedSemaphore(limit)
+            for domain, limit in (domain_max_in_flight or {}).items()
+        }
+        self.domain_in_flight: Dict[str, int] = defaultdict(int)
+        self.parked: Dict[str, deque] = defaultdict(deque)  # Entradas do heap aguardando vaga no domínio
+        self.journal = journal
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.domain_max_delay = domain_max_delay
+        self.delayed: List[tuple] = []  # Heap de (elegível_em, sequência, task_id)
+        self.delayed_ids: set = set()  # IDs de tarefas aguardando no heap de espera
+        self.domain_failures: Dict[str, int] = {}  # Falhas consecutivas por domínio
+        self.domain_backoff_until: Dict[str, float] = {}
         self.tasks: Dict[str, ScrapingTask] = {}
-        self.queue: List[str] = []  # IDs de tarefas ordenados por prioridade
+        self.queue: List[tuple] = []  # Heap de (-prioridade, sequência, task_id)
+        self.queued: set = set()  # IDs de tarefas aguardando no heap
+        self._sequence = itertools.count()
         self.processing: set = set()  # IDs de tarefas sendo processadas
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
         self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
         self.callbacks: Dict[str, Callable] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}  # batch_id -> tarefas e concluídas em ordem
+        self.batch_condition = threading.Condition(self.lock)
+        self.event_bus = event_bus or default_event_bus
+        self.status_counts: Dict[str, int] = {status.value: 0 for status in TaskStatus}
+        self.inflight_keys: Dict[str, str] = {}  # dedup_key -> ID da tarefa não finalizada
+        self.finished_order: deque = deque()  # IDs das tarefas finalizadas, da mais antiga à mais nova
+        self.retention_max_finished = retention_max_finished
+        self.retention_max_age = retention_max_age
+        self.reaper_interval = reaper_interval
+        self.result_cache = result_cache
+        self.spill_ttl = spill_ttl
+        self._reaper_wakeup = threading.Event()
+        self._reaper_thread = None
         self.running = False
         self._worker_thread = None
         
@@ -66,15 +189,119 @@ class QueueManager:
             'total_tasks': 0,
             'completed_tasks': 0,
             'failed_tasks': 0,
-            'retry_tasks': 0
+            'retry_tasks': 0,
+            'reaped_tasks': 0,
+            'spilled_tasks': 0,
+            'deduplicated_tasks': 0
         }
     
     def register_callback(self, event: str, callback: Callable):
         """Registra callback para eventos"""
         self.callbacks[event] = callback
     
+    def _persist(self, task: ScrapingTask):
+        """Grava a transição da tarefa no journal, se habilitado"""
+        if self.journal is not None:
+            # Cópia sob lock: waiters mudam sob lock em outras threads
+            with self.lock:
+                data = task.to_dict()
+            self.journal.record(data)
+    
+    def _persist_locked(self, task: ScrapingTask):
+        """Como _persist (deve ser chamada com lock)"""
+        if self.journal is not None:
+            self.journal.record(task.to_dict())
+    
+    def recover_from_journal(self) -> int:
+        """Recoloca na fila as tarefas pendentes/em andamento gravadas no journal"""
+        if self.journal is None:
+            return 0
+        
+        recovered = 0
+        with self.lock:
+            for data in self.journal.load_active():
+                try:
+                    task = ScrapingTask.from_dict(data)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"Tarefa inválida no journal ignorada: {e}")
+                    continue
+                if task.id in self.tasks:
+                    continue
+                
+                self.tasks[task.id] = task
+                task.started_at = None
+                if task.batch_id:
+                    self._register_batch_task(task)
+                if task.status == TaskStatus.RETRYING and task.next_attempt_at:
+                    # Retentativa agendada: respeitar o backoff que estava em curso
+                    self._schedule_delayed(task.id, task.next_attempt_at)
+                else:
+                    # Tarefas interrompidas no meio do processamento voltam para a fila
+                    task.status = TaskStatus.PENDING
+                    self._insert_into_queue(task.id)
+                self._count_task(task)
+                if task.dedup_key:
+                    self.inflight_keys.setdefault(task.dedup_key, task.id)
+                self.stats['total_tasks'] += 1
+                recovered += 1
+        
+        if recovered:
+            logger.info(f"{recovered} tarefas recuperadas do journal da fila")
+            self.start_processing()
+        return recovered
+    
+    def _count_task(self, task: ScrapingTask):
+        """Inclui uma tarefa nova nos contadores por status (deve ser chamada com lock)"""
+        self.status_counts[task.status.value] += 1
+    
+    def _uncount_task(self, task: ScrapingTask):
+        """Retira dos contadores uma tarefa removida da memória (deve ser chamada com lock)"""
+        self.status_counts[task.status.value] -= 1
+    
+    def _set_status(self, task: ScrapingTask, status: TaskStatus):
+        """Muda o status da tarefa mantendo os contadores (deve ser chamada com lock)"""
+        if task.id in self.tasks:
+            self.status_counts[task.status.value] -= 1
+            self.status_counts[status.value] += 1
+            if status in FINAL_STATUSES and task.status not in FINAL_STATUSES:
+                if task.dedup_key and self.inflight_keys.get(task.dedup_key) == task.id:
+                    del self.inflight_keys[task.dedup_key]
+                self.finished_order.append(task.id)
+                if self._over_retention_limit():
+                    self._reaper_wakeup.set()
+        task.status = status
+    
+    def get_status_counts(self) -> Dict[str, int]:
+        """Retorna quantas tarefas há em cada status (O(1))"""
+        with self.lock:
+            return dict(self.status_counts)
+    
+    @staticmethod
+    def _task_event_data(task: ScrapingTask) -> Dict[str, Any]:
+        """Resumo da tarefa publicado no barramento (sem o resultado, que pode ser grande)"""
+        return {
+            'id': task.id,
+            'url': task.url,
+            'platform': task.platform,
+            'status': task.status.value,
+            'batch_id': task.batch_id,
+            'waiters': len(task.waiters),
+            'attempts': task.attempts,
+            'retry_count': task.retry_count,
+            'error_message': task.error_message,
+            'next_attempt_at': task.next_attempt_at
+        }
+    
     def _trigger_callback(self, event: str, *args, **kwargs):
-        """Dispara callback se registrado"""
+        """Publica o evento no barramento e dispara o callback, se registrado"""
+        if args and isinstance(args[0], ScrapingTask):
+            try:
+                self.event_bus.publish(event, {
+                    'task': self._task_event_data(args[0]),
+                    'counts': self.get_status_counts()
+                })
+            except Exception as e:
+                logger.error(f"Erro ao publicar evento {event}: {e}")
         if event in self.callbacks:
             try:
                 self.callbacks[event](*args, **kwargs)
@@ -83,7 +310,11 @@ class QueueManager:
     
     def add_task(self, url: str, affiliate_link: str, platform: str, 
                  priority: int = 0, max_retries: int = 3) -> str:
-        """Adiciona nova tarefa à fila"""
+        """
+        Adiciona nova tarefa à fila e retorna o ID. Se uma tarefa igual já está
+        em andamento, o pedido é anexado a ela e o ID retornado é o do pedido
+        anexado (ver split_task_id).
+        """
         task_id = str(uuid.uuid4())
         
         task = ScrapingTask(
@@ -94,13 +325,27 @@ class QueueManager:
             status=TaskStatus.PENDING,
             created_at=time.time(),
             max_retries=max_retries,
-            priority=priority
+            priority=priority,
+            dedup_key=self._dedup_key(url, platform)
         )
         
         with self.lock:
-            self.tasks[task_id] = task
-            self._insert_into_queue(task_id)
-            self.stats['total_tasks'] += 1
+            attached = self._attach_to_inflight(task)
+            if attached is None:
+                self.tasks[task_id] = task
+                self._count_task(task)
+                self.inflight_keys[task.dedup_key] = task_id
+                self._insert_into_queue(task_id)
+                self.stats['total_tasks'] += 1
+        
+        if attached is not None:
+            existing, waiter_id = attached
+            self._persist(existing)
+            logger.info(f"Pedido duplicado de {url[:80]} anexado à tarefa {existing.id} ({waiter_id})")
+            self._trigger_callback('task_deduplicated', existing)
+            return waiter_id
+        
+        self._persist(task)
         
         logger.info(f"Tarefa {task_id} adicionada à fila (prioridade: {priority})")
         self._trigger_callback('task_added', task)
@@ -111,24 +356,245 @@ class QueueManager:
         
         return task_id
     
+    def add_batch(self, items: List[Dict[str, str]], priority: int = 0,
+                  max_retries: int = 3) -> Dict[str, Any]:
+        """
+        Adiciona um lote de URLs à fila em uma única operação.
+        
+        items: [{'url', 'affiliate_link', 'platform'}]. URLs do mesmo produto
+        (mesma identidade canônica) entram uma única vez; as repetidas são
+        anexadas e devolvidas em 'duplicates' com o ID do pedido anexado
+        ('task_id') e o da tarefa que as atende ('leader_task_id').
+        """
+        batch_id = str(uuid.uuid4())
+        now = time.time()
+        candidates: List[ScrapingTask] = []
+        task_by_key: Dict[str, ScrapingTask] = {}
+        repeated: List[Tuple[str, Dict[str, str]]] = []
+        duplicates = []
+        
+        for item in items:
+            key = self._dedup_key(item['url'], item['platform'])
+            if key in task_by_key:
+                repeated.append((key, item))
+                continue
+            task = ScrapingTask(
+                id=str(uuid.uuid4()),
+                url=item['url'],
+                affiliate_link=item.get('affiliate_link', ''),
+                platform=item['platform'],
+                status=TaskStatus.PENDING,
+                created_at=now,
+                max_retries=max_retries,
+                priority=priority,
+                batch_id=batch_id,
+                dedup_key=key
+            )
+            task_by_key[key] = task
+            candidates.append(task)
+        
+        tasks: List[ScrapingTask] = []
+        attached: List[ScrapingTask] = []
+        with self.lock:
+            self.batches[batch_id] = {'task_ids': [], 'finished': [], 'removed': 0, 'created_at': now}
+            for task in candidates:
+                # Produto já em andamento fora do lote: o pedido é anexado à tarefa existente
+                existing = self._attach_to_inflight(task)
+                if existing is not None:
+                    existing_task, waiter_id = existing
+                    task_by_key[task.dedup_key] = existing_task
+                    duplicates.append({'url': task.url, 'task_id': waiter_id, 'leader_task_id': existing_task.id})
+                    attached.append(existing_task)
+                    continue
+                tasks.append(task)
+                self.tasks[task.id] = task
+                self._count_task(task)
+                self.inflight_keys[task.dedup_key] = task.id
+                self._register_batch_task(task)
+                heapq.heappush(self.queue, (-task.priority, next(self._sequence), task.id))
+                self.queued.add(task.id)
+            # Repetidas dentro do lote: anexadas à tarefa (nova ou existente) do mesmo produto
+            for key, item in repeated:
+                target = task_by_key[key]
+                waiter_id = self._add_waiter(target, item['url'], item.get('affiliate_link', ''), now)
+                duplicates.append({'url': item['url'], 'task_id': waiter_id, 'leader_task_id': target.id})
+            self.stats['total_tasks'] += len(tasks)
+            self.stats['deduplicated_tasks'] += len(repeated)
+            self.condition.notify_all()
+        
+        for task in tasks:
+            self._persist(task)
+            self._trigger_callback('task_added', task)
+        for task in attached:
+            self._persist(task)
+        
+        logger.info(f"Lote {batch_id}: {len(tasks)} tarefas adicionadas, {len(duplicates)} duplicadas")
+        if not self.running:
+            self.start_processing()
+        
+        return {
+            'batch_id': batch_id,
+            'task_ids': [task.id for task in tasks],
+            'duplicates': duplicates
+        }
+    
+    @staticmethod
+    def _dedup_key(url: str, platform: str) -> str:
+        """Chave de deduplicação: identidade canônica do produto ou, sem ela (links curtos), a própria URL"""
+        return extract_product_identity(url) or f"{platform}:{url.strip()}"
+    
+    @staticmethod
+    def split_task_id(task_id: str) -> Tuple[str, Optional[int]]:
+        """Separa o ID de um pedido anexado em (ID da tarefa, índice em waiters); tarefa comum: (ID, None)"""
+        leader_id, separator, index = task_id.rpartition(WAITER_SEPARATOR)
+        if separator and index.isdigit():
+            return leader_id, int(index)
+        return task_id, None
+    
+    def _add_waiter(self, task: ScrapingTask, url: str, affiliate_link: str, requested_at: float) -> str:
+        """Anexa um pedido à tarefa e retorna o ID dele (deve ser chamada com lock)"""
+        waiter_id = f"{task.id}{WAITER_SEPARATOR}{len(task.waiters)}"
+        task.waiters.append({
+            'id': waiter_id,
+            'url': url,
+            'affiliate_link': affiliate_link,
+            'requested_at': requested_at
+        })
+        return waiter_id
+    
+    def _waiter_view(self, task: ScrapingTask, index: int) -> Optional[ScrapingTask]:
+        """Tarefa vista por um pedido anexado: status dela, URL/link e resultado do pedido"""
+        with self.lock:
+            if index >= len(task.waiters):
+                return None
+            waiter = dict(task.waiters[index])
+        own_link = (waiter['url'], waiter['affiliate_link']) == (task.url, task.affiliate_link)
+        view = replace(
+            task, id=waiter['id'], url=waiter['url'], affiliate_link=waiter['affiliate_link'],
+            created_at=waiter['requested_at'], batch_id=None, waiters=[], leader_task_id=task.id,
+            result=waiter.get('result', task.result if own_link else None)
+        )
+        if waiter.get('cancelled'):
+            view.status = TaskStatus.FAILED
+            view.result = None
+            view.error_message = "Cancelada pelo usuário"
+            view.completed_at = waiter['cancelled']
+        return view
+    
+    def _attach_to_inflight(self, task: ScrapingTask) -> Optional[Tuple[ScrapingTask, str]]:
+        """
+        Se já existe tarefa não finalizada para o mesmo produto, anexa o pedido
+        a ela e retorna (tarefa, ID do pedido); senão retorna None (deve ser
+        chamada com lock)
+        """
+        existing_id = self.inflight_keys.get(task.dedup_key)
+        existing = self.tasks.get(existing_id) if existing_id else None
+        if existing is None or existing.status in FINAL_STATUSES:
+            return None
+        
+        waiter_id = self._add_waiter(existing, task.url, task.affiliate_link, task.created_at)
+        # Pedido mais prioritário promove a tarefa ainda na fila (a entrada antiga é descartada ao sair)
+        if task.priority > existing.priority:
+            existing.priority = task.priority
+            if existing.id in self.queued:
+                heapq.heappush(self.queue, (-existing.priority, next(self._sequence), existing.id))
+                self.condition.notify()
+        self.stats['deduplicated_tasks'] += 1
+        return existing, waiter_id
+    
+    def _register_batch_task(self, task: ScrapingTask):
+        """Associa a tarefa ao seu lote (deve ser chamada com lock)"""
+        batch = self.batches.setdefault(task.batch_id, {'task_ids': [], 'finished': [], 'removed': 0, 'created_at': task.created_at})
+        batch['task_ids'].append(task.id)
+    
+    def _record_batch_finished(self, task: ScrapingTask):
+        """Registra o fim (concluída ou falha definitiva) de uma tarefa do lote (deve ser chamada com lock)"""
+        batch = self.batches.get(task.batch_id) if task.batch_id else None
+        if batch is None:
+            return
+        batch['finished'].append(task.id)
+        self.batch_condition.notify_all()
+    
+    def get_batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna o progresso de um lote"""
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            counts: Dict[str, int] = defaultdict(int)
+            for task_id in batch['task_ids']:
+                task = self.tasks.get(task_id)
+                if task is not None:
+                    counts[task.status.value] += 1
+            return {
+                'batch_id': batch_id,
+                'total': len(batch['task_ids']),
+                'finished': len(batch['finished']),
+                'created_at': batch['created_at'],
+                'by_status': dict(counts)
+            }
+    
+    def iter_batch_events(self, batch_id: str, heartbeat: float = 15.0) -> Iterator[Optional[ScrapingTask]]:
+        """
+        Gera as tarefas do lote à medida que terminam, até o lote acabar.
+        Gera None a cada `heartbeat` segundos sem novidade (keep-alive do stream).
+        """
+        cursor = 0
+        while True:
+            with self.batch_condition:
+                batch = self.batches.get(batch_id)
+                if batch is None:
+                    return
+                if cursor >= len(batch['finished']):
+                    if len(batch['finished']) >= len(batch['task_ids']):
+                        return
+                    self.batch_condition.wait(heartbeat)
+                finished = batch['finished'][cursor:]
+                cursor += len(finished)
+                tasks = [self.tasks.get(task_id) for task_id in finished]
+            
+            if not finished:
+                yield None
+            for task in tasks:
+                if task is not None:
+                    yield task
+    
     def _insert_into_queue(self, task_id: str):
-        """Insere tarefa na fila mantendo ordem de prioridade"""
+        """Insere tarefa na fila mantendo ordem de prioridade (deve ser chamada com lock)"""
         task = self.tasks[task_id]
         
-        # Inserir na posição correta baseada na prioridade
-        insert_pos = 0
-        for i, queued_id in enumerate(self.queue):
-            queued_task = self.tasks[queued_id]
-            if task.priority > queued_task.priority:
-                insert_pos = i
-                break
-            insert_pos = i + 1
-        
-        self.queue.insert(insert_pos, task_id)
+        heapq.heappush(self.queue, (-task.priority, next(self._sequence), task_id))
+        self.queued.add(task_id)
+        self.condition.notify()
     
     def get_task(self, task_id: str) -> Optional[ScrapingTask]:
-        """Retorna tarefa por ID"""
-        return self.tasks.get(task_id)
+        """
+        Retorna tarefa por ID (consultando o cache e o journal se não estiver em memória).
+        ID de pedido anexado devolve a visão desse pedido (ver _waiter_view).
+        """
+        task_id, waiter_index = self.split_task_id(task_id)
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                # Cópia: o chamador serializa fora do lock enquanto waiters podem mudar
+                task = replace(task, waiters=[dict(waiter) for waiter in task.waiters])
+        if task is None and self.result_cache is not None:
+            data = self.result_cache.get(self._spill_key(task_id))
+            if data:
+                task = ScrapingTask.from_dict(data)
+        if task is None and self.journal is not None:
+            data = self.journal.get(task_id)
+            if data:
+                task = ScrapingTask.from_dict(data)
+        if task is not None and waiter_index is not None:
+            return self._waiter_view(task, waiter_index)
+        if task is not None and task.owner_cancelled_at:
+            # Pedido original desanexado: para ele a tarefa está cancelada
+            task.status = TaskStatus.FAILED
+            task.result = None
+            task.error_message = "Cancelada pelo usuário"
+            task.completed_at = task.owner_cancelled_at
+        return task
     
     def get_tasks_by_status(self, status: TaskStatus) -> List[ScrapingTask]:
         """Retorna tarefas por status"""
@@ -139,11 +605,24 @@ class QueueManager:
         with self.lock:
             return {
                 'total_tasks': len(self.tasks),
-                'pending_tasks': len(self.queue),
+                'pending_tasks': len(self.queued),
+                'delayed_tasks': len(self.delayed_ids),
                 'processing_tasks': len(self.processing),
-                'completed_tasks': len([t for t in self.tasks.values() if t.status == TaskStatus.COMPLETED]),
-                'failed_tasks': len([t for t in self.tasks.values() if t.status == TaskStatus.FAILED]),
-                'stats': self.stats.copy()
+                'completed_tasks': self.status_counts[TaskStatus.COMPLETED.value],
+                'failed_tasks': self.status_counts[TaskStatus.FAILED.value],
+                'status_counts': dict(self.status_counts),
+                'stats': self.stats.copy(),
+                'journal': self.journal.get_stats() if self.journal is not None else None,
+                'engine': self.engine,
+                'async_engine': self._get_async_engine().get_stats() if self.engine == 'async' else None,
+                'parse_pool': self.parse_pool.get_stats() if self.parse_pool is not None else None,
+                'domain_in_flight': dict(self.domain_in_flight),
+                'parked_tasks': sum(len(parked) for parked in self.parked.values()),
+                'domain_backoff': {
+                    domain: round(until - time.time(), 1)
+                    for domain, until in self.domain_backoff_until.items()
+                    if until > time.time()
+                }
             }
     
     def start_processing(self):
@@ -154,11 +633,16 @@ class QueueManager:
         self.running = True
         self._worker_thread = threading.Thread(target=self._process_queue, daemon=True)
         self._worker_thread.start()
+        self._reaper_thread = threading.Thread(target=self._reaper_loop, daemon=True, name='queue-reaper')
+        self._reaper_thread.start()
         logger.info("Processamento da fila iniciado")
     
     def stop_processing(self):
         """Para processamento da fila"""
-        self.running = False
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self._reaper_wakeup.set()
         if self._worker_thread:
             self._worker_thread.join(timeout=5)
         logger.info("Processamento da fila parado")
@@ -169,19 +653,31 @@ class QueueManager:
             try:
                 # Pegar múltiplas tarefas se houver workers disponíveis
                 tasks_to_process = []
-                with self.lock:
+                with self.condition:
+                    # Dormir até haver tarefa na fila e worker livre,
+                    # acordando também quando a próxima retentativa vence
+                    while self.running:
+                        self._promote_due_tasks()
+                        if self.queue and len(self.processing) < self.max_workers:
+                            break
+                        timeout = max(0.0, self.delayed[0][0] - time.time()) if self.delayed else None
+                        self.condition.wait(timeout)
+                    if not self.running:
+                        break
+                    
                     available_workers = self.max_workers - len(self.processing)
-                    for _ in range(min(available_workers, len(self.queue))):
+                    for _ in range(available_workers):
                         task_id = self._get_next_task_internal()
-                        if task_id:
-                            tasks_to_process.append(task_id)
+                        if not task_id:
+                            break
+                        tasks_to_process.append(task_id)
 
-                if tasks_to_process:
-                    # Submeter tarefas ao pool de threads
-                    for task_id in tasks_to_process:
+                # Submeter tarefas ao pool de threads (ou ao event loop do engine async)
+                for task_id in tasks_to_process:
+                    if self.engine == 'async':
+                        self._get_async_engine().submit(self._process_task_async(task_id))
+                    else:
                         self.executor.submit(self._process_task, task_id)
-                else:
-                    time.sleep(0.5)  # Aguarda se não há tarefas
             except Exception as e:
                 logger.error(f"Erro no processamento da fila: {e}")
                 time.sleep(5)
@@ -193,13 +689,85 @@ class QueueManager:
 
     def _get_next_task_internal(self) -> Optional[str]:
         """Versão interna sem lock (deve ser chamada dentro de contexto com lock)"""
-        if not self.queue:
-            return None
-
-        # Pega a primeira tarefa da fila
-        task_id = self.queue.pop(0)
-        self.processing.add(task_id)
-        return task_id
+        now = time.time()
+        while self.queue:
+            entry = heapq.heappop(self.queue)
+            task_id = entry[2]
+            # Entradas de tarefas canceladas são descartadas aqui
+            if task_id not in self.queued:
+                continue
+            domain = self._task_domain(self.tasks[task_id])
+            
+            # Domínio em backoff: adiar a tarefa até a janela terminar
+            backoff_until = self.domain_backoff_until.get(domain, 0)
+            if backoff_until > now:
+                self.queued.discard(task_id)
+                self._schedule_delayed(task_id, backoff_until)
+                continue
+            
+            # Domínio no limite de tarefas simultâneas: estacionar sem ocupar worker
+            semaphore = self.domain_semaphores.get(domain)
+            if semaphore is not None and not semaphore.acquire(blocking=False):
+                self.parked[domain].append(entry)
+                continue
+            
+            self.domain_in_flight[domain] += 1
+            self.queued.discard(task_id)
+            self.processing.add(task_id)
+            return task_id
+        return None
+    
+    def _release_domain_slot(self, domain: str):
+        """Libera a vaga do domínio e devolve ao heap a próxima tarefa estacionada (deve ser chamada com lock)"""
+        self.domain_in_flight[domain] -= 1
+        semaphore = self.domain_semaphores.get(domain)
+        if semaphore is None:
+            return
+        semaphore.release()
+        
+        parked = self.parked.get(domain)
+        while parked:
+            entry = parked.popleft()
+            if entry[2] in self.queued:
+                heapq.heappush(self.queue, entry)
+                break
+    
+    @staticmethod
+    def _task_domain(task: ScrapingTask) -> str:
+        """Domínio usado para o backoff compartilhado (uma chave por plataforma)"""
+        return task.platform
+    
+    def _schedule_delayed(self, task_id: str, eligible_at: float):
+        """Coloca a tarefa no heap de espera (deve ser chamada com lock)"""
+        task = self.tasks[task_id]
+        task.next_attempt_at = eligible_at
+        heapq.heappush(self.delayed, (eligible_at, next(self._sequence), task_id))
+        self.delayed_ids.add(task_id)
+        self.condition.notify()
+    
+    def _promote_due_tasks(self):
+        """Move para a fila as tarefas cujo tempo de espera terminou (deve ser chamada com lock)"""
+        now = time.time()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, task_id = heapq.heappop(self.delayed)
+            # Entradas de tarefas canceladas são descartadas aqui
+            if task_id not in self.delayed_ids:
+                continue
+            self.delayed_ids.discard(task_id)
+            
+            task = self.tasks.get(task_id)
+            if task is None:
+                continue
+            self._set_status(task, TaskStatus.PENDING)
+            task.started_at = None
+            task.next_attempt_at = None
+            self._insert_into_queue(task_id)
+            self._persist_locked(task)
+    
+    def _backoff_delay(self, failures: int, max_delay: float) -> float:
+        """Backoff exponencial com jitter: metade fixa, metade aleatória"""
+        delay = min(max_delay, self.retry_base_delay * (2 ** (failures - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
     
     def _process_task(self, task_id: str):
         """Processa uma tarefa específica"""
@@ -208,37 +776,78 @@ class QueueManager:
             return
         
         try:
-            # Atualizar status
-            task.status = TaskStatus.PROCESSING
-            task.started_at = time.time()
-            
-            logger.info(f"Processando tarefa {task_id}: {task.url}")
-            self._trigger_callback('task_started', task)
-            
-            # Executar scraping
-            result = self._execute_scraping(task)
-            
-            if result:
-                # Sucesso
-                task.status = TaskStatus.COMPLETED
-                task.completed_at = time.time()
-                task.result = result
-                self.stats['completed_tasks'] += 1
-                
-                logger.info(f"Tarefa {task_id} concluída com sucesso")
-                self._trigger_callback('task_completed', task, result)
-            else:
-                # Falha
-                self._handle_task_failure(task)
-                
+            self._start_task(task)
+            self._complete_task(task, self._execute_scraping(task))
         except Exception as e:
             logger.error(f"Erro ao processar tarefa {task_id}: {e}")
             task.error_message = str(e)
             self._handle_task_failure(task)
+        finally:
+            self._release_task(task)
+    
+    async def _process_task_async(self, task_id: str):
+        """Processa uma tarefa como corrotina no engine assíncrono"""
+        task = self.tasks.get(task_id)
+        if not task:
+            return
         
+        try:
+            self._start_task(task)
+            self._complete_task(task, await self._execute_scraping_async(task))
+        except Exception as e:
+            logger.error(f"Erro ao processar tarefa {task_id}: {e}")
+            task.error_message = str(e)
+            self._handle_task_failure(task)
         finally:
-            with self.lock:
-                self.processing.discard(task_id)
+            self._release_task(task)
+    
+    def _start_task(self, task: ScrapingTask):
+        """Marca a tarefa como em processamento"""
+        with self.lock:
+            self._set_status(task, TaskStatus.PROCESSING)
+        task.started_at = time.time()
+        task.attempts += 1
+        self._persist(task)
+        
+        logger.info(f"Processando tarefa {task.id}: {task.url}")
+        self._trigger_callback('task_started', task)
+    
+    def _complete_task(self, task: ScrapingTask, result: Optional[Dict]):
+        """Registra o resultado do scraping (sem resultado conta como falha)"""
+        if not result:
+            self._handle_task_failure(task)
+            return
+        
+        task.completed_at = time.time()
+        task.result = result
+        task.next_attempt_at = None
+        with self.lock:
+            # Cada pedido anexado recebe o resultado com o seu link de afiliado. Sob o
+            # mesmo lock da mudança de status: nenhum pedido se anexa depois desta volta
+            for waiter in task.waiters:
+                if waiter.get('cancelled'):
+                    continue
+                if (waiter['url'], waiter['affiliate_link']) != (task.url, task.affiliate_link):
+                    waiter['result'] = ProductCachedScraper.personalize(result, waiter['url'], waiter['affiliate_link'])
+            self._set_status(task, TaskStatus.COMPLETED)
+            self.stats['completed_tasks'] += 1
+        self._persist(task)
+        
+        with self.lock:
+            self._record_batch_finished(task)
+            domain = self._task_domain(task)
+            self.domain_failures.pop(domain, None)
+            self.domain_backoff_until.pop(domain, None)
+        
+        logger.info(f"Tarefa {task.id} concluída com sucesso")
+        self._trigger_callback('task_completed', task, result)
+    
+    def _release_task(self, task: ScrapingTask):
+        """Libera o worker e a vaga do domínio, acordando o despachante"""
+        with self.condition:
+            self.processing.discard(task.id)
+            self._release_domain_slot(self._task_domain(task))
+            self.condition.notify()
     
     def _execute_scraping(self, task: ScrapingTask) -> Optional[Dict]:
         """Executa o scraping da tarefa"""
@@ -249,53 +858,148 @@ class QueueManager:
         if not scraper:
             raise Exception(f"Scraper não encontrado para plataforma: {task.platform}")
         
-        return scraper.scrape_product(task.url, task.affiliate_link)
+        if self.parse_pool is None:
+            return scraper.scrape_product(task.url, task.affiliate_link)
+        
+        # Modo pipeline: a thread só busca o HTML, a extração vai para o pool de processos
+        scraper.parse_pool = self.parse_pool
+        with self.parse_pool.track_task():
+            return scraper.scrape_product(task.url, task.affiliate_link)
+    
+    async def _execute_scraping_async(self, task: ScrapingTask) -> Optional[Dict]:
+        """Executa o scraping da tarefa com o engine assíncrono"""
+        from .scraper_factory import ScraperFactory
+        
+        scraper = ScraperFactory.create_scraper(task.platform, engine='async')
+        if not scraper:
+            raise Exception(f"Scraper não encontrado para plataforma: {task.platform}")
+        
+        if self.parse_pool is None:
+            return await scraper.async_scrape_product(task.url, task.affiliate_link)
+        
+        scraper.parse_pool = self.parse_pool
+        with self.parse_pool.track_task():
+            return await scraper.async_scrape_product(task.url, task.affiliate_link)
+    
+    @staticmethod
+    def _get_async_engine():
+        from .async_engine import async_engine
+        return async_engine
     
     def _handle_task_failure(self, task: ScrapingTask):
         """Trata falha de tarefa"""
         task.retry_count += 1
         
+        # Falhas seguidas no domínio abrem uma janela de backoff compartilhada
+        with self.lock:
+            domain = self._task_domain(task)
+            domain_failures = self.domain_failures.get(domain, 0) + 1
+            self.domain_failures[domain] = domain_failures
+            if domain_failures > 1:
+                self.domain_backoff_until[domain] = time.time() + self._backoff_delay(
+                    domain_failures - 1, self.domain_max_delay
+                )
+        
         if task.retry_count < task.max_retries:
             # Retry
-            task.status = TaskStatus.RETRYING
+            with self.lock:
+                self._set_status(task, TaskStatus.RETRYING)
             task.error_message = f"Tentativa {task.retry_count} falhou"
             
-            # Reagendar com delay exponencial
-            delay = min(60, 2 ** task.retry_count)
-            threading.Timer(delay, self._retry_task, [task.id]).start()
+            # Reagendar com backoff exponencial + jitter (e nunca antes do fim do backoff do domínio)
+            delay = self._backoff_delay(task.retry_count, self.retry_max_delay)
+            task.last_retry_delay = round(delay, 2)
+            with self.condition:
+                eligible_at = max(time.time() + delay, self.domain_backoff_until.get(domain, 0))
+                self._schedule_delayed(task.id, eligible_at)
             
             self.stats['retry_tasks'] += 1
-            logger.info(f"Tarefa {task.id} será retentada em {delay}s (tentativa {task.retry_count})")
+            self._persist(task)
+            logger.info(f"Tarefa {task.id} será retentada em {eligible_at - time.time():.1f}s (tentativa {task.retry_count})")
             self._trigger_callback('task_retrying', task)
         else:
             # Falha definitiva
-            task.status = TaskStatus.FAILED
             task.completed_at = time.time()
-            self.stats['failed_tasks'] += 1
+            with self.lock:
+                self._set_status(task, TaskStatus.FAILED)
+                self.stats['failed_tasks'] += 1
+            self._persist(task)
+            with self.lock:
+                self._record_batch_finished(task)
             
             logger.error(f"Tarefa {task.id} falhou definitivamente após {task.retry_count} tentativas")
             self._trigger_callback('task_failed', task)
     
-    def _retry_task(self, task_id: str):
-        """Reagenda tarefa para retry"""
+    def cancel_task(self, task_id: str) -> bool:
+        """
+        Cancela uma tarefa; ID de pedido anexado desanexa só esse pedido.
+        Com pedidos anexados ativos, a tarefa continua e só o pedido original
+        é desanexado.
+        """
+        task_id, waiter_index = self.split_task_id(task_id)
+        if waiter_index is not None:
+            return self._cancel_waiter(task_id, waiter_index)
         with self.lock:
-            if task_id in self.tasks:
-                task = self.tasks[task_id]
-                task.status = TaskStatus.PENDING
-                task.started_at = None
-                self._insert_into_queue(task_id)
+            task = self.tasks.get(task_id)
+            if task is None or task.status in FINAL_STATUSES or task.owner_cancelled_at:
+                return False
+            if self._has_active_waiters(task):
+                task.owner_cancelled_at = time.time()
+                self._persist_locked(task)
+                event = 'task_owner_cancelled'
+            elif task.status in [TaskStatus.PENDING, TaskStatus.RETRYING]:
+                self._cancel_queued(task)
+                event = 'task_cancelled'
+            else:
+                return False
+        
+        if event == 'task_owner_cancelled':
+            logger.info(f"Pedido original da tarefa {task_id} desanexado; a tarefa segue para os pedidos anexados")
+        self._trigger_callback(event, task)
+        return True
     
-    def cancel_task(self, task_id: str) -> bool:
-        """Cancela uma tarefa"""
+    @staticmethod
+    def _has_active_waiters(task: ScrapingTask) -> bool:
+        return any(not waiter.get('cancelled') for waiter in task.waiters)
+    
+    def _cancel_queued(self, task: ScrapingTask):
+        """Cancela uma tarefa pendente ou aguardando retentativa (deve ser chamada com lock)"""
+        self._set_status(task, TaskStatus.FAILED)
+        task.completed_at = time.time()
+        task.error_message = "Cancelada pelo usuário"
+        # Remoção preguiçosa: a entrada no heap é ignorada ao sair
+        self.queued.discard(task.id)
+        self.delayed_ids.discard(task.id)
+        task.next_attempt_at = None
+        self._persist_locked(task)
+        self._record_batch_finished(task)
+    
+    def _cancel_waiter(self, task_id: str, index: int) -> bool:
+        """
+        Desanexa um pedido de uma tarefa ainda não finalizada (a tarefa continua).
+        Se era o último interessado (pedido original já cancelado), a tarefa
+        ainda na fila é cancelada.
+        """
+        cancelled_task = False
         with self.lock:
-            if task_id in self.tasks:
-                task = self.tasks[task_id]
-                if task.status in [TaskStatus.PENDING, TaskStatus.RETRYING]:
-                    task.status = TaskStatus.FAILED
-                    task.error_message = "Cancelada pelo usuário"
-                    self.queue = [tid for tid in self.queue if tid != task_id]
-                    return True
-        return False
+            task = self.tasks.get(task_id)
+            if task is None or task.status in FINAL_STATUSES or index >= len(task.waiters):
+                return False
+            waiter = task.waiters[index]
+            if waiter.get('cancelled'):
+                return False
+            waiter['cancelled'] = time.time()
+            if (task.owner_cancelled_at and not self._has_active_waiters(task)
+                    and task.status in [TaskStatus.PENDING, TaskStatus.RETRYING]):
+                self._cancel_queued(task)
+                cancelled_task = True
+            else:
+                self._persist_locked(task)
+        logger.info(f"Pedido {waiter['id']} desanexado da tarefa {task_id}")
+        self._trigger_callback('task_waiter_cancelled', task)
+        if cancelled_task:
+            self._trigger_callback('task_cancelled', task)
+        return True
     
     def clear_completed_tasks(self, older_than_hours: int = 24):
         """Remove tarefas concluídas mais antigas que X horas"""
@@ -309,10 +1013,122 @@ class QueueManager:
                     to_remove.append(task_id)
             
             for task_id in to_remove:
-                del self.tasks[task_id]
+                self._remove_task(task_id)
+            
+            if self.journal is not None:
+                self.journal.remove(to_remove)
             
             logger.info(f"Removidas {len(to_remove)} tarefas antigas")
             return len(to_remove)
 
+    def _remove_task(self, task_id: str) -> ScrapingTask:
+        """Remove uma tarefa finalizada da memória (deve ser chamada com lock)"""
+        task = self.tasks.pop(task_id)
+        self._uncount_task(task)
+        
+        # Lote sem nenhuma tarefa restante em memória
+        batch = self.batches.get(task.batch_id) if task.batch_id else None
+        if batch is not None:
+            batch['removed'] += 1
+            if batch['removed'] >= len(batch['task_ids']):
+                del self.batches[task.batch_id]
+        return task
+    
+    def _over_retention_limit(self) -> bool:
+        """Há mais tarefas finalizadas em memória do que o permitido (deve ser chamada com lock)"""
+        finished = self.status_counts[TaskStatus.COMPLETED.value] + self.status_counts[TaskStatus.FAILED.value]
+        return bool(self.retention_max_finished) and finished > self.retention_max_finished
+    
+    @staticmethod
+    def _spill_key(task_id: str) -> str:
+        return f"queue_task:{task_id}"
+    
+    def _reaper_loop(self):
+        """Aplica a retenção periodicamente (ou antes, quando o limite de quantidade estoura)"""
+        while self.running:
+            self._reaper_wakeup.wait(self.reaper_interval)
+            self._reaper_wakeup.clear()
+            try:
+                self.reap_finished_tasks()
+            except Exception as e:
+                logger.error(f"Erro no reaper da fila: {e}")
+    
+    def reap_finished_tasks(self) -> int:
+        """Remove da memória as tarefas finalizadas mais antigas além da política de retenção"""
+        cutoff = time.time() - self.retention_max_age if self.retention_max_age else None
+        reaped: List[ScrapingTask] = []
+        expired_ids: List[str] = []
+        
+        with self.lock:
+            while self.finished_order:
+                task_id = self.finished_order[0]
+                task = self.tasks.get(task_id)
+                if task is None or task.status not in FINAL_STATUSES:
+                    # Já removida (ex: clear_completed_tasks)
+                    self.finished_order.popleft()
+                    continue
+                
+                expired = cutoff is not None and (task.completed_at or 0) < cutoff
+                if not expired and not self._over_retention_limit():
+                    break
+                
+                self.finished_order.popleft()
+                reaped.append(self._remove_task(task_id))
+                if expired:
+                    expired_ids.append(task_id)
+            self.stats['reaped_tasks'] += len(reaped)
+        
+        if self.result_cache is not None:
+            spilled = sum(
+                1 for task in reaped
+                if self.result_cache.spill(self._spill_key(task.id), task.to_dict(), ttl=self.spill_ttl)
+            )
+            with self.lock:
+                self.stats['spilled_tasks'] += spilled
+        
+        # Expiradas por idade saem também do journal; as demais continuam consultáveis por lá
+        if self.journal is not None and expired_ids:
+            self.journal.remove(expired_ids)
+        
+        if reaped:
+            logger.info(f"Reaper da fila: {len(reaped)} tarefas finalizadas removidas da memória")
+        return len(reaped)
+
 # Instância global do gerenciador de fila
-queue_manager = QueueManager()
+def _create_task_journal() -> Optional[TaskJournal]:
+    """Cria o journal persistente da fila se habilitado na configuração"""
+    if not ScrapingConfig.QUEUE_CONFIG['journal_enabled']:
+        return None
+    try:
+        return TaskJournal(
+            ScrapingConfig.QUEUE_CONFIG['journal_path'],
+            flush_interval=ScrapingConfig.QUEUE_CONFIG['journal_flush_interval']
+        )
+    except Exception as e:
+        logger.error(f"Não foi possível iniciar o journal da fila, usando apenas memória: {e}")
+        return None
+
+def _create_parse_pool() -> Optional[ParsePool]:
+    """Retorna o pool de processos do modo pipeline, se habilitado na configuração"""
+    if not ScrapingConfig.PARSE_POOL_CONFIG['enabled']:
+        return None
+    from .parse_pool import parse_pool
+    return parse_pool
+
+queue_manager = QueueManager(
+    max_workers=(ScrapingConfig.QUEUE_CONFIG['async_max_in_flight']
+                 if ScrapingConfig.QUEUE_CONFIG['engine'] == 'async'
+                 else ScrapingConfig.QUEUE_CONFIG['max_workers']),
+    journal=_create_task_journal(),
+    retry_base_delay=ScrapingConfig.DELAY_CONFIG['retry_delay'],
+    retry_max_delay=ScrapingConfig.QUEUE_CONFIG['retry_max_delay'],
+    domain_max_delay=ScrapingConfig.QUEUE_CONFIG['domain_backoff_max_delay'],
+    domain_max_in_flight=ScrapingConfig.QUEUE_CONFIG['domain_max_in_flight'],
+    engine=ScrapingConfig.QUEUE_CONFIG['engine'],
+    parse_pool=_create_parse_pool(),
+    retention_max_finished=ScrapingConfig.QUEUE_CONFIG['retention_max_finished'],
+    retention_max_age=ScrapingConfig.QUEUE_CONFIG['retention_max_age'],
+    reaper_interval=ScrapingConfig.QUEUE_CONFIG['reaper_interval'],
+    result_cache=cache_manager if ScrapingConfig.QUEUE_CONFIG['spill_results'] else None,
+    spill_ttl=ScrapingConfig.QUEUE_CONFIG['spill_ttl']
+)
@@ -1,8 +1,10 @@
 # app/routes.py
 
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
 from functools import wraps
 import datetime
+import json
+import hashlib
 import pytz
 import time
 import requests
@@ -23,11 +25,22 @@ from . import amazon_scraping # Importa o módulo da Amazon
 from .scraper_factory import ScraperFactory
 from .queue_manager import queue_manager
 from .monitoring import metrics_collector, health_checker, alert_manager
-from .cache_manager import cache_manager
+from .cache_manager import CacheManager, cache_manager, cached_product_scraper
+from .product_identity import extract_asin, extract_ml_id
 from .validators import product_validator
+from .config import ScrapingConfig
 
 main_bp = Blueprint('main', __name__)
 
+# Fuso usado na exibição das datas (resolvido uma única vez)
+SAO_PAULO_TZ = pytz.timezone('America/Sao_Paulo')
+
+# Respostas de /produtos já serializadas, por versão da tabela e parâmetros
+produtos_response_cache = CacheManager(
+    max_size=ScrapingConfig.PRODUTOS_CACHE_CONFIG['max_size'],
+    default_ttl=ScrapingConfig.PRODUTOS_CACHE_CONFIG['ttl']
+) if ScrapingConfig.PRODUTOS_CACHE_CONFIG['enabled'] else None
+
 # Credenciais de login (em produção, use variáveis de ambiente)
 LOGIN_USERNAME = os.getenv('LOGIN_USERNAME', 'promobrothers')
 LOGIN_PASSWORD = os.getenv('LOGIN_PASSWORD', 'Bro46mo01')
@@ -166,19 +179,15 @@ def extrair_link_limpo_produto(url):
     Retorna o link limpo do produto sem parâmetros extras.
     """
     try:
-        from bs4 import BeautifulSoup
+        from .html_parser import parse_html
         from .anti_bot import AntiBotManager
 
         logger.info(f'🔍 Fazendo scraping para extrair link limpo de: {url[:80]}...')
 
         # Amazon - usar regex (mais rápido e confiável)
         if 'amazon.com' in url.lower():
-            asin_match = re.search(r'/dp/([A-Z0-9]{10})', url)
-            if not asin_match:
-                asin_match = re.search(r'/gp/product/([A-Z0-9]{10})', url)
-
-            if asin_match:
-                asin = asin_match.group(1)
+            asin = extract_asin(url)
+            if asin:
                 link_limpo = f"https://www.amazon.com.br/dp/{asin}"
                 logger.info(f'✅ Link limpo Amazon extraído (regex): {link_limpo}')
                 return link_limpo
@@ -199,7 +208,7 @@ def extrair_link_limpo_produto(url):
                     logger.warning(f'⚠️ Status {response.status_code} ao acessar Mercado Livre')
                     return url
 
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = parse_html(response.content, 'mercadolivre')
 
                 # SELETORES PARA O BOTÃO COMPARTILHAR DO MERCADO LIVRE
                 share_link = soup.find('a', {'data-testid': 'action-share'})
@@ -223,9 +232,8 @@ def extrair_link_limpo_produto(url):
                     return link_limpo
 
                 # Se não encontrou nenhum, usar regex como fallback
-                mlb_match = re.search(r'(MLB-?\d+)', url, re.IGNORECASE)
-                if mlb_match:
-                    codigo = mlb_match.group(1).upper()
+                codigo = extract_ml_id(url)
+                if codigo:
                     link_limpo = f"https://www.mercadolivre.com.br/p/{codigo}"
                     logger.info(f'✅ Link do Mercado Livre extraído (regex fallback): {link_limpo}')
                     return link_limpo
@@ -644,8 +652,7 @@ def agendar_produto(produto_id):
             return jsonify({'error': 'Dados de agendamento são obrigatórios'}), 400
         try:
             naive_dt = datetime.datetime.fromisoformat(agendamento)
-            timezone_br = pytz.timezone('America/Sao_Paulo')
-            agendamento_dt_br = timezone_br.localize(naive_dt)
+            agendamento_dt_br = SAO_PAULO_TZ.localize(naive_dt)
             agendamento_dt_utc = agendamento_dt_br.astimezone(pytz.utc)
             agendamento_iso = agendamento_dt_utc.isoformat()
         except (ValueError, pytz.UnknownTimeZoneError) as ve:
@@ -692,10 +699,10 @@ def agendar_mensagem_whatsapp():
             logger.info('📤 Detectada imagem base64, fazendo upload para Supabase...')
             titulo_simplificado = f"Mensagem do {grupo_origem}"
 
-            # Upload para Supabase
-            imagem_url_supabase = database.upload_imagem_whatsapp(imagem_url, titulo_simplificado)
+            # Upload para Supabase (nome pelo hash do conteúdo: a mesma imagem é enviada uma vez)
+            imagem_url_supabase = database.hospedar_imagem_inline(imagem_url, titulo_simplificado)
 
-            if imagem_url_supabase:
+            if imagem_url_supabase and not imagem_url_supabase.startswith('data:'):
                 imagem_url_final = imagem_url_supabase
                 logger.info(f'✅ Imagem do WhatsApp enviada para Supabase: {imagem_url_supabase}')
             else:
@@ -777,27 +784,59 @@ def listar_produtos():
 
         plataforma_filter = request.args.get('plataforma', None)
 
-        produtos = database.listar_produtos_db(status_filter, ordem_order)
-
-        # Filtrar por plataforma se especificado
-        if plataforma_filter:
-            produtos = [p for p in produtos if p.get('plataforma') == plataforma_filter]
-
-        # Converte as datas para o fuso horário de São Paulo para exibição
-        for produto in produtos:
-            for key in ["agendamento", "created_at"]:
-                if produto.get(key) and isinstance(produto[key], str):
-                    try:
-                        dt_utc = datetime.datetime.fromisoformat(produto[key].replace('Z', '+00:00'))
-                        dt_br = dt_utc.astimezone(pytz.timezone('America/Sao_Paulo'))
-                        produto[key] = dt_br.strftime('%Y-%m-%d %H:%M:%S')
-                    except Exception:
-                        pass # Deixa a data como está se houver erro de formato
-
-        return jsonify({'success': True, 'produtos': produtos})
+        # Paginação por cursor: o cliente repassa o next_cursor da resposta anterior
+        cursor = request.args.get('cursor') or None
+        try:
+            limit = min(max(int(request.args.get('limit', 200)), 1), 500)
+        except ValueError:
+            limit = 200
+
+        # A chave inclui a versão local da tabela: qualquer escrita deste processo
+        # invalida as listagens; alterações externas aparecem após o TTL
+        cache_key = f"produtos:{database.promocoes_version}:{status_filter}:{ordem_order}:{plataforma_filter}:{cursor}:{limit}"
+        cached = produtos_response_cache.get(cache_key) if produtos_response_cache is not None else None
+        if cached is None:
+            try:
+                produtos, next_cursor = database.listar_produtos_pagina_db(
+                    status_filter, ordem_order, limit=limit, cursor=cursor, plataforma=plataforma_filter
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            # Converte as datas para o fuso horário de São Paulo para exibição
+            _formatar_datas_br(produtos, ("agendamento", "created_at"))
+
+            body = json.dumps({'success': True, 'produtos': produtos, 'next_cursor': next_cursor},
+                              ensure_ascii=False, default=str)
+            cached = {'body': body, 'etag': hashlib.sha1(body.encode('utf-8')).hexdigest()}
+            if produtos_response_cache is not None:
+                produtos_response_cache.set(cache_key, cached)
+
+        # no-cache: o navegador guarda a resposta, mas revalida com If-None-Match
+        headers = {'ETag': f'"{cached["etag"]}"', 'Cache-Control': 'no-cache'}
+        if cached['etag'] in request.if_none_match:
+            return Response(status=304, headers=headers)
+        return Response(cached['body'], mimetype='application/json', headers=headers)
     except Exception as e:
         return jsonify({'success': False, 'error': f'Erro ao listar produtos do Supabase: {str(e)}'}), 500
-    
+
+def _formatar_datas_br(produtos, keys):
+    """Converte, em uma passada, as datas ISO (UTC) dos produtos para o horário de São Paulo"""
+    # Listas costumam repetir horários (agendamentos em lote): converter cada valor uma vez
+    convertidas = {}
+    for produto in produtos:
+        for key in keys:
+            valor = produto.get(key)
+            if not valor or not isinstance(valor, str):
+                continue
+            if valor not in convertidas:
+                try:
+                    dt_utc = datetime.datetime.fromisoformat(valor.replace('Z', '+00:00'))
+                    convertidas[valor] = dt_utc.astimezone(SAO_PAULO_TZ).strftime('%Y-%m-%d %H:%M:%S')
+                except ValueError:
+                    convertidas[valor] = valor  # Deixa a data como está se houver erro de formato
+            produto[key] = convertidas[valor]
+
 @main_bp.route('/produtos/<string:produto_id>', methods=['GET'])
 def obter_produto(produto_id):
     try:
@@ -858,7 +897,7 @@ def enviar_produto_agendado(produto_id):
     try:
         data = request.get_json()
         afiliado_link = data.get('afiliado_link', '').strip()
-        produto_db = database.obter_produto_db(produto_id)
+        produto_db = database.obter_produto_db(produto_id, usar_espelho=False)
         if not produto_db:
             return jsonify({'error': 'Produto não encontrado'}), 404
             
@@ -951,6 +990,21 @@ def obter_url_publica():
     except Exception as e:
         return jsonify({'success': False, 'error': f'Erro ao obter URL: {str(e)}'}), 500
 
+@main_bp.route('/storage/migrar-imagens', methods=['POST'])
+def migrar_imagens_inline():
+    """Backfill: move imagens base64 gravadas em promocoes para o Storage (uma rodada por chamada)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        resultado = database.migrar_imagens_inline_db(
+            batch_size=min(int(data.get('batch_size', 20)), 100),
+            max_rows=min(int(data.get('max_rows', 200)), 2000),
+            after_id=data.get('after_id')
+        )
+        # Repetir a chamada com after_id=proximo_id até concluido=True
+        return jsonify({'success': True, **resultado})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Erro interno: {str(e)}'}), 500
+
 # === NOVAS ROTAS DO SISTEMA UNIFICADO ===
 
 @main_bp.route('/scrape/unified', methods=['POST'])
@@ -1026,6 +1080,22 @@ def scrape_unified():
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+def _registrar_resultado_busca(result):
+    """Aplica afiliado e registra métricas de um resultado do fan-out de busca"""
+    # ⭐ Aplica o ID de afiliado na URL dos resultados
+    if result['platform'].lower() == 'mercadolivre':
+        for p in result['products']:
+            p['link'] = aplicar_afiliado_ml(p['link'])
+
+    metrics_collector.record_scraping_metric(
+        platform=result['platform'],
+        operation='search',
+        success=result['success'],
+        response_time=result['response_time'],
+        products_found=len(result['products']),
+        error_message=result['error']
+    )
+
 @main_bp.route('/scrape/search', methods=['POST'])
 def search_unified():
     """Endpoint unificado para busca em qualquer plataforma"""
@@ -1038,44 +1108,52 @@ def search_unified():
         if not query:
             return jsonify({'error': 'Query é obrigatória'}), 400
         
+        # Prazo por plataforma (segundos); ausente usa o padrão da configuração
+        timeout = None
+        if data.get('timeout') not in (None, ''):
+            try:
+                timeout = float(data['timeout'])
+            except (TypeError, ValueError):
+                timeout = None
+            if isinstance(data['timeout'], bool) or timeout is None or not 0 < timeout < float('inf'):
+                return jsonify({'error': 'timeout deve ser um número de segundos maior que zero'}), 400
+        
         products = []
         
         if platform == 'todas':
-            # Buscar em todas as plataformas
-            available_platforms = ScraperFactory.get_available_platforms()
-            for platform_name in available_platforms:
-                try:
-                    scraper = ScraperFactory.create_scraper(platform_name)
-                    if scraper:
-                        start_time = time.time()
-                        platform_products = scraper.scrape_search(query, max_pages)
-                        response_time = time.time() - start_time
-                        
-                        # ⭐ Aplica o ID de afiliado na URL dos resultados
-                        if platform_name.lower() == 'mercadolivre':
-                             for p in platform_products:
-                                 p['link'] = aplicar_afiliado_ml(p['link'])
-                        
-                        # Registrar métricas
-                        metrics_collector.record_scraping_metric(
-                            platform=platform_name,
-                            operation='search',
-                            success=True,
-                            response_time=response_time,
-                            products_found=len(platform_products)
-                        )
-                        
-                        products.extend(platform_products)
-                        
-                except Exception as e:
-                    metrics_collector.record_scraping_metric(
-                        platform=platform_name,
-                        operation='search',
-                        success=False,
-                        response_time=0,
-                        error_message=str(e)
-                    )
-                    continue
+            # Buscar em todas as plataformas em paralelo, com prazo por plataforma
+            results = ScraperFactory.search_all_platforms(query, max_pages, timeout=timeout)
+
+            # Streaming: entrega cada plataforma (NDJSON) assim que ela termina
+            if data.get('stream'):
+                def generate():
+                    total = 0
+                    for result in results:
+                        _registrar_resultado_busca(result)
+                        total += len(result['products'])
+                        yield json.dumps({'type': 'platform', **result}, ensure_ascii=False) + '\n'
+                    yield json.dumps({'type': 'done', 'total': total, 'platform': platform}) + '\n'
+
+                return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+            platforms_status = {}
+            for result in results:
+                _registrar_resultado_busca(result)
+                products.extend(result['products'])
+                platforms_status[result['platform']] = {
+                    'success': result['success'],
+                    'total': len(result['products']),
+                    'response_time': round(result['response_time'], 2),
+                    'error': result['error']
+                }
+
+            return jsonify({
+                'success': True,
+                'products': products,
+                'total': len(products),
+                'platform': platform,
+                'platforms': platforms_status
+            })
         else:
             # Buscar em plataforma específica
             scraper = ScraperFactory.create_scraper(platform)
@@ -1129,17 +1207,116 @@ def add_to_queue():
         
         # Adicionar à fila
         task_id = queue_manager.add_task(url, affiliate_link, platform, priority)
+        leader_task_id, waiter_index = queue_manager.split_task_id(task_id)
+        deduplicated = waiter_index is not None
         
         return jsonify({
             'success': True,
             'task_id': task_id,
+            'deduplicated': deduplicated,
+            'leader_task_id': leader_task_id if deduplicated else None,
             'platform': platform,
-            'message': 'Produto adicionado à fila'
+            'message': 'Produto anexado a uma tarefa em andamento' if deduplicated else 'Produto adicionado à fila'
         })
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+def _stream_batch_events(batch_id, fmt='ndjson', first_event=None):
+    """Stream (NDJSON ou Server-Sent Events) das tarefas de um lote conforme terminam"""
+    def format_event(event_type, payload):
+        if fmt == 'sse':
+            return f"event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        return json.dumps({'type': event_type, **payload}, ensure_ascii=False) + '\n'
+
+    def generate():
+        if first_event:
+            yield format_event('batch', first_event)
+        for task in queue_manager.iter_batch_events(batch_id):
+            if task is None:
+                # Keep-alive para proxies não derrubarem a conexão ociosa
+                yield ': keep-alive\n\n' if fmt == 'sse' else format_event('heartbeat', {})
+                continue
+            yield format_event('task', {'task': task.to_dict()})
+        yield format_event('done', queue_manager.get_batch_status(batch_id) or {'batch_id': batch_id})
+
+    mimetype = 'text/event-stream' if fmt == 'sse' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main_bp.route('/queue/batch', methods=['POST'])
+def add_batch_to_queue():
+    """Adiciona várias URLs à fila de uma vez (deduplicadas pelo id canônico do produto)"""
+    try:
+        data = request.get_json() or {}
+        items = data.get('items') or [{'url': url} for url in data.get('urls', [])]
+        priority = data.get('priority', 0)
+
+        if not items:
+            return jsonify({'error': 'Informe "urls" ou "items"'}), 400
+        max_size = ScrapingConfig.QUEUE_CONFIG['batch_max_size']
+        if len(items) > max_size:
+            return jsonify({'error': f'Lote excede o máximo de {max_size} URLs'}), 400
+
+        valid_items = []
+        rejected = []
+        for item in items:
+            url = (item.get('url') or '').strip()
+            platform = ScraperFactory.detect_platform_from_url(url) if url else None
+            if not platform:
+                rejected.append({'url': url, 'error': 'URL vazia ou plataforma não suportada'})
+                continue
+            valid_items.append({
+                'url': url,
+                'affiliate_link': (item.get('affiliate_link') or '').strip(),
+                'platform': platform
+            })
+
+        if not valid_items:
+            return jsonify({'error': 'Nenhuma URL válida no lote', 'rejected': rejected}), 400
+
+        batch = queue_manager.add_batch(valid_items, priority)
+        summary = {
+            'batch_id': batch['batch_id'],
+            'task_ids': batch['task_ids'],
+            'accepted': len(batch['task_ids']),
+            'duplicates': batch['duplicates'],
+            'rejected': rejected
+        }
+
+        # Acompanhar o lote na mesma conexão, sem polling por tarefa
+        if data.get('stream'):
+            return _stream_batch_events(batch['batch_id'], data.get('format', 'ndjson'), first_event=summary)
+
+        return jsonify({'success': True, **summary})
+
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@main_bp.route('/queue/batch/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """Retorna o progresso de um lote"""
+    try:
+        status = queue_manager.get_batch_status(batch_id)
+        if not status:
+            return jsonify({'error': 'Lote não encontrado'}), 404
+        return jsonify({'success': True, 'batch': status})
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@main_bp.route('/queue/batch/<batch_id>/events', methods=['GET'])
+def stream_batch_events(batch_id):
+    """Stream das tarefas do lote conforme terminam (?format=sse ou ndjson)"""
+    try:
+        if queue_manager.get_batch_status(batch_id) is None:
+            return jsonify({'error': 'Lote não encontrado'}), 404
+        fmt = request.args.get('format')
+        if not fmt:
+            fmt = 'sse' if 'text/event-stream' in request.headers.get('Accept', '') else 'ndjson'
+        return _stream_batch_events(batch_id, fmt)
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @main_bp.route('/queue/status', methods=['GET'])
 def queue_status():
     """Retorna status da fila"""
@@ -1149,6 +1326,92 @@ def queue_status():
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@main_bp.route('/queue/events', methods=['GET'])
+def queue_events():
+    """
+    Stream (Server-Sent Events) das mudanças de estado da fila, no lugar de polling.
+    Filtros opcionais: ?task_id= (encerra quando a tarefa termina) e ?batch_id=.
+    Reconexões retomam do cabeçalho Last-Event-ID ("<epoch>-<seq>"); um id de
+    outra execução do servidor recebe só o snapshot atual (resync).
+    """
+    try:
+        from .event_bus import event_bus
+
+        task_id = request.args.get('task_id')
+        batch_id = request.args.get('batch_id')
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        # Id de outra execução do processo (ou inválido): recomeçar do estado atual (snapshot inicial)
+        resumed_seq = event_bus.parse_event_id(last_event_id) if last_event_id else None
+        resync = bool(last_event_id) and resumed_seq is None
+        last_seq = resumed_seq if resumed_seq is not None else event_bus.last_seq
+        terminal_events = ('task_completed', 'task_failed', 'task_cancelled')
+        # Pedido anexado: os eventos são os da tarefa que o atende
+        watched_id = queue_manager.split_task_id(task_id)[0] if task_id else None
+
+        if task_id and not queue_manager.get_task(task_id):
+            return jsonify({'error': 'Tarefa não encontrada'}), 404
+
+        def format_event(event_type, payload, seq=None):
+            prefix = f"id: {event_bus.event_id(seq)}\n" if seq is not None else ''
+            return f"{prefix}event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        def snapshot():
+            payload = {'counts': queue_manager.get_status_counts()}
+            if task_id:
+                task = queue_manager.get_task(task_id)
+                payload['task'] = task.to_dict() if task else None
+            return payload
+
+        def generate():
+            cursor = last_seq
+            with event_bus.subscription():
+                yield 'retry: 3000\n\n'
+                initial = snapshot()
+                # resync: o Last-Event-ID não pôde ser retomado, o snapshot substitui o estado do cliente
+                yield format_event('snapshot', {**initial, 'resync': resync}, cursor)
+                if task_id and initial['task'] and initial['task']['status'] in ('completed', 'failed'):
+                    return
+
+                while True:
+                    events, lagged = event_bus.wait_for_events(cursor)
+                    if lagged:
+                        # Eventos perdidos (ou cursor de antes de um reinício): mandar o estado
+                        # atual inteiro e seguir a partir dos eventos devolvidos
+                        cursor = events[0]['seq'] - 1 if events else min(cursor, event_bus.last_seq)
+                        yield format_event('snapshot', snapshot(), cursor)
+                    if not events:
+                        yield ': keep-alive\n\n'
+                        continue
+
+                    for event in events:
+                        cursor = event['seq']
+                        task_data = event['data']['task']
+                        if task_id and task_data['id'] != watched_id:
+                            continue
+                        if batch_id and task_data.get('batch_id') != batch_id:
+                            continue
+                        payload = dict(event['data'])
+                        if task_id and event['type'] in ('task_waiter_cancelled', 'task_owner_cancelled'):
+                            # Só encerra o stream do próprio pedido desanexado
+                            task = queue_manager.get_task(task_id)
+                            if task is None or task.status.value != 'failed':
+                                continue
+                            payload['task'] = task.to_dict()
+                            yield format_event('task_cancelled', payload, cursor)
+                            return
+                        if task_id and event['type'] in terminal_events:
+                            # Stream de uma tarefa: o evento final leva o resultado completo
+                            task = queue_manager.get_task(task_id)
+                            payload['task'] = task.to_dict() if task else task_data
+                        yield format_event(event['type'], payload, cursor)
+                        if task_id and event['type'] in terminal_events:
+                            return
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @main_bp.route('/queue/task/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     """Retorna status de uma tarefa específica"""
@@ -1209,6 +1472,42 @@ def get_platform_stats(platform):
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@main_bp.route('/monitoring/transport', methods=['GET'])
+def get_transport_stats():
+    """Retorna estatísticas dos pools de conexão HTTP (reuso de conexões keep-alive)"""
+    try:
+        from .anti_bot import http_transport, rate_limiter
+        return jsonify({
+            'success': True,
+            'transport': http_transport.get_stats(),
+            'rate_limits': rate_limiter.get_stats()
+        })
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@main_bp.route('/monitoring/database', methods=['GET'])
+def get_database_stats():
+    """Retorna métricas do buffer de gravação e do espelho local das promoções"""
+    try:
+        buffer = database.promocoes_buffer
+        mirror = database.promocoes_mirror
+        return jsonify({
+            'success': True,
+            'write_buffer': buffer.get_stats() if buffer is not None else None,
+            'mirror': mirror.get_stats() if mirror is not None else None
+        })
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@main_bp.route('/monitoring/selectors', methods=['GET'])
+def get_selector_stats():
+    """Retorna taxa de acerto de cada seletor (quedas indicam mudança de layout)"""
+    try:
+        from .selectors import selector_ranking
+        return jsonify({'success': True, 'selectors': selector_ranking.get_stats()})
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @main_bp.route('/cache/stats', methods=['GET'])
 def get_cache_stats():
     """Retorna estatísticas do cache"""
@@ -1218,7 +1517,8 @@ def get_cache_stats():
         return jsonify({
             'success': True,
             'cache_stats': stats,
-            'memory_usage': memory_usage
+            'memory_usage': memory_usage,
+            'product_identity': cached_product_scraper.get_stats()
         })
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
@@ -74,7 +74,10 @@ class MessageScheduler:
 
         try:
             # Buscar produtos agendados
-            produtos = database.listar_produtos_db('agendado', 'asc')
+            produtos = database.listar_produtos_db(
+                'agendado', 'asc',
+                columns="id,titulo,agendamento,final_message,imagem_url,processed_image_url"
+            )
 
             if not produtos:
                 return
@@ -93,6 +96,15 @@ class MessageScheduler:
 
                     # Verificar se já passou do horário agendado
                     if now >= agendamento_dt:
+                        # A lista vem do espelho local: confirmar no Supabase que o produto
+                        # ainda existe e continua agendado (pode ter mudado fora do processo)
+                        produto = database.obter_produto_db(produto['id'], usar_espelho=False)
+                        if not produto or not produto.get('agendamento'):
+                            continue
+                        agendamento_atual = datetime.fromisoformat(produto['agendamento'].replace('Z', '+00:00'))
+                        if now < agendamento_atual.astimezone(self.timezone):
+                            continue
+
                         logger.info(f'⏰ Horário atingido para produto: {produto.get("titulo", "")[:50]}...')
 
                         # Enviar mensagem
@@ -189,8 +201,8 @@ class MessageScheduler:
         from . import database
 
         try:
-            # Buscar produto
-            produto = database.obter_produto_db(produto_id)
+            # Buscar produto (direto no Supabase: o envio não pode usar uma cópia desatualizada)
+            produto = database.obter_produto_db(produto_id, usar_espelho=False)
 
             if not produto:
                 return {'success': False, 'error': 'Produto não encontrado'}
@@ -2,12 +2,16 @@ import logging
 import time
 import re
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Dict, Iterator, List, Optional, Any
 from .config import ScrapingConfig
 from .anti_bot import AntiBotManager
 from .selectors import AdaptiveSelector
 from .validators import product_validator
-from .cache_manager import cached_scraper
+from .cache_manager import cache_manager, cached_product_scraper
+from .product_identity import ML_PRODUCT_URL_PATTERN, extract_ml_id, extract_asin, is_short_link, ml_canonical_url
+from .structured_data import extract_structured_product, has_required_fields
+from .monitoring import metrics_collector
 from . import amazon_scraping
 
 logger = logging.getLogger(__name__)
@@ -27,18 +31,103 @@ class BaseScraper(ABC):
     def scrape_search(self, query: str, max_pages: int = 2) -> List[Dict[str, Any]]:
         pass
 
+    # Nome exibido da plataforma e valores que indicam campo não extraído
+    PLATFORM_NAME = ''
+    MISSING_VALUES = {
+        'titulo': "Produto sem título",
+        'preco_atual': "Preço não disponível",
+        'preco_original': None,
+        'imagem': "",
+        'loja': ""
+    }
+
+    # Pool de processos para extração/validação (modo pipeline da fila); None = no próprio processo
+    parse_pool = None
+
     def _validate_and_sanitize(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
         return product_validator.validate_product(product_data)
 
+    def _extract_validated(self, html: str, url: str, affiliate_link: str) -> Dict[str, Any]:
+        """Extrai e valida o produto; com parse_pool, o trabalho de CPU roda em outro processo"""
+        if self.parse_pool is not None:
+            return self.parse_pool.extract_product(self.platform, html, url, affiliate_link)
+        return self._validate_and_sanitize(self._extract_product(html, url, affiliate_link))
+
+    def _is_incomplete(self, product_data: Dict[str, Any]) -> bool:
+        return (product_data.get('titulo') == self.MISSING_VALUES['titulo'] or
+                product_data.get('preco_atual') == self.MISSING_VALUES['preco_atual'])
+
+    def _default_affiliate_link(self, url: str, affiliate_link: str) -> str:
+        return affiliate_link or url
+
+    def _structured_item_id(self, url: str) -> Optional[str]:
+        """Id do anúncio principal nos dados estruturados da página (None: casar só pelo preço)"""
+        return None
+
+    @abstractmethod
+    def _extract_product_data(self, soup, url: str, affiliate_link: str) -> Dict[str, Any]:
+        """Extrai o produto do DOM (usado quando os dados estruturados não bastam)"""
+        pass
+
+    def _extract_product(self, html: str, url: str, affiliate_link: str) -> Dict[str, Any]:
+        """Extrai o produto dos dados estruturados da página; monta o DOM só se faltar campo obrigatório"""
+        structured = extract_structured_product(html, self._structured_item_id(url))
+        if has_required_fields(structured):
+            metrics_collector.record_extraction_path(self.platform, fast_path=True)
+            return {
+                'titulo': structured['titulo'],
+                'link': url,
+                'afiliado_link': self._default_affiliate_link(url, affiliate_link),
+                'preco_atual': structured['preco_atual'],
+                'preco_original': structured.get('preco_original'),
+                'imagem': structured['imagem'],
+                'fonte': self.PLATFORM_NAME,
+                'plataforma': self.PLATFORM_NAME,
+                'loja': structured.get('loja', "")
+            }
+
+        metrics_collector.record_extraction_path(self.platform, fast_path=False)
+        product_data = self._extract_product_data(self.selector.parse(html), url, affiliate_link)
+
+        # Completar o que o DOM não trouxe com o que veio dos dados estruturados
+        for field, missing in self.MISSING_VALUES.items():
+            if product_data.get(field, missing) == missing and structured.get(field):
+                product_data[field] = structured[field]
+        return product_data
+
+    def resolve_product_url(self, url: str) -> str:
+        """Resolve links curtos para a URL do produto (usado pelas chaves canônicas do cache)"""
+        return url
+
 class MercadoLivreScraper(BaseScraper):
+    PLATFORM_NAME = 'Mercado Livre'
+    # Redirects de links de afiliado não mudam: manter resolução por 7 dias
+    REDIRECT_CACHE_TTL = 7 * 24 * 3600
+
     def __init__(self):
         super().__init__('mercadolivre')
 
+    def _structured_item_id(self, url: str) -> Optional[str]:
+        return extract_ml_id(url)
+
     def _extract_real_affiliate_link(self, affiliate_url: str) -> tuple[str, str]:
         """
         Extrai o link real do produto seguindo o link de afiliado
         Retorna (product_url, real_affiliate_link)
         """
+        # v2: URLs de catálogo deixaram de ser reescritas como anúncio
+        cache_key = f"ml_redirect:v2:{affiliate_url}"
+        cached_product_url = cache_manager.get(cache_key)
+        if cached_product_url:
+            return (cached_product_url, affiliate_url)
+
+        product_url, real_affiliate_link = self._follow_affiliate_redirects(affiliate_url)
+        if extract_ml_id(product_url):
+            cache_manager.set(cache_key, product_url, self.REDIRECT_CACHE_TTL)
+        return (product_url, real_affiliate_link)
+
+    def _follow_affiliate_redirects(self, affiliate_url: str) -> tuple[str, str]:
+        """Segue os redirects do link de afiliado (sem cache)"""
         try:
             logger.info(f"🔗 Extraindo link real de afiliado: {affiliate_url[:80]}...")
 
@@ -62,15 +151,11 @@ class MercadoLivreScraper(BaseScraper):
             logger.info(f"📍 URL final após redirects: {final_url[:80]}...")
 
             # Verificar se chegou em uma página de produto
-            if '/p/MLB' in final_url or re.search(r'/MLB\d+', final_url):
-                # Extrair ID do produto
-                product_match = re.search(r'(MLB\d+)', final_url)
-                if product_match:
-                    product_id = product_match.group(1)
-                    logger.info(f"✅ Produto encontrado: {product_id}")
-
-                    # Construir URL limpa do produto
-                    product_url = f"https://produto.mercadolivre.com.br/{product_id}"
+            if ML_PRODUCT_URL_PATTERN.search(final_url):
+                # Construir URL limpa do produto (catálogo continua catálogo)
+                product_url = ml_canonical_url(final_url)
+                if product_url:
+                    logger.info(f"✅ Produto encontrado: {product_url}")
 
                     # Usar o link de afiliado original para compartilhamento
                     return (product_url, affiliate_url)
@@ -85,22 +170,18 @@ class MercadoLivreScraper(BaseScraper):
 
                 if 'ref' in params:
                     ref_url = unquote(params['ref'][0])
-                    product_match = re.search(r'(MLB\d+)', ref_url)
-                    if product_match:
-                        product_id = product_match.group(1)
-                        product_url = f"https://produto.mercadolivre.com.br/{product_id}"
-                        logger.info(f"✅ Produto extraído do ref: {product_id}")
+                    product_url = ml_canonical_url(ref_url)
+                    if product_url:
+                        logger.info(f"✅ Produto extraído do ref: {product_url}")
                         return (product_url, affiliate_url)
 
                 # Tentar buscar no histórico de redirects
                 if hasattr(response, 'history') and response.history:
                     for resp in response.history:
-                        if '/p/MLB' in resp.url or re.search(r'/MLB\d+', resp.url):
-                            product_match = re.search(r'(MLB\d+)', resp.url)
-                            if product_match:
-                                product_id = product_match.group(1)
-                                product_url = f"https://produto.mercadolivre.com.br/{product_id}"
-                                logger.info(f"✅ Produto encontrado no histórico: {product_id}")
+                        if ML_PRODUCT_URL_PATTERN.search(resp.url):
+                            product_url = ml_canonical_url(resp.url)
+                            if product_url:
+                                logger.info(f"✅ Produto encontrado no histórico: {product_url}")
                                 return (product_url, affiliate_url)
 
             # Se não conseguiu extrair, retornar a URL final
@@ -118,7 +199,7 @@ class MercadoLivreScraper(BaseScraper):
         """
         try:
             # Se for link de afiliado, usar método especializado
-            if 'mercadolivre.com/sec/' in url or 'mercadolivre.com.br/sec/' in url or '/s/c/' in url:
+            if is_short_link(url):
                 product_url, _ = self._extract_real_affiliate_link(url)
                 return product_url
 
@@ -127,13 +208,14 @@ class MercadoLivreScraper(BaseScraper):
             logger.warning(f"Erro ao seguir redirect: {e}. Usando URL original.")
             return url
 
-    @cached_scraper
+    def resolve_product_url(self, url: str) -> str:
+        return self._follow_redirect_if_needed(url)
+
+    @cached_product_scraper
     def scrape_product(self, url: str, affiliate_link: str = "") -> Optional[Dict[str, Any]]:
         try:
             # Determinar se a URL fornecida é um link de afiliado
-            is_affiliate_link = ('mercadolivre.com/sec/' in url or
-                               'mercadolivre.com.br/sec/' in url or
-                               '/s/c/' in url)
+            is_affiliate_link = is_short_link(url)
 
             # Se for link de afiliado, extrair URL do produto E manter link de afiliado
             if is_affiliate_link:
@@ -151,62 +233,64 @@ class MercadoLivreScraper(BaseScraper):
 
             # Tentar primeiro com requisição direta (ML geralmente permite)
             response = self.anti_bot.make_request(final_url)
-            from bs4 import BeautifulSoup
             # Usar response.text em vez de response.content para lidar com encoding/compression
-            soup = BeautifulSoup(response.text, 'html.parser')
-            if not soup:
+            if not response.text:
                 logger.error("Página de produto não encontrada")
                 return None
-            product_data = self._extract_product_data(soup, final_url, affiliate_to_use)
+            product_data = self._extract_validated(response.text, final_url, affiliate_to_use)
 
             # Verificar se conseguiu extrair dados válidos
-            if product_data.get('titulo') == 'Produto sem título' or product_data.get('preco_atual') == 'Preço não disponível':
+            if self._is_incomplete(product_data):
                 logger.warning("Dados incompletos. Tentando via ScraperAPI...")
                 try:
                     response = self.anti_bot.make_request_via_api(final_url)
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    product_data = self._extract_product_data(soup, final_url, affiliate_to_use)
+                    product_data = self._extract_validated(response.text, final_url, affiliate_to_use)
                 except Exception as api_error:
                     logger.error(f"ScraperAPI também falhou: {api_error}")
 
-            return self._validate_and_sanitize(product_data)
+            return product_data
         except Exception as e:
             logger.error(f"Erro ao fazer scraping do produto ML: {e}")
             return None
 
     def scrape_search(self, query: str, max_pages: int = 2) -> List[Dict[str, Any]]:
         products = []
-        query_formatted = query.replace(' ', '-')
         for page in range(1, max_pages + 1):
             try:
-                if page == 1:
-                    url = f"{self.config['base_url']}/{query_formatted}"
-                else:
-                    offset = (page - 1) * self.config['pagination']['step']
-                    url = f"{self.config['base_url']}/{query_formatted}_Desde_{offset + 1}"
+                url = self._search_page_url(query, page)
                 # Usar requisição direta primeiro
                 response = self.anti_bot.make_request(url)
-                from bs4 import BeautifulSoup
                 # Usar response.text em vez de response.content para lidar com encoding/compression
-                soup = BeautifulSoup(response.text, 'html.parser')
-                if not soup:
+                if not response.text:
                     break
-                product_items = self.selector.find_elements(soup, 'product_items')
-                for item in product_items:
-                    try:
-                        product_data = self._extract_search_item_data(item)
-                        if product_data:
-                            validated_data = self._validate_and_sanitize(product_data)
-                            products.append(validated_data)
-                    except Exception as e:
-                        logger.warning(f"Erro ao processar item da busca: {e}")
-                        continue
+                products.extend(self._parse_search_page(response.text))
                 time.sleep(self.anti_bot.get_page_delay())
             except Exception as e:
                 logger.error(f"Erro na página {page} da busca ML: {e}")
                 break
         return products
 
+    def _parse_search_page(self, html: str) -> List[Dict[str, Any]]:
+        """Extrai e valida os produtos de uma página de resultados de busca"""
+        products = []
+        soup = self.selector.parse_search_results(html)
+        for item in self.selector.find_elements(soup, 'product_items'):
+            try:
+                product_data = self._extract_search_item_data(item)
+                if product_data:
+                    products.append(self._validate_and_sanitize(product_data))
+            except Exception as e:
+                logger.warning(f"Erro ao processar item da busca: {e}")
+                continue
+        return products
+
+    def _search_page_url(self, query: str, page: int) -> str:
+        query_formatted = query.replace(' ', '-')
+        if page == 1:
+            return f"{self.config['base_url']}/{query_formatted}"
+        offset = (page - 1) * self.config['pagination']['step']
+        return f"{self.config['base_url']}/{query_formatted}_Desde_{offset + 1}"
+
     def _extract_product_data(self, soup, url: str, affiliate_link: str) -> Dict[str, Any]:
         title_elem = self.selector.find_element(soup, 'title')
         title = title_elem.get_text(strip=True) if title_elem else "Produto sem título"
@@ -325,31 +409,33 @@ class MercadoLivreScraper(BaseScraper):
         }
 
 class AmazonScraper(BaseScraper):
+    PLATFORM_NAME = 'Amazon'
+
     def __init__(self):
         super().__init__('amazon')
 
+    @cached_product_scraper
     def scrape_product(self, url: str, affiliate_link: str = "") -> Optional[Dict[str, Any]]:
         try:
             response = self.anti_bot.make_request_via_api(url)
-            from bs4 import BeautifulSoup
             # Usar response.text em vez de response.content para lidar com encoding/compression
-            soup = BeautifulSoup(response.text, 'html.parser')
-            if not soup:
+            if not response.text:
                 logger.error("Página de produto não encontrada via API")
                 return None
-            product_data = self._extract_product_data(soup, url, affiliate_link)
-            if (product_data.get('titulo') == 'Produto sem título' or
-                product_data.get('preco_atual') == 'Preço não disponível'):
+            product_data = self._extract_validated(response.text, url, affiliate_link)
+            if self._is_incomplete(product_data):
                 logger.warning("Não foi possível extrair dados completos, mesmo com a API.")
                 return self._create_fallback_product(url, affiliate_link)
-            return self._validate_and_sanitize(product_data)
+            return product_data
         except Exception as e:
             logger.error(f"Erro ao fazer scraping do produto Amazon via API: {e}")
             return self._create_fallback_product(url, affiliate_link)
 
+    def _default_affiliate_link(self, url: str, affiliate_link: str) -> str:
+        return affiliate_link or self._generate_affiliate_link(url)
+
     def _create_fallback_product(self, url: str, affiliate_link: str) -> Dict[str, Any]:
-        asin_match = re.search(r'/dp/([A-Z0-9]{10})', url)
-        asin = asin_match.group(1) if asin_match else "UNKNOWN"
+        asin = extract_asin(url) or "UNKNOWN"
         product_data = {
             'titulo': f"Produto Amazon {asin}",
             'link': url,
@@ -432,9 +518,14 @@ class ScraperFactory:
     }
 
     @classmethod
-    def create_scraper(cls, platform: str) -> Optional[BaseScraper]:
+    def create_scraper(cls, platform: str, engine: str = 'threaded') -> Optional[BaseScraper]:
+        """Cria o scraper da plataforma; engine='async' usa o engine asyncio (app/async_engine.py)"""
         platform = platform.lower()
         if platform in cls._scrapers:
+            if engine == 'async':
+                # Importar aqui para evitar dependência circular
+                from .async_engine import AsyncScraper
+                return AsyncScraper(platform)
             return cls._scrapers[platform]()
         logger.error(f"Scraper não encontrado para plataforma: {platform}")
         return None
@@ -445,4 +536,73 @@ class ScraperFactory:
 
     @classmethod
     def detect_platform_from_url(cls, url: str) -> Optional[str]:
-        return ScrapingConfig.detect_platform(url)
\ No newline at end of file
+        return ScrapingConfig.detect_platform(url)
+
+    @classmethod
+    def _search_platform(cls, platform: str, query: str, max_pages: int) -> Dict[str, Any]:
+        """Executa a busca em uma única plataforma (usado pelo fan-out)"""
+        start_time = time.time()
+        scraper = cls.create_scraper(platform)
+        if not scraper:
+            raise Exception(f"Scraper não encontrado para plataforma: {platform}")
+        products = scraper.scrape_search(query, max_pages)
+        return {
+            'platform': platform,
+            'success': True,
+            'products': products,
+            'response_time': time.time() - start_time,
+            'error': None
+        }
+
+    @classmethod
+    def search_all_platforms(cls, query: str, max_pages: int = 2,
+                             timeout: Optional[float] = None,
+                             platforms: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Busca em várias plataformas em paralelo, entregando cada resultado assim que termina.
+
+        Cada plataforma tem o mesmo prazo (timeout, em segundos, contado a partir do
+        disparo). Plataformas que estouram o prazo ou falham são entregues com
+        success=False, sem bloquear as que já terminaram.
+        """
+        platforms = platforms or cls.get_available_platforms()
+        if timeout is None:
+            timeout = ScrapingConfig.SEARCH_CONFIG['platform_timeout']
+
+        executor = ThreadPoolExecutor(max_workers=max(1, len(platforms)))
+        start_time = time.time()
+        futures = {
+            executor.submit(cls._search_platform, platform, query, max_pages): platform
+            for platform in platforms
+        }
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                pending.discard(future)
+                platform = futures[future]
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error(f"Erro na busca em {platform}: {e}")
+                    yield {
+                        'platform': platform,
+                        'success': False,
+                        'products': [],
+                        'response_time': time.time() - start_time,
+                        'error': str(e)
+                    }
+        except FuturesTimeoutError:
+            for future in pending:
+                future.cancel()
+                platform = futures[future]
+                logger.warning(f"Busca em {platform} excedeu o prazo de {timeout}s")
+                yield {
+                    'platform': platform,
+                    'success': False,
+                    'products': [],
+                    'response_time': time.time() - start_time,
+                    'error': f'Tempo limite de {timeout}s excedido'
+                }
+        finally:
+            # Não esperar buscas atrasadas: elas terminam em segundo plano
+            executor.shutdown(wait=False)
\ No newline at end of file
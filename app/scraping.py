@@ -3,7 +3,7 @@
 import os
 from dotenv import load_dotenv
 import requests
-from bs4 import BeautifulSoup
+from .html_parser import parse_html, parse_search_results
 import time
 import re
 
@@ -63,7 +63,7 @@ def scrape_produto_especifico(url):
         r = requests.get(url, headers=headers, proxies=proxies, timeout=20)
         r.raise_for_status()
 
-        site = BeautifulSoup(r.content, 'html.parser')
+        site = parse_html(r.content, 'mercadolivre')
 
         # Detectar se redirecionou para página social e extrair link real do produto
         if '/social/' in r.url and '/social/' not in url:
@@ -84,7 +84,7 @@ def scrape_produto_especifico(url):
                         # Fazer nova requisição para o produto real
                         r = requests.get(product_link, headers=headers, proxies=proxies, timeout=20)
                         r.raise_for_status()
-                        site = BeautifulSoup(r.content, 'html.parser')
+                        site = parse_html(r.content, 'mercadolivre')
                         url = product_link
                         break
 
@@ -395,7 +395,7 @@ def scrape_mercadolivre(produto, max_pages=3):
             # headers com cookie são usados aqui
             r = requests.get(url_final, headers=headers, proxies=proxies, timeout=20)
             if r.status_code != 200: break
-            site = BeautifulSoup(r.content, 'html.parser')
+            site = parse_search_results(r.content, 'mercadolivre')
             produtos_encontrados = site.select('li.ui-search-layout__item')
             if not produtos_encontrados: break
             for produto_elem in produtos_encontrados:
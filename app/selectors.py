@@ -2,19 +2,218 @@
 """
 Sistema de seletores adaptativos para mudanças de layout
 """
+import os
+import json
+import time
+import atexit
 import logging
-from typing import Dict, List
+import threading
+from typing import Any, Dict, List, Optional, Union
+import soupsieve
 from .config import ScrapingConfig
+from .html_parser import get_backend, parse_html, parse_search_results
 
 logger = logging.getLogger(__name__)
 
+# Seletores CSS compilados (soupsieve), compartilhados por todas as instâncias
+_compiled_selectors: Dict[str, Any] = {}
+_compile_lock = threading.Lock()
+
+def compile_selector(selector: str):
+    """Compila o seletor uma única vez; retorna None se for inválido"""
+    try:
+        return _compiled_selectors[selector]
+    except KeyError:
+        pass
+    with _compile_lock:
+        if selector not in _compiled_selectors:
+            try:
+                _compiled_selectors[selector] = soupsieve.compile(selector)
+            except Exception as e:
+                logger.warning(f"Seletor inválido ignorado {selector}: {e}")
+                _compiled_selectors[selector] = None
+        return _compiled_selectors[selector]
+
+class SelectorRanking:
+    """Taxa de acerto por seletor e ordem aprendida dos candidatos
+
+    A ordem configurada expressa precedência (seletores específicos antes
+    dos genéricos), então ela é mantida enquanto o seletor funciona. Um
+    seletor que, depois de min_attempts tentativas, acerta menos que
+    min_hit_rate vai para o fim da lista: o seletor que está vencendo passa
+    a ser tentado primeiro, e o rebaixado continua sendo testado no fim
+    para poder voltar. As estatísticas são salvas em JSON e recarregadas
+    no próximo start.
+
+    Nos processos do pool de parsing (enable_deltas), as tentativas também
+    são acumuladas à parte; drain_deltas() as devolve junto com o produto e
+    o processo principal as soma com merge_deltas().
+    """
+
+    DECAY_AFTER = 1000
+
+    def __init__(self, path: Optional[str] = None, min_attempts: int = 20,
+                 min_hit_rate: float = 0.1, save_interval: float = 60):
+        self.path = path
+        self.min_attempts = min_attempts
+        self.min_hit_rate = min_hit_rate
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        # (plataforma, elemento) -> seletor -> {'attempts', 'hits', 'last_hit_at'}
+        self.stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._dirty = False
+        self._last_save = time.time()
+        # Tentativas ainda não devolvidas ao processo principal (só nos processos do pool)
+        self._deltas: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+        self._load()
+        if self.path:
+            atexit.register(self.save)
+
+    @staticmethod
+    def _key(platform: str, element_type: str) -> str:
+        return f"{platform}:{element_type}"
+
+    def _is_demoted(self, stats: Optional[Dict[str, Any]]) -> bool:
+        if not stats or stats['attempts'] < self.min_attempts:
+            return False
+        return stats['hits'] / stats['attempts'] < self.min_hit_rate
+
+    def order(self, platform: str, element_type: str, selectors: List[str]) -> List[str]:
+        """Retorna os seletores na ordem de tentativa: ativos na ordem configurada, rebaixados no fim"""
+        with self.lock:
+            element_stats = self.stats.get(self._key(platform, element_type), {})
+            active = [s for s in selectors if not self._is_demoted(element_stats.get(s))]
+            demoted = [s for s in selectors if self._is_demoted(element_stats.get(s))]
+        return active + demoted
+
+    @staticmethod
+    def _add(stats_by_key: Dict[str, Dict[str, Dict[str, Any]]], key: str, selector: str,
+             attempts: int, hits: int, last_hit_at: Optional[float]) -> Dict[str, Any]:
+        stats = stats_by_key.setdefault(key, {}).setdefault(selector, {'attempts': 0, 'hits': 0, 'last_hit_at': None})
+        stats['attempts'] += attempts
+        stats['hits'] += hits
+        if last_hit_at and (stats['last_hit_at'] or 0) < last_hit_at:
+            stats['last_hit_at'] = last_hit_at
+        return stats
+
+    def _apply(self, key: str, selector: str, attempts: int, hits: int, last_hit_at: Optional[float]):
+        """Soma tentativas às estatísticas (deve ser chamada com lock)"""
+        stats = self.stats.get(key, {}).get(selector)
+        if stats and stats['attempts'] >= self.DECAY_AFTER:
+            # Decaimento: o histórico antigo perde peso e mudanças de layout aparecem rápido
+            stats['attempts'] //= 2
+            stats['hits'] //= 2
+        self._add(self.stats, key, selector, attempts, hits, last_hit_at)
+        self._dirty = True
+
+    def _save_if_due(self):
+        with self.lock:
+            should_save = self.path and time.time() - self._last_save >= self.save_interval
+        if should_save:
+            self.save()
+
+    def record(self, platform: str, element_type: str, selector: str, hit: bool):
+        """Registra o resultado de uma tentativa do seletor"""
+        key = self._key(platform, element_type)
+        last_hit_at = time.time() if hit else None
+        with self.lock:
+            self._apply(key, selector, 1, int(hit), last_hit_at)
+            if self._deltas is not None:
+                self._add(self._deltas, key, selector, 1, int(hit), last_hit_at)
+        self._save_if_due()
+
+    def enable_deltas(self):
+        """Processo do pool: passa a acumular as tentativas para devolvê-las ao principal"""
+        with self.lock:
+            self._deltas = {}
+
+    def drain_deltas(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Retorna e zera as tentativas acumuladas desde a última chamada"""
+        with self.lock:
+            if not self._deltas:
+                return {}
+            drained, self._deltas = self._deltas, {}
+            return drained
+
+    def merge_deltas(self, deltas: Dict[str, Dict[str, Dict[str, Any]]]):
+        """Soma as tentativas registradas em outro processo (pool de parsing)"""
+        if not deltas:
+            return
+        with self.lock:
+            for key, element_deltas in deltas.items():
+                for selector, delta in element_deltas.items():
+                    self._apply(key, selector, delta['attempts'], delta['hits'], delta['last_hit_at'])
+        self._save_if_due()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+            logger.info(f"Estatísticas de seletores carregadas de {self.path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Não foi possível carregar estatísticas de seletores: {e}")
+
+    def save(self):
+        """Grava as estatísticas (escrita atômica via arquivo temporário)"""
+        if not self.path:
+            return
+        with self.lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self.stats, ensure_ascii=False)
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Erro ao salvar estatísticas de seletores: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna taxa de acerto por seletor (quedas bruscas indicam mudança de layout)"""
+        with self.lock:
+            result = {}
+            for key, element_stats in self.stats.items():
+                result[key] = {
+                    selector: {
+                        **stats,
+                        'hit_rate': round(stats['hits'] / stats['attempts'] * 100, 2) if stats['attempts'] else 0,
+                        'demoted': self._is_demoted(stats)
+                    }
+                    for selector, stats in element_stats.items()
+                }
+            return result
+
+selector_ranking = SelectorRanking(
+    path=ScrapingConfig.SELECTOR_CONFIG['stats_path'],
+    min_attempts=ScrapingConfig.SELECTOR_CONFIG['min_attempts'],
+    min_hit_rate=ScrapingConfig.SELECTOR_CONFIG['min_hit_rate']
+)
+
 class AdaptiveSelector:
     """Sistema de seletores adaptativos para mudanças de layout"""
 
-    def __init__(self, platform: str):
+    def __init__(self, platform: str, ranking: Optional[SelectorRanking] = None):
         self.platform = platform
         self.config = ScrapingConfig.get_platform_config(platform)
         self.fallback_selectors = self._get_fallback_selectors()
+        self.parser_backend = get_backend(platform)
+        self.ranking = ranking or selector_ranking
+
+    def parse(self, markup: Union[str, bytes], **kwargs):
+        """Faz o parse da página com o backend HTML configurado para a plataforma"""
+        return parse_html(markup, self.platform, **kwargs)
+
+    def parse_search_results(self, markup: Union[str, bytes]):
+        """Faz o parse só dos itens de resultado de uma página de busca"""
+        return parse_search_results(markup, self.platform)
 
     def _get_fallback_selectors(self) -> Dict[str, List[str]]:
         """Retorna seletores alternativos para cada elemento"""
@@ -57,22 +256,29 @@ class AdaptiveSelector:
         
         return fallbacks.get(self.platform, {})
     
-    def find_element(self, soup, element_type: str, required: bool = True):
-        """Encontra elemento usando seletores adaptativos"""
+    def _candidate_selectors(self, element_type: str) -> List[str]:
+        """Seletor da configuração + alternativos, sem repetição, na ordem aprendida"""
         selectors = []
         if self.config and 'selectors' in self.config and element_type in self.config['selectors']:
              selectors.append(self.config['selectors'].get(element_type, ''))
         selectors.extend(self.fallback_selectors.get(element_type, []))
-        
-        for selector in selectors:
-            if not selector: continue
+        selectors = list(dict.fromkeys(s for s in selectors if s))
+        return self.ranking.order(self.platform, element_type, selectors)
+
+    def find_element(self, soup, element_type: str, required: bool = True):
+        """Encontra elemento usando seletores adaptativos"""
+        for selector in self._candidate_selectors(element_type):
+            compiled = compile_selector(selector)
+            if compiled is None:
+                continue
             try:
-                element = soup.select_one(selector)
-                if element:
-                    return element
+                element = compiled.select_one(soup)
             except Exception as e:
                 logger.warning(f"Erro ao usar seletor {selector}: {e}")
                 continue
+            self.ranking.record(self.platform, element_type, selector, element is not None)
+            if element:
+                return element
         
         if required:
             logger.error(f"Elemento {element_type} não encontrado com nenhum seletor")
@@ -81,23 +287,23 @@ class AdaptiveSelector:
     
     def find_elements(self, soup, element_type: str) -> List:
         """Encontra múltiplos elementos usando seletores adaptativos"""
-        selectors = []
-        if self.config and 'selectors' in self.config and element_type in self.config['selectors']:
-             selectors.append(self.config['selectors'].get(element_type, ''))
-        selectors.extend(self.fallback_selectors.get(element_type, []))
+        selectors = self._candidate_selectors(element_type)
 
         logger.debug(f"Procurando elementos tipo '{element_type}' com seletores: {selectors}")
 
         for selector in selectors:
-            if not selector: continue
+            compiled = compile_selector(selector)
+            if compiled is None:
+                continue
             try:
-                elements = soup.select(selector)
-                logger.debug(f"Seletor '{selector}' encontrou {len(elements)} elementos")
-                if elements:
-                    return elements
+                elements = compiled.select(soup)
             except Exception as e:
                 logger.warning(f"Erro ao usar seletor {selector}: {e}")
                 continue
+            logger.debug(f"Seletor '{selector}' encontrou {len(elements)} elementos")
+            self.ranking.record(self.platform, element_type, selector, bool(elements))
+            if elements:
+                return elements
 
         logger.warning(f"Nenhum elemento encontrado para tipo '{element_type}'")
-        return []
\ No newline at end of file
+        return []
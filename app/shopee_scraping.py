@@ -3,7 +3,7 @@
 import os
 from dotenv import load_dotenv
 import requests
-from bs4 import BeautifulSoup
+from .html_parser import parse_html
 import time
 import re
 import json
@@ -69,7 +69,7 @@ def scrape_produto_shopee_especifico(url):
         r = requests.get(url, headers=shopee_headers, proxies=use_proxies, timeout=30)
         r.raise_for_status()
 
-        site = BeautifulSoup(r.content, 'html.parser')
+        site = parse_html(r.content, 'shopee')
         produto_info = {'link': url}
 
         # Tentativa 1: JSON-LD
@@ -0,0 +1,233 @@
+# /app/structured_data.py
+"""
+Extração de dados estruturados (JSON-LD e __PRELOADED_STATE__) direto do HTML bruto
+
+As páginas de produto do Mercado Livre e da Amazon embutem os dados do
+produto em blocos JSON. Localizar esses blocos com regex e decodificar só o
+JSON é muito mais barato que montar o DOM da página inteira; o parse
+completo fica para quando faltarem campos obrigatórios.
+"""
+
+import re
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JSON_LD_PATTERN = re.compile(
+    r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+PRELOADED_STATE_MARKER = '__PRELOADED_STATE__'
+
+# Campos que precisam estar presentes para dispensar o parse do DOM
+REQUIRED_FIELDS = ('titulo', 'preco_atual', 'imagem')
+
+# priceType (schema.org) que indicam preço de lista / "de" riscado
+LIST_PRICE_TYPES = ('ListPrice', 'StrikethroughPrice', 'SRP', 'MSRP')
+
+# Id de anúncio do Mercado Livre nos nós do estado pré-carregado
+ML_ITEM_ID_PATTERN = re.compile(r'^MLB-?\d+$', re.IGNORECASE)
+
+# Limite de nós visitados ao procurar campos no estado pré-carregado (que pode ter vários MB)
+MAX_STATE_NODES = 50000
+
+def format_price_brl(value: Any) -> Optional[str]:
+    """Formata um valor numérico como 'R$ 1.234,56'"""
+    try:
+        number = float(str(value).replace(',', '.')) if isinstance(value, str) else float(value)
+    except (TypeError, ValueError):
+        return None
+    if number <= 0:
+        return None
+    return f"R$ {number:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def _iter_json_ld(html: str) -> Iterator[Any]:
+    for match in JSON_LD_PATTERN.finditer(html):
+        try:
+            yield json.loads(match.group(1).strip())
+        except (json.JSONDecodeError, ValueError):
+            continue
+
+def _find_product_node(data: Any) -> Optional[Dict[str, Any]]:
+    """Procura o nó @type=Product em um bloco JSON-LD (objeto, lista ou @graph)"""
+    if isinstance(data, list):
+        for item in data:
+            node = _find_product_node(item)
+            if node:
+                return node
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    node_type = data.get('@type')
+    types = node_type if isinstance(node_type, list) else [node_type]
+    if 'Product' in types:
+        return data
+    if '@graph' in data:
+        return _find_product_node(data['@graph'])
+    return None
+
+def _first(value: Any) -> Any:
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+def _price_specifications(spec: Any) -> Tuple[Any, Any]:
+    """Separa (preço de venda, preço de lista) de um priceSpecification (objeto ou lista)"""
+    sale_price = list_price = None
+    for entry in spec if isinstance(spec, list) else [spec]:
+        if not isinstance(entry, dict) or entry.get('price') is None:
+            continue
+        price_type = str(entry.get('priceType') or '')
+        if any(marker in price_type for marker in LIST_PRICE_TYPES):
+            if list_price is None:
+                list_price = entry['price']
+        elif sale_price is None:
+            sale_price = entry['price']
+    return sale_price, list_price
+
+def _from_json_ld(product: Dict[str, Any]) -> Dict[str, Any]:
+    result = {}
+
+    name = product.get('name')
+    if isinstance(name, str) and name.strip():
+        result['titulo'] = name.strip()
+
+    image = _first(product.get('image'))
+    if isinstance(image, dict):
+        image = image.get('url') or image.get('contentUrl')
+    if isinstance(image, str) and image.startswith('http'):
+        result['imagem'] = image
+
+    offer = _first(product.get('offers'))
+    if isinstance(offer, dict):
+        sale_price, list_price = _price_specifications(offer.get('priceSpecification'))
+        price = offer.get('price') or offer.get('lowPrice')
+        if price is None:
+            price = sale_price
+        formatted = format_price_brl(price)
+        if formatted:
+            result['preco_atual'] = formatted
+
+        # Só um preço de lista explícito vale como original (highPrice é só a maior oferta)
+        original = format_price_brl(list_price)
+        if original and original != result.get('preco_atual'):
+            result['preco_original'] = original
+
+        seller = offer.get('seller')
+        if isinstance(seller, dict) and isinstance(seller.get('name'), str):
+            result['loja'] = seller['name'].strip()
+
+    return result
+
+def _extract_preloaded_state(html: str) -> Optional[Any]:
+    """Decodifica o JSON que segue o marcador __PRELOADED_STATE__ (script atribuído ou type=application/json)"""
+    index = html.find(PRELOADED_STATE_MARKER)
+    if index == -1:
+        return None
+    start = html.find('{', index)
+    if start == -1:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(html, start)
+        return data
+    except (json.JSONDecodeError, ValueError):
+        return None
+
+def _node_item_id(node: Dict[str, Any]) -> Optional[str]:
+    """Id de anúncio (MLB...) declarado pelo próprio nó, normalizado"""
+    for key in ('item_id', 'id'):
+        value = node.get(key)
+        if isinstance(value, str) and ML_ITEM_ID_PATTERN.match(value):
+            return value.upper().replace('-', '')
+    return None
+
+def _from_preloaded_state(state: Any, item_id: Optional[str] = None,
+                          known_price: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Busca preço atual/original e vendedor no estado pré-carregado (percurso limitado).
+
+    O estado traz também anúncios relacionados, de outros vendedores etc.:
+    um bloco de preço só vale se pertencer ao item principal (nó dono com o
+    mesmo item_id) ou se o valor atual bater com known_price (preço já
+    lido do JSON-LD). O vendedor só vale se for do mesmo dono do preço.
+    """
+    if item_id:
+        item_id = item_id.upper().replace('-', '')
+    prices: List[Tuple[Optional[str], str, Any]] = []
+    sellers: Dict[str, str] = {}
+    stack: List[Tuple[Any, Optional[str]]] = [(state, None)]
+    visited = 0
+
+    while stack and visited < MAX_STATE_NODES:
+        node, owner = stack.pop()
+        visited += 1
+        if isinstance(node, dict):
+            owner = _node_item_id(node) or owner
+            # Bloco de preço: {"value": 1299, "original_value": 1599, "currency_id": "BRL"}
+            if 'value' in node and 'original_value' in node:
+                current = format_price_brl(node.get('value'))
+                if current:
+                    prices.append((owner, current, node.get('original_value')))
+
+            seller = node.get('seller') or node.get('seller_info')
+            if owner and owner not in sellers and isinstance(seller, dict):
+                seller_name = seller.get('title') or seller.get('nickname') or seller.get('name')
+                if isinstance(seller_name, str) and seller_name.strip():
+                    sellers[owner] = seller_name.strip()
+
+            stack.extend((value, owner) for value in node.values() if isinstance(value, (dict, list)))
+        elif isinstance(node, list):
+            stack.extend((value, owner) for value in node if isinstance(value, (dict, list)))
+
+    match = None
+    if item_id:
+        match = next((price for price in prices if price[0] == item_id), None)
+    if match is None and known_price:
+        match = next((price for price in prices if price[1] == known_price), None)
+
+    result = {}
+    if match is not None:
+        owner, current, original_value = match
+        result['preco_atual'] = current
+        original = format_price_brl(original_value)
+        # Preço divergente do JSON-LD: o original seria de outra oferta
+        if original and original != current and known_price in (None, current):
+            result['preco_original'] = original
+        if owner and (item_id is None or owner == item_id) and owner in sellers:
+            result['loja'] = sellers[owner]
+    elif item_id and item_id in sellers:
+        result['loja'] = sellers[item_id]
+    return result
+
+def extract_structured_product(html: str, item_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extrai titulo, preco_atual, preco_original, imagem e loja dos blocos
+    JSON-LD e __PRELOADED_STATE__ do HTML, sem montar o DOM.
+    item_id (ex: MLB123) identifica o anúncio principal no estado pré-carregado.
+    Retorna apenas os campos encontrados.
+    """
+    if not html:
+        return {}
+
+    result: Dict[str, Any] = {}
+    for block in _iter_json_ld(html):
+        product = _find_product_node(block)
+        if product:
+            result = _from_json_ld(product)
+            break
+
+    # Estado pré-carregado complementa o JSON-LD (ex: preço original e vendedor no ML)
+    if 'preco_original' not in result or 'loja' not in result or 'preco_atual' not in result:
+        state = _extract_preloaded_state(html)
+        if state is not None:
+            for field, value in _from_preloaded_state(state, item_id, result.get('preco_atual')).items():
+                result.setdefault(field, value)
+
+    return result
+
+def has_required_fields(data: Dict[str, Any]) -> bool:
+    """Indica se os dados estruturados bastam para dispensar o parse do DOM"""
+    return all(data.get(field) for field in REQUIRED_FIELDS)
@@ -0,0 +1,202 @@
+# /app/task_journal.py
+"""
+Journal persistente (SQLite WAL) das tarefas da fila de scraping
+"""
+
+import os
+import json
+import queue
+import atexit
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class TaskJournal:
+    """Registra as transições de status das tarefas em um arquivo SQLite
+
+    Cada transição grava o estado completo da tarefa (upsert por ID). As
+    gravações vão para uma fila em memória e uma thread dedicada as aplica
+    em lotes, numa única transação a cada flush_interval segundos (ou
+    batch_size registros), para não colocar o fsync no caminho dos workers.
+    """
+
+    ACTIVE_STATUSES = ('pending', 'processing', 'retrying')
+
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._pending: "queue.Queue[tuple]" = queue.Queue()
+        self._flushed = threading.Condition()
+        self._written_seq = 0
+        self._enqueued_seq = 0
+        self._seq_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.stats = {
+            'records': 0,
+            'batches': 0,
+            'errors': 0
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name='task-journal')
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Retorna a conexão da thread atual (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._get_connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            ' id TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' data TEXT NOT NULL,'
+            ' updated_at REAL NOT NULL'
+            ')'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status)')
+
+    def record(self, task_data: Dict[str, Any]):
+        """Enfileira o estado atual de uma tarefa para gravação (não bloqueia)"""
+        try:
+            data = json.dumps(task_data, ensure_ascii=False, default=str)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Tarefa {task_data.get('id')} não serializável para o journal: {e}")
+            return
+
+        with self._seq_lock:
+            self._enqueued_seq += 1
+            seq = self._enqueued_seq
+        self._pending.put((seq, 'upsert', task_data['id'], task_data['status'], data))
+
+    def remove(self, task_ids: List[str]):
+        """Enfileira a remoção de tarefas do journal"""
+        for task_id in task_ids:
+            with self._seq_lock:
+                self._enqueued_seq += 1
+                seq = self._enqueued_seq
+            self._pending.put((seq, 'delete', task_id, None, None))
+
+    def _write_loop(self):
+        while True:
+            try:
+                batch = [self._pending.get()]
+            except Exception:
+                continue
+
+            # Acumular o que chegar durante a janela do lote
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[tuple]):
+        # Várias transições da mesma tarefa no lote: só a última importa
+        latest: Dict[str, tuple] = {}
+        for item in batch:
+            latest[item[2]] = item
+
+        upserts = [(task_id, status, data, time.time())
+                   for _, op, task_id, status, data in latest.values() if op == 'upsert']
+        deletes = [(task_id,) for _, op, task_id, _, _ in latest.values() if op == 'delete']
+
+        conn = self._get_connection()
+        try:
+            conn.execute('BEGIN')
+            if upserts:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO tasks (id, status, data, updated_at) VALUES (?, ?, ?, ?)',
+                    upserts
+                )
+            if deletes:
+                conn.executemany('DELETE FROM tasks WHERE id = ?', deletes)
+            conn.execute('COMMIT')
+            with self.lock:
+                self.stats['records'] += len(batch)
+                self.stats['batches'] += 1
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao gravar journal da fila: {e}")
+            try:
+                conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            with self.lock:
+                self.stats['errors'] += 1
+
+        with self._flushed:
+            self._written_seq = max(self._written_seq, max(item[0] for item in batch))
+            self._flushed.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Aguarda a gravação de tudo que já foi enfileirado"""
+        with self._seq_lock:
+            target = self._enqueued_seq
+        with self._flushed:
+            return self._flushed.wait_for(lambda: self._written_seq >= target, timeout)
+
+    def load_active(self) -> List[Dict[str, Any]]:
+        """Retorna as tarefas que não chegaram a um estado final"""
+        placeholders = ','.join('?' for _ in self.ACTIVE_STATUSES)
+        try:
+            rows = self._get_connection().execute(
+                f'SELECT data FROM tasks WHERE status IN ({placeholders}) ORDER BY updated_at',
+                self.ACTIVE_STATUSES
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao ler journal da fila: {e}")
+            return []
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Busca uma tarefa no journal (ex: concluída antes do último restart)"""
+        try:
+            row = self._get_connection().execute(
+                'SELECT data FROM tasks WHERE id = ?', (task_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao ler journal da fila: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do journal"""
+        try:
+            file_size = os.path.getsize(self.path)
+        except OSError:
+            file_size = 0
+
+        with self.lock:
+            stats = self.stats.copy()
+
+        return {
+            'path': self.path,
+            'file_size_mb': round(file_size / 1024 / 1024, 2),
+            'backlog': self._pending.qsize(),
+            **stats
+        }
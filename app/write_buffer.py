@@ -0,0 +1,441 @@
+# /app/write_buffer.py
+"""
+Buffer write-behind para inserções no Supabase
+
+As linhas são confirmadas ao chamador assim que entram no buffer e são
+gravadas em lote (insert em massa) por uma thread própria, quando o lote
+enche ou a janela de tempo termina. Cada linha também vai para um arquivo
+local (JSONL, só acréscimos) antes da confirmação: se o processo cair, as
+linhas não gravadas são reenviadas na próxima inicialização.
+"""
+
+import os
+import glob
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+def _try_lock(lock_file) -> bool:
+    """Lock exclusivo sem espera no arquivo (liberado quando o processo termina)"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(lock_file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+    lock_file.close()
+
+class WriteBehindBuffer:
+    """Agrupa linhas em inserts em massa por tamanho ou janela de tempo
+
+    O arquivo de spill funciona como log: cada linha é gravada como
+    {"id", "row"} e, após um insert bem-sucedido, um {"ack": [ids]} marca as
+    linhas gravadas (o arquivo é truncado quando o buffer esvazia). Ao
+    iniciar, o log é relido e as linhas sem ack voltam ao buffer.
+
+    Cada processo usa um spill próprio: o caminho configurado ou, se outro
+    processo vivo já o ocupa, <nome>.1, <nome>.2... (lock exclusivo em
+    <spill>.lock enquanto o buffer existir). Spills de processos que
+    morreram (lock livre) são adotados na inicialização.
+
+    Com id_field, o id da linha no buffer (uuid) também vai na própria
+    linha, como chave de idempotência: um lote retentado depois de um
+    timeout que já tinha sido gravado não duplica linhas se o writer fizer
+    upsert por essa coluna.
+
+    A memória é limitada por max_pending: com o buffer cheio, enqueue()
+    aguarda até enqueue_timeout e retorna False se não houver espaço, para
+    o chamador gravar diretamente. Um lote que falha é retentado com
+    backoff (limitado a retry_max_delay) enquanto o spill guarda as linhas,
+    sem limite de tentativas: uma queda longa do banco só atrasa a gravação.
+
+    Só linhas recusadas pelo servidor (is_rejection(erro) True, ex: dado
+    inválido) vão para o arquivo <spill>.failed.jsonl. Quando o lote é
+    recusado, ou após max_attempts falhas seguidas, as linhas são gravadas
+    uma a uma para isolar as recusadas; um erro de outro tipo (rede etc.)
+    interrompe essa rodada e o restante volta ao buffer.
+    """
+
+    def __init__(self, name: str, writer: Callable[[List[Dict[str, Any]]], Any],
+                 batch_size: int = 50, flush_interval: float = 1.0, max_pending: int = 5000,
+                 spill_path: Optional[str] = None, enqueue_timeout: float = 5.0,
+                 max_attempts: int = 5, retry_max_delay: float = 60.0, id_field: Optional[str] = None,
+                 is_rejection: Optional[Callable[[Exception], bool]] = None):
+        self.name = name
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_path = spill_path
+        self.enqueue_timeout = enqueue_timeout
+        self.max_attempts = max_attempts
+        self.retry_max_delay = retry_max_delay
+        self.id_field = id_field
+        self.is_rejection = is_rejection or (lambda error: False)
+
+        self.pending: deque = deque()  # (id, linha, instante em que entrou)
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.space_available = threading.Condition(self.lock)
+        self.flushing = 0  # Linhas retiradas do buffer e ainda em gravação
+        self.flush_requested = False  # flush() pede gravação imediata, sem esperar a janela
+        self.closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._spill_file = None
+        self._lock_file = None
+        self.stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'written_rows': 0,
+            'batches': 0,
+            'errors': 0,
+            'dead_letter_rows': 0,
+            'recovered_rows': 0,
+            'adopted_rows': 0,
+            'max_batch_size': 0,
+            'total_flush_time': 0.0,
+            'max_flush_time': 0.0,
+            'last_flush_time': 0.0,
+            'total_row_latency': 0.0,
+            'max_row_latency': 0.0
+        }
+
+        if self.spill_path:
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            base_path = self.spill_path
+            self.spill_path = self._acquire_spill_slot(base_path)
+            self._recover_spill()
+            self._adopt_orphan_spills(base_path)
+            self._spill_file = open(self.spill_path, 'a', encoding='utf-8')
+
+        atexit.register(self.close)
+        if self.pending:
+            self._ensure_thread()
+
+    @staticmethod
+    def _slot_path(base_path: str, slot: int) -> str:
+        if slot == 0:
+            return base_path
+        root, ext = os.path.splitext(base_path)
+        return f"{root}.{slot}{ext}"
+
+    def _acquire_spill_slot(self, base_path: str) -> str:
+        """Reserva um spill livre para este processo (lock mantido até close)"""
+        slot = 0
+        while True:
+            path = self._slot_path(base_path, slot)
+            lock_file = open(f"{path}.lock", 'a+')
+            if _try_lock(lock_file):
+                self._lock_file = lock_file
+                return path
+            lock_file.close()
+            slot += 1
+
+    def _adopt_orphan_spills(self, base_path: str):
+        """Assume as linhas pendentes de spills sem dono (processo que morreu)"""
+        root, ext = os.path.splitext(base_path)
+        candidates = {base_path, *glob.glob(f"{glob.escape(root)}.*{ext}")}
+        for path in sorted(candidates):
+            if path == self.spill_path or path.endswith(('.tmp', '.failed.jsonl')) or not os.path.exists(path):
+                continue
+            lock_file = open(f"{path}.lock", 'a+')
+            if not _try_lock(lock_file):
+                lock_file.close()  # Outro processo vivo é o dono
+                continue
+            try:
+                rows = self._read_spill(path)
+                now = time.time()
+                for row_id, row in rows.items():
+                    self.pending.append((row_id, row, now))
+                self.stats['adopted_rows'] += len(rows)
+                # As linhas já estão no spill deste buffer (reescrito a seguir)
+                self._rewrite_spill()
+                os.remove(path)
+                if rows:
+                    logger.info(f"Buffer {self.name}: {len(rows)} linhas adotadas de {path}")
+            except OSError as e:
+                logger.error(f"Erro ao adotar spill {path} do buffer {self.name}: {e}")
+            finally:
+                _unlock(lock_file)
+
+    def _read_spill(self, path: str) -> Dict[str, Dict[str, Any]]:
+        """Linhas do spill que ainda não têm ack"""
+        rows: Dict[str, Dict[str, Any]] = {}
+        with open(path, 'r', encoding='utf-8') as spill:
+            for line in spill:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Linha parcial de uma queda no meio da escrita
+                if 'ack' in entry:
+                    for row_id in entry['ack']:
+                        rows.pop(row_id, None)
+                else:
+                    rows[entry['id']] = entry['row']
+        return rows
+
+    def _recover_spill(self):
+        """Recarrega as linhas que não foram confirmadas antes do último encerramento"""
+        if not os.path.exists(self.spill_path):
+            return
+        try:
+            rows = self._read_spill(self.spill_path)
+        except OSError as e:
+            logger.error(f"Erro ao ler spill do buffer {self.name}: {e}")
+            return
+
+        now = time.time()
+        for row_id, row in rows.items():
+            self.pending.append((row_id, row, now))
+        self.stats['recovered_rows'] = len(rows)
+        # Reescrever só com o que falta gravar
+        self._rewrite_spill()
+        if rows:
+            logger.info(f"Buffer {self.name}: {len(rows)} linhas recuperadas do spill")
+
+    def _rewrite_spill(self):
+        """Regrava o spill apenas com as linhas pendentes (deve ser chamada com lock ou na inicialização)"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+        tmp_path = f"{self.spill_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as spill:
+            for row_id, row, _ in self.pending:
+                spill.write(json.dumps({'id': row_id, 'row': row}, ensure_ascii=False, default=str) + '\n')
+        os.replace(tmp_path, self.spill_path)
+        if self._spill_file is not None:
+            self._spill_file = open(self.spill_path, 'a', encoding='utf-8')
+
+    def _append_spill(self, entry: Dict[str, Any]):
+        """Acrescenta ao spill (deve ser chamada com lock)"""
+        if self._spill_file is None:
+            return
+        self._spill_file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        self._spill_file.flush()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True, name=f'write-buffer-{self.name}')
+            self._thread.start()
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """Coloca a linha no buffer; True = aceita (gravação garantida em background)"""
+        row_id = str(uuid.uuid4())
+        if self.id_field:
+            row = {**row, self.id_field: row_id}
+        with self.lock:
+            if self.closed:
+                return False
+            if not self.space_available.wait_for(lambda: len(self.pending) < self.max_pending,
+                                                 self.enqueue_timeout):
+                self.stats['rejected'] += 1
+                return False
+            self._append_spill({'id': row_id, 'row': row})
+            self.pending.append((row_id, row, time.time()))
+            self.stats['enqueued'] += 1
+            # Primeira linha abre a janela de tempo; lote cheio é gravado na hora
+            if len(self.pending) == 1 or len(self.pending) >= self.batch_size:
+                self.condition.notify()
+            self._ensure_thread()
+        return True
+
+    def _flush_loop(self):
+        attempts = 0
+        while True:
+            with self.condition:
+                # Esperar o lote encher ou a linha mais antiga completar a janela de tempo
+                while not self.closed:
+                    if len(self.pending) >= self.batch_size or (self.pending and self.flush_requested):
+                        break
+                    if self.pending:
+                        remaining = self.pending[0][2] + self.flush_interval - time.time()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    else:
+                        self.condition.wait()
+                if not self.pending:
+                    self.flush_requested = False
+                    if self.closed:
+                        return
+                    continue
+                batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+                self.flushing += len(batch)
+
+            retry = self._write_batch(batch, attempts)
+            if not retry:
+                attempts = 0
+                continue
+
+            # Falha: devolver o que faltou ao início do buffer e aguardar o backoff
+            attempts += 1
+            with self.condition:
+                self.pending.extendleft(reversed(retry))
+                self.flushing -= len(retry)
+                deadline = time.time() + min(self.retry_max_delay, 2 ** attempts)
+                while not self.closed and time.time() < deadline:
+                    self.condition.wait(deadline - time.time())
+                if self.closed:
+                    return
+
+    def _write_batch(self, batch: List[tuple], attempts: int) -> List[tuple]:
+        """Grava o lote; retorna as linhas que devem ser retentadas (vazio = concluído)"""
+        rows = [row for _, row, _ in batch]
+        start = time.time()
+        try:
+            if attempts >= self.max_attempts:
+                written, rejected, retry = self._write_individually(batch)
+            else:
+                self.writer(rows)
+                written, rejected, retry = batch, [], []
+        except Exception as e:
+            logger.error(f"Erro ao gravar lote de {len(rows)} linhas do buffer {self.name} (tentativa {attempts + 1}): {e}")
+            with self.lock:
+                self.stats['errors'] += 1
+            if not self.is_rejection(e):
+                return batch
+            # Lote recusado pelo servidor: repetir não adianta, isolar as linhas recusadas
+            written, rejected, retry = self._write_individually(batch)
+
+        done = written + rejected
+        elapsed = time.time() - start
+        with self.lock:
+            self.flushing -= len(done)
+            if written:
+                self.stats['batches'] += 1
+                self.stats['written_rows'] += len(written)
+                self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(written))
+                self.stats['total_flush_time'] += elapsed
+                self.stats['max_flush_time'] = max(self.stats['max_flush_time'], elapsed)
+                self.stats['last_flush_time'] = elapsed
+            for _, _, enqueued_at in written:
+                latency = time.time() - enqueued_at
+                self.stats['total_row_latency'] += latency
+                self.stats['max_row_latency'] = max(self.stats['max_row_latency'], latency)
+
+            # Confirmar no spill (gravadas e recusadas); sem nada pendente, o arquivo recomeça vazio
+            if self._spill_file is not None and done:
+                if not self.pending and not self.flushing and not retry:
+                    self._rewrite_spill()
+                else:
+                    self._append_spill({'ack': [row_id for row_id, _, _ in done]})
+            self.space_available.notify_all()
+        return retry
+
+    def _write_individually(self, batch: List[tuple]) -> Tuple[List[tuple], List[tuple], List[tuple]]:
+        """
+        Grava as linhas uma a uma para isolar as recusadas pelo servidor.
+        Retorna (gravadas, recusadas, a retentar); um erro que não é recusa
+        (rede etc.) interrompe e devolve o restante para retentar.
+        """
+        written, rejected = [], []
+        for index, item in enumerate(batch):
+            row_id, row, _ = item
+            try:
+                self.writer([row])
+            except Exception as e:
+                if not self.is_rejection(e):
+                    with self.lock:
+                        self.stats['errors'] += 1
+                    logger.error(f"Erro ao gravar linha {row_id} do buffer {self.name}; "
+                                 f"{len(batch) - index} linhas voltam ao buffer: {e}")
+                    return written, rejected, batch[index:]
+                logger.error(f"Linha {row_id} do buffer {self.name} recusada, enviada ao arquivo de falhas: {e}")
+                self._dead_letter(row_id, row, str(e))
+                rejected.append(item)
+                continue
+            written.append(item)
+        return written, rejected, []
+
+    def _dead_letter(self, row_id: str, row: Dict[str, Any], error: str):
+        with self.lock:
+            self.stats['dead_letter_rows'] += 1
+        if not self.spill_path:
+            return
+        try:
+            with open(f"{self.spill_path}.failed.jsonl", 'a', encoding='utf-8') as failed:
+                failed.write(json.dumps({'id': row_id, 'row': row, 'error': error}, ensure_ascii=False, default=str) + '\n')
+        except OSError as e:
+            logger.error(f"Erro ao gravar linha com falha do buffer {self.name}: {e}")
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Aguarda a gravação de tudo que está no buffer"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.pending or self.flushing:
+                # Antecipar a janela: gravar já o que estiver pendente
+                self.flush_requested = True
+                self.condition.notify_all()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.space_available.wait(min(remaining, 0.1))
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Grava o que falta e encerra (chamado também no encerramento do processo)"""
+        if self.closed:
+            return
+        flushed = self.flush(timeout) if self._thread is not None else not self.pending
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+            if self._lock_file is not None:
+                _unlock(self._lock_file)
+                self._lock_file = None
+        if not flushed:
+            logger.warning(f"Buffer {self.name} encerrado com linhas pendentes; serão reenviadas do spill na próxima inicialização")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = self.stats.copy()
+            pending = len(self.pending)
+            flushing = self.flushing
+        batches = stats.pop('batches')
+        total_flush_time = stats.pop('total_flush_time')
+        total_row_latency = stats.pop('total_row_latency')
+        return {
+            'name': self.name,
+            'pending': pending,
+            'flushing': flushing,
+            'max_pending': self.max_pending,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'batches': batches,
+            'avg_batch_size': round(stats['written_rows'] / batches, 2) if batches else 0,
+            'avg_flush_ms': round(total_flush_time / batches * 1000, 2) if batches else 0,
+            'max_flush_ms': round(stats.pop('max_flush_time') * 1000, 2),
+            'last_flush_ms': round(stats.pop('last_flush_time') * 1000, 2),
+            'avg_row_latency_ms': round(total_row_latency / stats['written_rows'] * 1000, 2) if stats['written_rows'] else 0,
+            'max_row_latency_ms': round(stats.pop('max_row_latency') * 1000, 2),
+            **stats
+        }
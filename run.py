@@ -4,16 +4,19 @@ import os
 import sys
 from app import create_app
 
-print("Starting Mercado Livre Scraper...", file=sys.stderr)
+if __name__ == '__main__':
+    # A criação do app fica dentro do guard: os processos do pool de parsing
+    # (spawn/forkserver) reimportam este arquivo como __mp_main__ e não podem
+    # iniciar outro scheduler, fila, espelho ou buffer de gravação
+    print("Starting Mercado Livre Scraper...", file=sys.stderr)
 
-try:
-    app = create_app()
-    print("Flask app created successfully!", file=sys.stderr)
-except Exception as e:
-    print(f"Error creating Flask app: {e}", file=sys.stderr)
-    sys.exit(1)
+    try:
+        app = create_app()
+        print("Flask app created successfully!", file=sys.stderr)
+    except Exception as e:
+        print(f"Error creating Flask app: {e}", file=sys.stderr)
+        sys.exit(1)
 
-if __name__ == '__main__':
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     port = int(os.getenv('PORT', 5000))
     
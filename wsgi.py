@@ -0,0 +1,10 @@
+# /mercado_livre_scraper/wsgi.py
+"""
+Ponto de entrada WSGI (gunicorn wsgi:app, flask --app wsgi).
+
+O run.py só cria o app dentro do guard de __main__, porque os processos do
+pool de parsing o reimportam; servidores WSGI importam o app daqui.
+"""
+from app import create_app
+
+app = create_app()